@@ -0,0 +1,340 @@
+"""On-disk storage for uploaded files.
+
+Blobs are written in fixed-size chunks to a temporary file while their
+SHA-256 is computed, then moved to a path derived from the digest, so
+identical uploads are stored once.
+
+Compressible blobs are stored compressed. The first SAMPLE_SIZE bytes of
+each upload are test-compressed, and the blob is written through zstd
+(when the zstandard package is installed) or gzip only if that sample
+shrinks by at least MIN_SAVING. The digest always covers the original
+bytes, and the encoding is recorded as the file suffix.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; gzip is always available
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+SAMPLE_SIZE = 256 * 1024
+MIN_SAVING = 0.1
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# A deletion claimed longer ago than this is assumed to have been abandoned
+# by a process that died, and writers waiting on it take over
+DELETE_TIMEOUT = timedelta(seconds=30)
+DELETE_POLL_INTERVAL = 0.05
+
+# Stored encoding -> file suffix
+SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+async def iter_file(path: Path, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield a file's contents in chunks without blocking the event loop."""
+    handle = await run_in_threadpool(open, path, "rb")
+    try:
+        while True:
+            chunk = await run_in_threadpool(handle.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        handle.close()
+
+
+async def write_file(path: Path, chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None) -> int:
+    """Atomically write `chunks` to `path`, returning the number of bytes written."""
+    size = 0
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    handle = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise BlobTooLarge(max_bytes)
+            await run_in_threadpool(handle.write, chunk)
+        await run_in_threadpool(handle.close)
+        os.replace(tmp_path, path)
+    except BaseException:
+        handle.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return size
+
+
+def compressor(encoding: str):
+    """Return an object with compress(data) and flush() for `encoding`."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def decompressor(encoding: str):
+    """Return an object with decompress(data) for `encoding`."""
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def choose_encoding(sample: bytes, compress: bool = True) -> Optional[str]:
+    """Pick a storage encoding for a blob from a sample of its first bytes."""
+    if not compress or len(sample) < 4096:
+        return None
+    encoding = "zstd" if zstandard is not None else "gzip"
+    engine = compressor(encoding)
+    compressed = len(engine.compress(sample)) + len(engine.flush())
+    return encoding if compressed <= len(sample) * (1 - MIN_SAVING) else None
+
+
+class BlobTooLarge(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class StoredBlob:
+    sha256: str
+    size: int
+    encoding: Optional[str] = None
+    stored_size: Optional[int] = None
+
+
+@dataclass
+class BlobLocation:
+    path: Path
+    encoding: Optional[str]
+    stored_size: int
+
+
+class BlobStore:
+    """Content-addressed files with reference counts kept in `refs`.
+
+    `refs` is a MongoDB collection holding one document per blob
+    ({_id: sha256, size, stored_size, encoding, refcount}). Identical
+    uploads share one file, and the file is deleted when its last
+    reference is released.
+
+    Several processes share the store, so add and release coordinate
+    through `refs`. A releaser deletes a file only after atomically marking
+    its document `deleting`. It removes the document only if the refcount
+    is still zero after the unlink, and otherwise clears the mark. A writer
+    takes its reference first and waits out any deletion in progress. It
+    keeps its own copy until it has checked that the file still exists.
+    """
+
+    def __init__(self, root: Path, refs, compress: bool = True):
+        self.root = Path(root)
+        self.refs = refs
+        self.compress = compress
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, sha256: str, encoding: Optional[str] = None) -> Path:
+        return self.root / sha256[:2] / f"{sha256}{SUFFIXES[encoding]}"
+
+    def locate(self, sha256: str) -> Optional[BlobLocation]:
+        """Find the stored file for a digest, whichever encoding it was written with."""
+        for encoding in SUFFIXES:
+            path = self.path(sha256, encoding)
+            try:
+                stored_size = path.stat().st_size
+            except FileNotFoundError:
+                continue
+            return BlobLocation(path=path, encoding=encoding, stored_size=stored_size)
+        return None
+
+    def exists(self, sha256: str) -> bool:
+        return self.locate(sha256) is not None
+
+    async def write(self, chunks: AsyncIterator[bytes], max_bytes: Optional[int] = None) -> StoredBlob:
+        """Stream `chunks` into the store and take a reference to the result.
+
+        `max_bytes` applies to the original bytes and is enforced as chunks
+        arrive.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        stored_size = 0
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        handle = await run_in_threadpool(open, tmp_path, "wb")
+        # The start of the blob is held back until the encoding is decided
+        sample = []
+        sample_size = 0
+        encoding = None
+        engine = None
+
+        async def emit(data: bytes):
+            nonlocal stored_size
+            if engine is not None:
+                data = await run_in_threadpool(engine.compress, data)
+            stored_size += len(data)
+            await run_in_threadpool(handle.write, data)
+
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise BlobTooLarge(max_bytes)
+                digest.update(chunk)
+                if sample is None:
+                    await emit(chunk)
+                    continue
+                sample.append(chunk)
+                sample_size += len(chunk)
+                if sample_size >= SAMPLE_SIZE:
+                    head = b"".join(sample)
+                    sample = None
+                    encoding, engine = await self._choose_engine(head)
+                    await emit(head)
+            if sample is not None:
+                head = b"".join(sample)
+                encoding, engine = await self._choose_engine(head)
+                await emit(head)
+            if engine is not None:
+                tail = engine.flush()
+                stored_size += len(tail)
+                await run_in_threadpool(handle.write, tail)
+            await run_in_threadpool(handle.close)
+
+            blob = StoredBlob(sha256=digest.hexdigest(), size=size, encoding=encoding, stored_size=stored_size)
+            # The reference is taken before looking at the disk, so a
+            # concurrent release cannot delete the file after we find it
+            ref = await self.refs.find_one_and_update(
+                {"_id": blob.sha256},
+                {
+                    "$inc": {"refcount": 1},
+                    "$setOnInsert": {
+                        "size": size,
+                        "encoding": encoding,
+                        "stored_size": stored_size,
+                        "created_at": datetime.utcnow()
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            if ref.get("deleting"):
+                await self._wait_for_deletion(blob.sha256)
+            existing = self.locate(blob.sha256)
+            if existing is not None:
+                tmp_path.unlink()
+                blob.encoding = existing.encoding
+                blob.stored_size = existing.stored_size
+            else:
+                final_path = self.path(blob.sha256, encoding)
+                final_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, final_path)
+            if (ref.get("encoding"), ref.get("stored_size")) != (blob.encoding, blob.stored_size):
+                await self.refs.update_one(
+                    {"_id": blob.sha256},
+                    {"$set": {"encoding": blob.encoding, "stored_size": blob.stored_size}}
+                )
+        except BaseException:
+            handle.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return blob
+
+    async def _wait_for_deletion(self, sha256: str):
+        """Wait until no deletion of `sha256` is in progress."""
+        while True:
+            ref = await self.refs.find_one({"_id": sha256}, {"deleting": 1, "deleting_at": 1})
+            if ref is None or not ref.get("deleting"):
+                return
+            if ref["deleting_at"] < datetime.utcnow() - DELETE_TIMEOUT:
+                await self.refs.update_one(
+                    {"_id": sha256, "deleting_at": ref["deleting_at"]},
+                    {"$unset": {"deleting": "", "deleting_at": ""}}
+                )
+                return
+            await asyncio.sleep(DELETE_POLL_INTERVAL)
+
+    async def _choose_engine(self, head: bytes):
+        encoding = await run_in_threadpool(choose_encoding, head[:SAMPLE_SIZE], self.compress)
+        return encoding, (compressor(encoding) if encoding else None)
+
+    async def write_upload(self, upload, max_bytes: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> StoredBlob:
+        if max_bytes is not None and upload.size is not None and upload.size > max_bytes:
+            raise BlobTooLarge(max_bytes)
+
+        async def chunks():
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+        return await self.write(chunks(), max_bytes=max_bytes)
+
+    async def read(self, sha256: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Yield the original bytes of a blob, decompressing in chunks if needed."""
+        location = self.locate(sha256)
+        if location is None:
+            raise FileNotFoundError(sha256)
+        engine = decompressor(location.encoding) if location.encoding else None
+        async for chunk in iter_file(location.path, chunk_size):
+            if engine is not None:
+                chunk = await run_in_threadpool(engine.decompress, chunk)
+            if chunk:
+                yield chunk
+
+    async def release(self, sha256: Optional[str]):
+        """Drop one reference, deleting the blob when none remain."""
+        if not sha256:
+            return
+        ref = await self.refs.find_one_and_update(
+            {"_id": sha256},
+            {"$inc": {"refcount": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if ref is None or ref["refcount"] > 0:
+            return
+        # Only the process whose claim succeeds touches the file
+        claimed = await self.refs.update_one(
+            {"_id": sha256, "refcount": {"$lte": 0}, "deleting": {"$ne": True}},
+            {"$set": {"deleting": True, "deleting_at": datetime.utcnow()}}
+        )
+        if not claimed.modified_count:
+            return
+        for encoding in SUFFIXES:
+            self.path(sha256, encoding).unlink(missing_ok=True)
+        deleted = await self.refs.delete_one({"_id": sha256, "refcount": {"$lte": 0}, "deleting": True})
+        if not deleted.deleted_count:
+            # A writer took a reference meanwhile and restores the file once this mark is gone
+            await self.refs.update_one({"_id": sha256}, {"$unset": {"deleting": "", "deleting_at": ""}})
+
+    async def stats(self) -> dict:
+        """Physical vs logical bytes across all referenced blobs."""
+        totals = await self.refs.aggregate([
+            {"$group": {
+                "_id": None,
+                "blobs": {"$sum": 1},
+                "references": {"$sum": "$refcount"},
+                "original_bytes": {"$sum": "$size"},
+                "stored_bytes": {"$sum": {"$ifNull": ["$stored_size", "$size"]}},
+                "logical_bytes": {"$sum": {"$multiply": ["$size", "$refcount"]}},
+                "compressed_blobs": {"$sum": {"$cond": [{"$ifNull": ["$encoding", False]}, 1, 0]}}
+            }}
+        ]).to_list(1)
+        result = totals[0] if totals else {
+            "blobs": 0, "references": 0, "original_bytes": 0,
+            "stored_bytes": 0, "logical_bytes": 0, "compressed_blobs": 0
+        }
+        result.pop("_id", None)
+        result["dedup_saved_bytes"] = result["logical_bytes"] - result["original_bytes"]
+        result["compression_saved_bytes"] = result["original_bytes"] - result["stored_bytes"]
+        return result
@@ -0,0 +1,176 @@
+"""In-process caches for serialized API responses and request coalescing."""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from metrics import REGISTRY
+
+cache_requests = REGISTRY.counter("cache_requests_total", "Cache lookups by result", ["cache", "result"])
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    expires_at: float
+    version: int
+    etag: str = field(init=False)
+
+    def __post_init__(self):
+        self.etag = '"%s"' % hashlib.blake2b(self.body, digest_size=16).hexdigest()
+
+    @property
+    def ttl_remaining(self) -> int:
+        return max(0, int(self.expires_at - time.monotonic()))
+
+
+class ResponseCache:
+    """Response bodies keyed by name, dropped on expiry or invalidation.
+
+    Every key carries a version that `invalidate` bumps, so a fill that
+    started before an invalidation is never stored over fresher data.
+    `guard`, when set, must return True for cached entries to be served.
+    """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.guard: Optional[Callable[[], bool]] = None
+        self._entries: Dict[str, CachedResponse] = {}
+        self._versions: Dict[str, int] = {}
+
+    def version(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if self.guard is not None and not self.guard():
+            entry = None
+        if entry is not None and entry.expires_at > time.monotonic() and entry.version == self.version(key):
+            cache_requests.inc(cache=self.name, result="hit")
+            return entry
+        cache_requests.inc(cache=self.name, result="miss")
+        return None
+
+    def set(self, key: str, body: bytes, ttl: Optional[float] = None, version: Optional[int] = None) -> CachedResponse:
+        current = self.version(key)
+        entry = CachedResponse(
+            body=body,
+            expires_at=time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl)),
+            version=current if version is None else version
+        )
+        if entry.version == current:
+            self._entries[key] = entry
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+    def invalidate(self, key: str, version: Optional[int] = None) -> bool:
+        """Drop `key`. With an explicit version, events older than the current one are ignored."""
+        current = self.version(key)
+        if version is not None and version <= current:
+            return False
+        self._versions[key] = current + 1 if version is None else version
+        self._entries.pop(key, None)
+        return True
+
+
+singleflight_calls = REGISTRY.counter(
+    "singleflight_calls_total", "Coalesced calls by role (leader ran the work, follower shared it)", ["group", "role"]
+)
+
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key.
+
+    The work runs in its own task, so a leader whose request is cancelled
+    does not cancel the result the followers are waiting for.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is not None:
+            singleflight_calls.inc(group=self.name, role="follower")
+            return await asyncio.shield(task)
+
+        singleflight_calls.inc(group=self.name, role="leader")
+        task = self._calls[key] = asyncio.ensure_future(function())
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+blob_cache_requests = REGISTRY.counter("blob_cache_requests_total", "Blob cache lookups by result", ["result"])
+blob_cache_resident_bytes = REGISTRY.gauge("blob_cache_resident_bytes", "Bytes held by the blob cache")
+blob_cache_evictions = REGISTRY.counter("blob_cache_evictions_total", "Blobs evicted to stay within the byte budget")
+
+
+class BlobCache:
+    """LRU cache of blob bytes bounded by a total byte budget.
+
+    Keys are content hashes (plus the representation), so entries never go
+    stale. Objects larger than `max_object_bytes` are never cached and are
+    remembered so callers can skip reading them into memory.
+    """
+
+    def __init__(self, max_bytes: int, max_object_bytes: int, max_oversize_keys: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._oversize: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._max_oversize_keys = max_oversize_keys
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            blob_cache_requests.inc(result="miss")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        blob_cache_requests.inc(result="hit")
+        return data
+
+    def is_oversize(self, key: Hashable) -> bool:
+        return key in self._oversize
+
+    def mark_oversize(self, key: Hashable):
+        self._oversize[key] = None
+        while len(self._oversize) > self._max_oversize_keys:
+            self._oversize.popitem(last=False)
+
+    def put(self, key: Hashable, data: bytes) -> bool:
+        if len(data) > self.max_object_bytes or len(data) > self.max_bytes:
+            self.mark_oversize(key)
+            return False
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.resident_bytes -= len(previous)
+        self._entries[key] = data
+        self.resident_bytes += len(data)
+        while self.resident_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.resident_bytes -= len(evicted)
+            blob_cache_evictions.inc()
+        blob_cache_resident_bytes.set(self.resident_bytes)
+        return True
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
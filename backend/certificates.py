@@ -0,0 +1,178 @@
+"""Certificate and transcript rendering.
+
+Rendering is CPU-bound, so it runs in worker processes: each worker loads
+the certificate template once (`init_worker`) and `render_certificate`
+overlays one student's details on a fresh copy of the template page.
+Transcripts are drawn from scratch by `render_transcript`. Only plain dicts
+and bytes cross the process boundary.
+"""
+import io
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+# Subjects in the order they are printed: academic_record key -> label
+SUBJECTS = [
+    ("computer_intro", "Introduction to Computers"),
+    ("ms_word", "Microsoft Word"),
+    ("ms_excel", "Microsoft Excel"),
+    ("ms_powerpoint", "Microsoft PowerPoint"),
+    ("ms_access", "Microsoft Access"),
+]
+
+# Positions on the template page in points from the bottom-left corner
+# (the template is US Letter, 612 x 792). The logo sits at the top and the
+# artwork between y=308 and y=441, so the details go above and below it.
+PAGE_CENTRE = 306
+NAME_Y = 560
+ID_NUMBER_Y = 530
+ISSUED_Y = 500
+SCORES_TOP_Y = 270
+SCORES_LINE_HEIGHT = 20
+SCORE_LABEL_X = 170
+SCORE_VALUE_X = 442
+
+_template: Optional[bytes] = None
+
+
+def init_worker(template_path: str):
+    """Process pool initializer: read the template into this worker."""
+    global _template
+    with open(template_path, "rb") as handle:
+        _template = handle.read()
+
+
+def certificate_fields(student: dict, issued_on: datetime) -> dict:
+    """The picklable subset of a student document that goes on a certificate."""
+    record = student.get("academic_record") or {}
+    return {
+        "full_name": student["full_name"],
+        "id_number": student["id_number"],
+        "scores": [(label, record.get(key)) for key, label in SUBJECTS],
+        "average_score": student.get("average_score"),
+        "issued_on": issued_on.strftime("%d %B %Y"),
+    }
+
+
+def _overlay(fields: dict, width: float, height: float) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(width, height))
+
+    pdf.setFont("Helvetica-Bold", 26)
+    pdf.drawCentredString(PAGE_CENTRE, NAME_Y, fields["full_name"])
+    pdf.setFont("Helvetica", 13)
+    pdf.drawCentredString(PAGE_CENTRE, ID_NUMBER_Y, f"ID Number: {fields['id_number']}")
+    pdf.setFont("Helvetica", 11)
+    pdf.drawCentredString(PAGE_CENTRE, ISSUED_Y, f"Issued on {fields['issued_on']}")
+
+    rows: List[Tuple[str, Optional[float]]] = list(fields["scores"])
+    rows.append(("Average", fields["average_score"]))
+    y = SCORES_TOP_Y
+    for index, (label, score) in enumerate(rows):
+        pdf.setFont("Helvetica-Bold" if index == len(rows) - 1 else "Helvetica", 12)
+        pdf.drawString(SCORE_LABEL_X, y, label)
+        pdf.drawRightString(SCORE_VALUE_X, y, "-" if score is None else f"{score:.1f}%")
+        y -= SCORES_LINE_HEIGHT
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def render_certificate(fields: Dict) -> bytes:
+    """Render one certificate. Runs in a worker set up by init_worker."""
+    if _template is None:
+        raise RuntimeError("Certificate worker was not initialised with a template")
+
+    page = PdfReader(io.BytesIO(_template)).pages[0]
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    page.merge_page(PdfReader(io.BytesIO(_overlay(fields, width, height))).pages[0])
+
+    writer = PdfWriter()
+    writer.add_page(page)
+    writer.add_metadata({"/Title": f"Certificate - {fields['full_name']}"})
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def transcript_fields(student: dict, pass_mark: float) -> dict:
+    """The picklable subset of a student document that goes on a transcript.
+
+    The date printed is the student's updated_at, so the same record always
+    renders to the same bytes.
+    """
+    record = student.get("academic_record") or {}
+    finance = student.get("finance_record") or {}
+    return {
+        "full_name": student["full_name"],
+        "id_number": student["id_number"],
+        "scores": [(label, record.get(key)) for key, label in SUBJECTS],
+        "average_score": student.get("average_score"),
+        "pass_mark": pass_mark,
+        "total_fees": finance.get("total_fees", 0.0),
+        "paid_amount": finance.get("paid_amount", 0.0),
+        "balance": finance.get("balance", 0.0),
+        "is_cleared": finance.get("is_cleared", False),
+        "as_of": student["updated_at"].strftime("%d %B %Y"),
+    }
+
+
+def render_transcript(fields: Dict) -> bytes:
+    """Render a one-page A4 transcript of scores and fees."""
+    buffer = io.BytesIO()
+    width, height = A4
+    pdf = canvas.Canvas(buffer, pagesize=A4, invariant=1)
+    pdf.setTitle(f"Transcript - {fields['full_name']}")
+    left, right = 72, width - 72
+
+    y = height - 90
+    pdf.setFont("Helvetica-Bold", 18)
+    pdf.drawCentredString(width / 2, y, "TWOEM Online Productions")
+    y -= 24
+    pdf.setFont("Helvetica", 13)
+    pdf.drawCentredString(width / 2, y, "Academic Transcript")
+
+    y -= 48
+    pdf.setFont("Helvetica", 11)
+    for label, value in (
+        ("Name", fields["full_name"]),
+        ("ID Number", fields["id_number"]),
+        ("As of", fields["as_of"]),
+    ):
+        pdf.drawString(left, y, f"{label}:")
+        pdf.drawString(left + 90, y, str(value))
+        y -= 18
+
+    def table(title: str, rows: List[Tuple[str, str]], y: float) -> float:
+        pdf.setFont("Helvetica-Bold", 12)
+        pdf.drawString(left, y, title)
+        y -= 6
+        pdf.line(left, y, right, y)
+        y -= 16
+        pdf.setFont("Helvetica", 11)
+        for label, value in rows:
+            pdf.drawString(left, y, label)
+            pdf.drawRightString(right, y, value)
+            y -= 18
+        return y - 18
+
+    average = fields["average_score"]
+    y = table("Scores", [
+        *((label, "-" if score is None else f"{score}%") for label, score in fields["scores"]),
+        ("Average", "-" if average is None else f"{average:.1f}%"),
+        ("Result", "Pass" if average is not None and average >= fields["pass_mark"] else "Not yet passed"),
+    ], y - 18)
+    table("Fees", [
+        ("Total fees", f"{fields['total_fees']:,.2f}"),
+        ("Paid", f"{fields['paid_amount']:,.2f}"),
+        ("Balance", f"{fields['balance']:,.2f}"),
+        ("Status", "Cleared" if fields["is_cleared"] else "Outstanding"),
+    ], y)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
@@ -0,0 +1,137 @@
+"""Cross-worker cache invalidation over a MongoDB capped collection.
+
+Every uvicorn worker tails the same capped collection. An invalidation
+takes the next version for its key from a counter document, applies it
+locally and appends an event. The other workers apply the event when their
+tailable cursor delivers it. Per-key versions make replays and duplicate
+deliveries harmless, so a worker that loses its cursor simply re-reads the
+whole capped collection.
+
+Staleness is bounded: the tailing loop records when the server last answered.
+If that is older than `max_staleness` seconds, the registered caches bypass
+their entries, so a worker that stops hearing the bus serves fresh data
+instead of stale data.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, Optional
+
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from caching import ResponseCache
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+invalidation_events = REGISTRY.counter(
+    "cache_invalidation_events_total", "Invalidation events by origin", ["origin"]
+)
+invalidation_lag = REGISTRY.histogram(
+    "cache_invalidation_lag_seconds", "Delay between publishing and applying a remote invalidation",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+
+class InvalidationBus:
+    def __init__(
+        self,
+        db,
+        collection: str = "cache_invalidations",
+        size_bytes: int = 1024 * 1024,
+        max_staleness: float = 5.0,
+        await_time_ms: int = 1000
+    ):
+        self.db = db
+        self.events = db[collection]
+        self.versions = db[f"{collection}_versions"]
+        self.collection = collection
+        self.size_bytes = size_bytes
+        self.max_staleness = max_staleness
+        self.await_time_ms = await_time_ms
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.caches: Dict[str, ResponseCache] = {}
+        self.last_heard: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, cache: ResponseCache):
+        self.caches[cache.name] = cache
+        cache.guard = self.is_current
+
+    def is_current(self) -> bool:
+        """True while this worker has heard from the bus within max_staleness."""
+        return self.last_heard is not None and time.monotonic() - self.last_heard <= self.max_staleness
+
+    async def start(self):
+        try:
+            await self.db.create_collection(self.collection, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        # A tailable cursor on an empty capped collection dies immediately
+        if await self.events.estimated_document_count() == 0:
+            await self.events.insert_one({"type": "init", "origin": self.worker_id, "published_at": time.time()})
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, cache: ResponseCache, key: str) -> int:
+        counter = await self.versions.find_one_and_update(
+            {"_id": f"{cache.name}:{key}"},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        version = counter["version"]
+        cache.invalidate(key, version=version)
+        await self.events.insert_one({
+            "type": "invalidate",
+            "cache": cache.name,
+            "key": key,
+            "version": version,
+            "origin": self.worker_id,
+            "published_at": time.time()
+        })
+        invalidation_events.inc(origin="local")
+        return version
+
+    def apply(self, event: dict):
+        cache = self.caches.get(event.get("cache"))
+        if event.get("type") != "invalidate" or cache is None:
+            return
+        if cache.invalidate(event["key"], version=event["version"]) and event["origin"] != self.worker_id:
+            invalidation_events.inc(origin="remote")
+            invalidation_lag.observe(max(0.0, time.time() - event["published_at"]))
+
+    async def _run(self):
+        while True:
+            try:
+                # Replaying from the start is safe because versions only move forward
+                cursor = self.events.find(
+                    {},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                    max_await_time_ms=self.await_time_ms
+                )
+                while cursor.alive:
+                    async for event in cursor:
+                        self.apply(event)
+                        self.last_heard = time.monotonic()
+                    self.last_heard = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as error:
+                # Events may have rolled out of the capped collection meanwhile
+                logger.warning("Cache invalidation bus interrupted: %s", error)
+                for cache in self.caches.values():
+                    cache.clear()
+            await asyncio.sleep(min(1.0, self.max_staleness / 2))
@@ -0,0 +1,252 @@
+"""Background jobs persisted in MongoDB and run by an in-process worker pool.
+
+A job is a document in the `jobs` collection that moves through
+queued -> running -> done | failed. Each uvicorn worker runs a JobRunner
+with a fixed number of worker tasks. Workers claim queued jobs atomically,
+so several processes can share one collection. They are woken at once for
+jobs submitted locally and poll for jobs submitted elsewhere.
+
+A running job's owner refreshes `heartbeat_at`. A job whose heartbeat is
+older than `stale_after` seconds belongs to a process that died or
+restarted. It is queued again until it has been attempted `max_attempts`
+times, after which it is marked failed. Handlers should therefore be safe
+to re-run. Only jobs whose handler is still running are heartbeated, so a
+job whose outcome could not be recorded goes stale and is picked up again.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+jobs_finished = REGISTRY.counter("jobs_finished_total", "Jobs finished by kind and status", ["kind", "status"])
+jobs_duration = REGISTRY.histogram(
+    "job_duration_seconds", "Job run time by kind", ["kind"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+jobs_running = REGISTRY.gauge("jobs_running", "Jobs running in this process", ["kind"])
+
+# Writes of a job's outcome are retried this many times, the last time
+# recording it as failed in case the result itself cannot be stored
+FINISH_ATTEMPTS = 3
+
+
+class JobContext:
+    """What a handler sees of its job: parameters and a progress reporter."""
+
+    def __init__(self, runner: "JobRunner", job: dict):
+        self.runner = runner
+        self.id = job["id"]
+        self.kind = job["kind"]
+        self.params = job.get("params") or {}
+        self.created_by = job.get("created_by")
+        self.progress: Dict[str, int] = dict(job.get("progress") or {})
+        self._last_report = 0.0
+
+    async def report(self, force: bool = False, **progress: int):
+        """Update progress counters, writing them at most once per second."""
+        self.progress.update(progress)
+        if force or time.monotonic() - self._last_report >= 1:
+            self._last_report = time.monotonic()
+            await self.runner.jobs.update_one(
+                {"id": self.id, "worker": self.runner.worker_id},
+                {"$set": {"progress": self.progress, "heartbeat_at": datetime.utcnow()}}
+            )
+
+
+Handler = Callable[[JobContext], Awaitable[Optional[dict]]]
+
+
+class JobRunner:
+    def __init__(
+        self,
+        jobs,
+        workers: int = 2,
+        poll_interval: float = 5.0,
+        stale_after: float = 60.0,
+        max_attempts: int = 3
+    ):
+        self.jobs = jobs
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, Handler] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._active: Set[str] = set()  # ids of jobs whose handler is running here
+
+    def register(self, kind: str, handler: Handler):
+        self.handlers[kind] = handler
+
+    async def submit(self, kind: str, params: Optional[dict] = None, created_by: Optional[str] = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "progress": {},
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "worker": None,
+            "created_by": created_by,
+            "created_at": datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "heartbeat_at": None
+        }
+        await self.jobs.insert_one(dict(job))
+        self._wakeup.set()
+        return job
+
+    async def start(self):
+        await self.recover()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._watch()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        # Hand this process's jobs back to the queue rather than waiting for them to go stale
+        await self.jobs.update_many(
+            {"status": "running", "worker": self.worker_id},
+            {"$set": {"status": "queued", "worker": None}}
+        )
+
+    async def recover(self) -> int:
+        """Requeue, or fail after max_attempts, running jobs whose owner stopped heartbeating."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        stale = {"status": "running", "heartbeat_at": {"$lt": cutoff}}
+        failed = await self.jobs.update_many(
+            {**stale, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {
+                "status": "failed",
+                "error": "Interrupted too many times",
+                "worker": None,
+                "finished_at": datetime.utcnow()
+            }}
+        )
+        requeued = await self.jobs.update_many(stale, {"$set": {"status": "queued", "worker": None}})
+        if requeued.modified_count:
+            logger.warning("Requeued %d interrupted job(s)", requeued.modified_count)
+            self._wakeup.set()
+        return failed.modified_count + requeued.modified_count
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.jobs.find_one_and_update(
+            {"status": "queued", "kind": {"$in": list(self.handlers)}},
+            {
+                "$set": {"status": "running", "worker": self.worker_id, "started_at": now, "heartbeat_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def run(self, job: dict):
+        context = JobContext(self, job)
+        jobs_running.inc(kind=job["kind"])
+        self._active.add(job["id"])
+        start = time.perf_counter()
+        try:
+            try:
+                result = await self.handlers[job["kind"]](context)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+                await self._finish(context, "failed", error=str(error))
+            else:
+                await self._finish(context, "done", result=result)
+        finally:
+            self._active.discard(job["id"])
+            jobs_running.dec(kind=job["kind"])
+            jobs_duration.observe(time.perf_counter() - start, kind=job["kind"])
+
+    async def _finish(self, context: JobContext, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        update = {
+            "status": status,
+            "progress": context.progress,
+            "result": result,
+            "error": error,
+            "finished_at": datetime.utcnow()
+        }
+        for attempt in range(1, FINISH_ATTEMPTS + 1):
+            try:
+                await self.jobs.update_one({"id": context.id, "worker": self.worker_id}, {"$set": update})
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as write_error:
+                if attempt == FINISH_ATTEMPTS:
+                    raise
+                logger.warning("Could not record the outcome of job %s: %s", context.id, write_error)
+                if attempt == FINISH_ATTEMPTS - 1:
+                    update.update(
+                        status="failed",
+                        result=None,
+                        error=f"Could not record the job's outcome: {write_error}"
+                    )
+                await asyncio.sleep(attempt)
+        jobs_finished.inc(kind=context.kind, status=update["status"])
+
+    async def _work(self):
+        while True:
+            # Cleared before claiming so a submit during the claim is not missed
+            self._wakeup.clear()
+            try:
+                job = await self.claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is not None:
+                try:
+                    await self.run(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # No longer heartbeated, so the job goes stale and is recovered
+                    logger.exception("Job %s (%s) could not be finished", job["id"], job["kind"])
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _watch(self):
+        """Heartbeat this process's running jobs and recover stale ones."""
+        while True:
+            await asyncio.sleep(self.stale_after / 4)
+            try:
+                if self._active:
+                    await self.jobs.update_many(
+                        {"id": {"$in": list(self._active)}, "status": "running", "worker": self.worker_id},
+                        {"$set": {"heartbeat_at": datetime.utcnow()}}
+                    )
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job heartbeat failed")
@@ -0,0 +1,51 @@
+"""Maintenance commands for the TWOEM backend.
+
+Run from the backend directory, e.g. ``python manage.py backfill-student-fields``.
+"""
+import asyncio
+
+import typer
+
+from server import backfill_student_derived_fields, blob_store, client, ensure_indexes, migrate_legacy_files
+
+cli = typer.Typer()
+
+
+def run(coroutine):
+    try:
+        return asyncio.run(coroutine)
+    finally:
+        client.close()
+
+
+@cli.command()
+def backfill_student_fields():
+    """Recompute average_score, has_certificate and certificate_eligible."""
+    async def migrate():
+        await ensure_indexes()
+        return await backfill_student_derived_fields()
+
+    modified = run(migrate())
+    typer.echo(f"Updated derived fields on {modified} student(s)")
+
+
+@cli.command()
+def migrate_files():
+    """Move base64 file_data from eulogies, downloads and certificates into the blob store."""
+    async def migrate():
+        migrated = await migrate_legacy_files()
+        return migrated, await blob_store.stats()
+
+    migrated, stats = run(migrate())
+    typer.echo(f"Migrated {migrated} file(s); deduplication saves {stats['dedup_saved_bytes']} bytes")
+
+
+@cli.command()
+def create_indexes():
+    """Create the indexes the API relies on."""
+    run(ensure_indexes())
+    typer.echo("Indexes created")
+
+
+if __name__ == "__main__":
+    cli()
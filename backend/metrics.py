@@ -0,0 +1,249 @@
+"""In-process metrics registry shared by the API and its middleware.
+
+Metrics are kept per process. With several uvicorn workers a scrape reaches
+whichever worker accepts the connection, so on its own /metrics would show a
+different process's values each time. MultiprocessCollector combines the
+workers' registries through files in a shared directory instead.
+"""
+import bisect
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if value == float("inf"):
+        text = "+Inf"
+    elif float(value).is_integer():
+        text = str(int(value))
+    else:
+        text = repr(float(value))
+    if not labels:
+        return f"{name} {text}"
+    rendered = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+    return f"{name}{{{rendered}}} {text}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [(self.name, self._labels(key), value) for key, value in list(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # One slot per bucket plus +Inf, then sum and count
+                state = self._values[key] = [0.0] * (len(self.buckets) + 3)
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        samples = []
+        for key, state in list(self._values.items()):
+            labels = self._labels(key)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", {**labels, "le": le}, cumulative))
+            samples.append((f"{self.name}_sum", labels, state[-2]))
+            samples.append((f"{self.name}_count", labels, state[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets or DEFAULT_BUCKETS)
+
+    def snapshot(self) -> Dict[str, list]:
+        """Return every sample as JSON-friendly data, keyed by metric name."""
+        return {
+            name: [
+                {"name": sample_name, "labels": labels, "value": value}
+                for sample_name, labels, value in metric.samples()
+            ]
+            for name, metric in self._metrics.items()
+        }
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(_format_sample(*sample) for sample in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessCollector:
+    """Combine the registries of processes sharing a directory.
+
+    Each process writes its registry to `<directory>/<pid>.json` with write(),
+    replacing the file atomically. render() merges every file. Counters and
+    histograms are summed over all processes, including those that have
+    exited, so totals do not go backwards when a worker restarts. Gauges
+    describe a running process, so they get a `worker` label holding its pid
+    and are left out once it has exited.
+
+    The directory must be emptied before the server starts, or the files of
+    the previous run are counted again.
+    """
+
+    def __init__(self, registry: MetricsRegistry, directory, pid: Optional[int] = None):
+        self.registry = registry
+        self.directory = Path(directory)
+        self.pid = pid
+
+    def _pid(self) -> int:
+        return self.pid if self.pid is not None else os.getpid()
+
+    def write(self):
+        state = {}
+        for name, metric in list(self.registry._metrics.items()):
+            state[name] = {
+                "kind": metric.kind,
+                "documentation": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "values": [[list(key), value] for key, value in list(metric._values.items())]
+            }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{self._pid()}.json"
+        temporary = path.with_name(f"{path.name}.tmp")
+        temporary.write_text(json.dumps(state))
+        os.replace(temporary, path)
+
+    def merge(self) -> MetricsRegistry:
+        """Write this process's registry, then return the sum of every process's."""
+        self.write()
+        merged = MetricsRegistry()
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                pid = int(path.stem)
+                state = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            alive = pid == self._pid() or _process_alive(pid)
+            for name, entry in state.items():
+                if entry["kind"] == "gauge":
+                    if not alive:
+                        continue
+                    metric = merged.gauge(name, entry["documentation"], entry["labelnames"] + ["worker"])
+                    for key, value in entry["values"]:
+                        metric._values[tuple(key) + (str(pid),)] = value
+                elif entry["kind"] == "histogram":
+                    metric = merged.histogram(name, entry["documentation"], entry["labelnames"], entry["buckets"])
+                    if list(metric.buckets) != entry["buckets"]:
+                        continue  # written by a version with other buckets
+                    for key, value in entry["values"]:
+                        totals = metric._values.get(tuple(key))
+                        metric._values[tuple(key)] = value if totals is None else [
+                            total + count for total, count in zip(totals, value)
+                        ]
+                else:
+                    metric = merged.counter(name, entry["documentation"], entry["labelnames"])
+                    for key, value in entry["values"]:
+                        metric._values[tuple(key)] = metric._values.get(tuple(key), 0) + value
+        return merged
+
+    def render(self) -> str:
+        return self.merge().render()
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,492 @@
+"""ASGI middleware for the TWOEM API."""
+import asyncio
+import math
+import re
+import time
+import zlib
+from contextvars import ContextVar
+from typing import Iterable, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from metrics import REGISTRY
+from tracing import Tracer, current_trace
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_CONTENT_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/"
+)
+
+compression_bytes_in = REGISTRY.counter(
+    "http_compression_bytes_in_total", "Response bytes before compression", ["encoding"]
+)
+compression_bytes_out = REGISTRY.counter(
+    "http_compression_bytes_out_total", "Response bytes after compression", ["encoding"]
+)
+compression_ratio = REGISTRY.histogram(
+    "http_compression_ratio", "Compressed size divided by original size per response", ["encoding"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0)
+)
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Content codings an Accept-Encoding header allows.
+
+    Codings with a q value of zero, in any spelling, are refused, as are
+    codings whose q value cannot be parsed.
+    """
+    accepted = set()
+    for token in accept_encoding.split(","):
+        coding, *params = token.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """Compress text-like responses with brotli or gzip.
+
+    Responses are left untouched when they are smaller than `minimum_size`,
+    already carry a Content-Encoding, or have a content type outside
+    `content_types` (PDFs and other binary downloads).
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        content_types: Iterable[str] = COMPRESSIBLE_CONTENT_TYPES
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.content_types = tuple(content_types)
+
+    def select_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = accepted_encodings(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        bytes_in = 0
+        bytes_out = 0
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, bytes_in, bytes_out
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").lower()
+                if "content-encoding" in headers or not content_type.startswith(self.content_types):
+                    # Not eligible: stream the response through untouched
+                    start_message = False
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is False:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send_start(None)
+                    start_message = False
+                    await send(message)
+                    return
+                encoder = (
+                    _BrotliEncoder(self.brotli_quality) if encoding == "br"
+                    else _GzipEncoder(self.gzip_level)
+                )
+                compressed = encoder.compress(body)
+                if not more_body:
+                    compressed += encoder.finish()
+                    await send_start(len(compressed))
+                else:
+                    await send_start(None, streaming=True)
+            else:
+                compressed = encoder.compress(body)
+                if not more_body:
+                    compressed += encoder.finish()
+
+            bytes_in += len(body)
+            bytes_out += len(compressed)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+            if not more_body:
+                compression_bytes_in.inc(bytes_in, encoding=encoding)
+                compression_bytes_out.inc(bytes_out, encoding=encoding)
+                if bytes_in:
+                    compression_ratio.observe(bytes_out / bytes_in, encoding=encoding)
+
+        async def send_start(content_length: Optional[int], streaming: bool = False):
+            headers = MutableHeaders(raw=start_message["headers"])
+            if content_length is not None or streaming:
+                headers["Content-Encoding"] = encoding
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if streaming:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(content_length)
+            await send(start_message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+class _BodyTooLarge(HTTPException):
+    """Raised from receive() once a body passes its limit.
+
+    An HTTPException, so FastAPI answers 413 even when the limit is hit
+    while it parses the body, where it turns other errors into 400.
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Request body exceeds the maximum size of {max_bytes} bytes",
+            headers={"Connection": "close"}
+        )
+
+
+class RequestSizeLimitMiddleware:
+    """Reject request bodies above a per-route limit with 413.
+
+    `limits` is a sequence of (method, path regex, max bytes). Requests are
+    refused up front when Content-Length is over the limit, and bodies sent
+    without a usable Content-Length are cut off once the running byte count
+    passes it.
+    """
+
+    def __init__(self, app, limits: Sequence[Tuple[str, str, int]]):
+        self.app = app
+        self.limits = [(method, re.compile(pattern), max_bytes) for method, pattern, max_bytes in limits]
+
+    def limit_for(self, method: str, path: str) -> Optional[int]:
+        for limit_method, pattern, max_bytes in self.limits:
+            if method == limit_method and pattern.match(path):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.limit_for(scope["method"], scope["path"])
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            await self.reject(scope, receive, send, max_bytes)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise _BodyTooLarge(max_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self.reject(scope, receive, send, max_bytes)
+
+    async def reject(self, scope, receive, send, max_bytes: int):
+        response = JSONResponse(
+            {"detail": f"Request body exceeds the maximum size of {max_bytes} bytes"},
+            status_code=413,
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+
+concurrency_in_flight = REGISTRY.gauge(
+    "http_concurrency_in_flight", "Requests holding a concurrency slot", ["route_class"]
+)
+concurrency_queue_depth = REGISTRY.gauge(
+    "http_concurrency_queue_depth", "Requests waiting for a concurrency slot", ["route_class"]
+)
+concurrency_wait = REGISTRY.histogram(
+    "http_concurrency_wait_seconds", "Time spent waiting for a concurrency slot", ["route_class"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+concurrency_rejected = REGISTRY.counter(
+    "http_concurrency_rejected_total", "Requests rejected with 503 because the queue was full or timed out",
+    ["route_class"]
+)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` concurrent holders, with a bounded queue of waiters."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        concurrency_queue_depth.set(self.waiting, route_class=self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+            concurrency_queue_depth.set(self.waiting, route_class=self.name)
+            concurrency_wait.observe(time.perf_counter() - start, route_class=self.name)
+        concurrency_in_flight.inc(route_class=self.name)
+        return True
+
+    def release(self):
+        concurrency_in_flight.dec(route_class=self.name)
+        self._semaphore.release()
+
+
+class ConcurrencyLimitMiddleware:
+    """Apply a ConcurrencyLimiter per route class.
+
+    `route_classes` is a sequence of (name, methods, path regex, limit,
+    max_queue, max_wait). The first matching class applies. Unmatched routes
+    are not limited. When a class's queue is full, or a request waits longer
+    than max_wait, the request gets 503 with Retry-After. A slot is held
+    until the response body has been sent, so streaming downloads count for
+    their whole duration.
+    """
+
+    def __init__(self, app, route_classes: Sequence[Tuple[str, Iterable[str], str, int, int, float]]):
+        self.app = app
+        self.route_classes = [
+            (set(methods), re.compile(pattern), ConcurrencyLimiter(name, limit, max_queue, max_wait))
+            for name, methods, pattern, limit, max_queue, max_wait in route_classes
+        ]
+
+    def limiter_for(self, method: str, path: str) -> Optional[ConcurrencyLimiter]:
+        for methods, pattern, limiter in self.route_classes:
+            if method in methods and pattern.match(path):
+                return limiter
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter_for(scope["method"], scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await limiter.acquire():
+            concurrency_rejected.inc(route_class=limiter.name)
+            # Rejected before routing, so route_template has no route to report
+            scope["rejected_route_class"] = limiter.name
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(max(1, math.ceil(limiter.max_wait)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+http_requests = REGISTRY.counter(
+    "http_requests_total", "Requests by method, route template and status", ["method", "route", "status"]
+)
+http_request_duration = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time from receiving a request to the end of its response body",
+    ["method", "route"]
+)
+http_requests_in_flight = REGISTRY.gauge("http_requests_in_flight", "Requests being handled", ["method"])
+http_response_size = REGISTRY.histogram(
+    "http_response_size_bytes", "Response body bytes as sent to the client", ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+)
+
+
+# ASGI scope of the request being handled, for code that runs outside the
+# endpoint (e.g. MongoDB command listeners on the driver's threads)
+request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def route_template(scope) -> str:
+    """The path template of the route that handled a request, e.g. /api/downloads/{download_id}.
+
+    Templates rather than raw paths keep label cardinality bounded. Requests
+    the concurrency limiter turned away are reported as rejected:<route class>.
+    """
+    route = scope.get("route")
+    if route is None and "rejected_route_class" in scope:
+        return f"rejected:{scope['rejected_route_class']}"
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Record request counts, latency, in-flight requests and response sizes per route.
+
+    Added outside the size and concurrency limiters and compression (only
+    CORS wraps it), so it sees their 413s and 503s and measures bodies
+    after compression.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        size = 0
+        start = time.perf_counter()
+
+        async def measured_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            request_scope.reset(token)
+            http_requests_in_flight.dec(method=method)
+            route = route_template(scope)
+            http_requests.inc(method=method, route=route, status=str(status))
+            http_request_duration.observe(time.perf_counter() - start, method=method, route=route)
+            http_response_size.observe(size, method=method, route=route)
+
+
+class TracingMiddleware:
+    """Trace requests and report where their time went.
+
+    Traced requests that are sampled, or that authenticated as an admin,
+    get a Server-Timing header. When the tracer has an export path, their
+    spans are also appended to it after the response has been sent.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        trace = self.tracer.start(scope["method"]) if scope["type"] == "http" else None
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start" and trace.exposed:
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            current_trace.reset(token)
+            trace.finish()
+            trace.root.name = f"{scope['method']} {route_template(scope)}"
+            trace.root.attributes.update({"http.method": scope["method"], "http.target": scope["path"]})
+        if trace.exposed and self.tracer.export_path:
+            await asyncio.to_thread(self.tracer.export, trace)
@@ -0,0 +1,238 @@
+"""MongoDB command monitoring and slow-query log.
+
+MongoCommandListener is registered on the Motor client. It records the
+duration of every command per command name and collection, and keeps
+running totals per (command, collection) for the admin stats endpoint.
+
+A command slower than `slow_ms` is logged with the route of the request
+that issued it. Motor copies context variables into its executor threads,
+so `request_scope` is visible to the listener. For find, aggregate, count,
+distinct, update, delete and findAndModify, the command is then explained
+(queryPlanner verbosity) on the event loop, and the log line and recent
+slow-query list show whether the winning plan scanned the collection or
+an index. One query shape is explained at most once per
+`explain_interval` seconds.
+
+Commands issued while a request is traced are added to its trace as
+client spans named mongo.<command>.<collection>.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import REGISTRY
+from middleware import request_scope, route_template
+from tracing import KIND_CLIENT, current_span_id, current_trace
+
+logger = logging.getLogger(__name__)
+
+mongo_command_duration = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "MongoDB command round-trip time", ["command", "collection"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+mongo_command_failures = REGISTRY.counter(
+    "mongo_command_failures_total", "MongoDB commands that returned an error", ["command", "collection"]
+)
+mongo_slow_commands = REGISTRY.counter(
+    "mongo_slow_commands_total", "MongoDB commands slower than the slow-query threshold", ["command", "collection"]
+)
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Command fields that belong to the session or wire protocol, not the query
+_SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+
+def command_collection(command_name: str, command) -> str:
+    """The collection a command targets, or "" for server-level commands."""
+    if command_name == "getMore":
+        target = command.get("collection")
+    else:
+        target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+def query_shape(command_name: str, command) -> str:
+    """Field names a command filters, sorts or groups on, without their values."""
+    def keys(value) -> str:
+        return ",".join(sorted(value)) if isinstance(value, dict) else ""
+
+    if command_name == "aggregate":
+        pipeline = [stage for stage in command.get("pipeline") or [] if isinstance(stage, dict)]
+        first = pipeline[0] if pipeline else {}
+        return f"pipeline={'|'.join(next(iter(stage), '') for stage in pipeline)} match={keys(first.get('$match'))}"
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        return f"filter={keys(statements[0].get('q'))}"
+    return f"filter={keys(command.get('filter') or command.get('query'))} sort={keys(command.get('sort'))}"
+
+
+def plan_summary(explain: dict) -> Tuple[str, bool]:
+    """Stages of the winning plan, outermost first, and whether it scans the collection."""
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations put the find layer's plan under the first stage
+        for stage in explain.get("stages", []):
+            planner = (stage.get("$cursor") or {}).get("queryPlanner")
+            if planner:
+                break
+    plan = (planner or {}).get("winningPlan") or {}
+    plan = plan.get("queryPlan", plan)  # slot-based engine
+
+    stages: List[str] = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop(0)
+        stage = node.get("stage")
+        if stage:
+            stages.append(f"{stage} {node['indexName']}" if node.get("indexName") else stage)
+        if isinstance(node.get("inputStage"), dict):
+            nodes.append(node["inputStage"])
+        nodes.extend(child for child in node.get("inputStages", []) if isinstance(child, dict))
+    return " <- ".join(stages) or "unknown", any(stage.startswith("COLLSCAN") for stage in stages)
+
+
+class _Pending:
+    __slots__ = ("collection", "route", "command", "trace", "parent_span_id")
+
+    def __init__(self, collection: str, route: str, command: Optional[dict]):
+        self.collection = collection
+        self.route = route
+        self.command = command
+        self.trace = current_trace.get()
+        self.parent_span_id = current_span_id.get()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Time commands by collection and log slow ones with their plan.
+
+    Listener callbacks run on the driver's threads, so per-command state is
+    keyed by (connection, request id) and guarded by a lock.
+    """
+
+    def __init__(self, slow_ms: float = 100, explain_interval: float = 60, recent: int = 100):
+        self.slow_ms = slow_ms
+        self.explain_interval = explain_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, _Pending] = {}
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._explained: Dict[Tuple[str, str, str], float] = {}
+        self.slow_queries = deque(maxlen=recent)
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(self, client, loop: asyncio.AbstractEventLoop):
+        """Enable explains, which are issued through `client` on `loop`."""
+        self._client = client
+        self._loop = loop
+
+    def _key(self, event) -> Tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        scope = request_scope.get()
+        route = f"{scope['method']} {route_template(scope)}" if scope else "background"
+        command = dict(event.command) if event.command_name in EXPLAINABLE_COMMANDS else None
+        with self._lock:
+            self._pending[self._key(event)] = _Pending(
+                command_collection(event.command_name, event.command), route, command
+            )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            pending = self._pending.pop(self._key(event), None)
+        if pending is None:
+            return
+        name, collection = event.command_name, pending.collection
+        seconds = event.duration_micros / 1_000_000
+        slow = seconds * 1000 >= self.slow_ms and name != "explain"
+
+        mongo_command_duration.observe(seconds, command=name, collection=collection)
+        if pending.trace is not None:
+            pending.trace.record(
+                f"mongo.{name}.{collection}" if collection else f"mongo.{name}",
+                event.duration_micros * 1000,
+                parent_id=pending.parent_span_id,
+                kind=KIND_CLIENT,
+                **{"db.system": "mongodb", "db.operation": name, "db.mongodb.collection": collection}
+            )
+        if failed:
+            mongo_command_failures.inc(command=name, collection=collection)
+        with self._lock:
+            totals = self._totals.setdefault((name, collection), {
+                "count": 0, "failures": 0, "slow": 0, "total_ms": 0.0, "max_ms": 0.0
+            })
+            totals["count"] += 1
+            totals["failures"] += failed
+            totals["slow"] += slow
+            totals["total_ms"] += seconds * 1000
+            totals["max_ms"] = max(totals["max_ms"], seconds * 1000)
+        if not slow:
+            return
+
+        mongo_slow_commands.inc(command=name, collection=collection)
+        entry = {
+            "at": time.time(),
+            "command": name,
+            "collection": collection,
+            "route": pending.route,
+            "duration_ms": round(seconds * 1000, 1),
+            "shape": query_shape(name, pending.command) if pending.command else None,
+            "plan": None,
+            "collscan": None
+        }
+        self.slow_queries.append(entry)
+        if pending.command is None or self._loop is None or failed or not self._should_explain(entry):
+            logger.warning(
+                "Slow MongoDB %s on %s: %.1fms (route %s)", name, collection, entry["duration_ms"], pending.route
+            )
+            return
+        self._loop.call_soon_threadsafe(
+            lambda: asyncio.ensure_future(self._explain(event.database_name, pending.command, entry))
+        )
+
+    def _should_explain(self, entry: dict) -> bool:
+        key = (entry["command"], entry["collection"], entry["shape"])
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(key, float("-inf")) < self.explain_interval:
+                return False
+            self._explained[key] = now
+        return True
+
+    async def _explain(self, database: str, command: dict, entry: dict):
+        query = {key: value for key, value in command.items() if not key.startswith("$") and key not in _SESSION_FIELDS}
+        try:
+            explain = await self._client[database].command({"explain": query, "verbosity": "queryPlanner"})
+            entry["plan"], entry["collscan"] = plan_summary(explain)
+        except Exception as error:
+            entry["plan"] = f"explain failed: {error}"
+        logger.warning(
+            "Slow MongoDB %s on %s: %.1fms (route %s, %s, plan %s)",
+            entry["command"], entry["collection"], entry["duration_ms"], entry["route"], entry["shape"], entry["plan"]
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            commands = [
+                {
+                    "command": name,
+                    "collection": collection,
+                    **totals,
+                    "avg_ms": totals["total_ms"] / totals["count"]
+                }
+                for (name, collection), totals in self._totals.items()
+            ]
+        commands.sort(key=lambda command: command["total_ms"], reverse=True)
+        return {"slow_ms": self.slow_ms, "commands": commands, "slow_queries": list(self.slow_queries)}
@@ -1,22 +1,54 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
+import asyncio
 import logging
-from pathlib import Path
+import math
+import re
+import shutil
+from pathlib import Path, PurePosixPath
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict
 import uuid
 from datetime import datetime, timedelta
 import jwt
 import bcrypt
 import base64
+import hashlib
+import hmac
 import random
 import string
+from urllib.parse import quote
 from typing import Union
+import orjson
+import zipfile
+import zlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from blobstore import CHUNK_SIZE, BlobLocation, BlobStore, BlobTooLarge, StoredBlob, iter_file, write_file
+from caching import BlobCache, CachedResponse, ResponseCache, SingleFlight, cache_requests
+from certificates import certificate_fields, init_worker, render_certificate, render_transcript, transcript_fields
+from exports import ZipEntry, csv_stream, xlsx_stream, zip_stream
+from invalidation import InvalidationBus
+from jobs import JobContext, JobRunner
+from metrics import REGISTRY, MultiprocessCollector
+from middleware import (
+    CompressionMiddleware,
+    ConcurrencyLimitMiddleware,
+    MetricsMiddleware,
+    RequestSizeLimitMiddleware,
+    TracingMiddleware,
+    accepted_encodings
+)
+from monitoring import MongoCommandListener
+from tracing import TracedJSONResponse, TracedRoute, Tracer, mark_admin, span
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -26,20 +58,152 @@ SECRET_KEY = "your-super-secret-jwt-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Signed, expiring file URLs let browsers fetch private files and certificates
+# directly; they are verified with SIGNED_URL_SECRET and no database access
+SIGNED_URL_SECRET = os.environ.get('SIGNED_URL_SECRET', SECRET_KEY)
+SIGNED_URL_TTL_SECONDS = int(os.environ.get('SIGNED_URL_TTL_SECONDS', 300))
+
+# Minimum average score required before a certificate can be downloaded
+CERTIFICATE_PASS_MARK = 60
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MINIMUM_SIZE', 1024))
+
+# Serve list endpoints from trusted Mongo documents with orjson, skipping
+# per-item Pydantic models and response_model validation
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', 'false').lower() == 'true'
+
+# Public download/eulogy listings are cached in-process for this many seconds
+# and browsers/CDNs may serve them stale while revalidating for the second value
+PUBLIC_LISTING_TTL = int(os.environ.get('PUBLIC_LISTING_TTL', 60))
+PUBLIC_LISTING_STALE_WHILE_REVALIDATE = int(os.environ.get('PUBLIC_LISTING_STALE_WHILE_REVALIDATE', 300))
+
+# Propagate cache invalidations to every worker through MongoDB. Enable when
+# running more than one uvicorn worker; cached entries are bypassed whenever a
+# worker has not heard from the bus for CACHE_MAX_STALENESS seconds
+CACHE_INVALIDATION_BUS = os.environ.get('CACHE_INVALIDATION_BUS', 'false').lower() == 'true'
+CACHE_MAX_STALENESS = float(os.environ.get('CACHE_MAX_STALENESS', 5))
+
+# Maximum upload sizes per endpoint, in bytes
+MAX_CERTIFICATE_UPLOAD_BYTES = int(os.environ.get('MAX_CERTIFICATE_UPLOAD_BYTES', 10 * 1024 * 1024))
+MAX_EULOGY_UPLOAD_BYTES = int(os.environ.get('MAX_EULOGY_UPLOAD_BYTES', 25 * 1024 * 1024))
+MAX_DOWNLOAD_UPLOAD_BYTES = int(os.environ.get('MAX_DOWNLOAD_UPLOAD_BYTES', 100 * 1024 * 1024))
+MAX_BULK_CERTIFICATE_UPLOAD_BYTES = int(os.environ.get('MAX_BULK_CERTIFICATE_UPLOAD_BYTES', 1024 * 1024 * 1024))
+# Certificates from a bulk ZIP upload written to the blob store at once
+BULK_CERTIFICATE_CONCURRENCY = int(os.environ.get('BULK_CERTIFICATE_CONCURRENCY', 4))
+# Store compressible uploads gzip/zstd-compressed when a sample shows a saving
+BLOB_COMPRESSION = os.environ.get('BLOB_COMPRESSION', 'true').lower() == 'true'
+# How stored files reach the client once auth and bookkeeping are done:
+#   "stream"           - FileResponse from the blob path (sendfile/pathsend where
+#                        the server supports it)
+#   "x-accel-redirect" - empty response with X-Accel-Redirect for nginx, e.g.
+#                          location /protected-blobs/ { internal; alias /app/backend/uploads/blobs/; }
+#   "x-sendfile"       - empty response with X-Sendfile for Apache/lighttpd
+# In the offload modes, blobs stored compressed are still decompressed and streamed by the app
+FILE_SERVING_MODE = os.environ.get('FILE_SERVING_MODE', 'stream')
+X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX', '/protected-blobs')
+if FILE_SERVING_MODE not in ("stream", "x-accel-redirect", "x-sendfile"):
+    raise RuntimeError(f"Unknown FILE_SERVING_MODE: {FILE_SERVING_MODE}")
+# In-memory LRU of hot blob bytes used by the "stream" serving mode
+BLOB_CACHE_MAX_BYTES = int(os.environ.get('BLOB_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+BLOB_CACHE_MAX_OBJECT_BYTES = int(os.environ.get('BLOB_CACHE_MAX_OBJECT_BYTES', 16 * 1024 * 1024))
+# Concurrency limits per route class as "limit:queue:max_wait_seconds".
+# Requests beyond limit + queue, or waiting longer than max_wait, get 503.
+def concurrency_setting(name: str, default: str):
+    limit, queue, max_wait = os.environ.get(f'CONCURRENCY_{name.upper()}', default).split(':')
+    return int(limit), int(queue), float(max_wait)
+
+CONCURRENCY_LIMITS = {
+    "auth": concurrency_setting("auth", f"{os.cpu_count() or 2}:64:5"),
+    "file_upload": concurrency_setting("file_upload", "4:16:10"),
+    "file_download": concurrency_setting("file_download", "32:128:10"),
+    "admin_listing": concurrency_setting("admin_listing", "8:32:5"),
+    "public_listing": concurrency_setting("public_listing", "64:256:2"),
+    "export": concurrency_setting("export", "2:4:5")
+}
+# Resumable uploads to the downloads library: chunk size, maximum file size and
+# how long an untouched upload session is kept before it is garbage-collected
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+MAX_RESUMABLE_UPLOAD_BYTES = int(os.environ.get('MAX_RESUMABLE_UPLOAD_BYTES', 2 * 1024 * 1024 * 1024))
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+# Allowance for multipart boundaries and form fields on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Certificate generation fills this template for every eligible student,
+# rendering PDFs in RENDER_WORKERS worker processes
+CERTIFICATE_TEMPLATE = Path(os.environ.get('CERTIFICATE_TEMPLATE', ROOT_DIR.parent / "images" / "template.pdf"))
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+# Background jobs run concurrently per process, and a running job whose
+# process has not heartbeated for JOB_STALE_SECONDS is requeued
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 60))
+
+# Prometheus metrics are served at /metrics to scrapers presenting this bearer
+# token; the endpoint is disabled while it is unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Each uvicorn worker keeps its own metrics. When METRICS_DIR is set, workers
+# write them there every METRICS_WRITE_INTERVAL seconds and /metrics reports
+# their sum (gauges per worker), whichever worker answers the scrape. Use a
+# directory no other deployment shares and empty it before starting the server.
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_WRITE_INTERVAL = float(os.environ.get('METRICS_WRITE_INTERVAL', 5))
+# MongoDB commands slower than this are logged with their route and query plan
+MONGO_SLOW_QUERY_MS = float(os.environ.get('MONGO_SLOW_QUERY_MS', 100))
+# Requests are traced when sampled (TRACE_SAMPLE_RATE of them) or made by an
+# admin while TRACE_ADMIN_SERVER_TIMING is on. Those requests get a
+# Server-Timing header and, when TRACE_EXPORT_FILE is set, are appended to it
+# as OTLP/JSON lines. Admin timing records every request until it is known
+# whether an admin made it, so it is off unless being used for diagnosis
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0))
+TRACE_ADMIN_SERVER_TIMING = os.environ.get('TRACE_ADMIN_SERVER_TIMING', 'false').lower() == 'true'
+TRACE_EXPORT_FILE = os.environ.get('TRACE_EXPORT_FILE') or None
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+mongo_listener = MongoCommandListener(slow_ms=MONGO_SLOW_QUERY_MS)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_listener])
 db = client[os.environ['DB_NAME']]
 
+tracer = Tracer(
+    sample_rate=TRACE_SAMPLE_RATE,
+    admin_timing=TRACE_ADMIN_SERVER_TIMING,
+    export_path=TRACE_EXPORT_FILE
+)
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=TracedJSONResponse)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TracedRoute)
 
 # Security
 security = HTTPBearer()
 
+bcrypt_duration = REGISTRY.histogram(
+    "bcrypt_duration_seconds", "Time spent hashing or checking a password", ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)
+)
+blob_bytes_served = REGISTRY.counter(
+    "blob_bytes_served_total", "Stored file bytes sent, by how they were served", ["source"]
+)
+cache_hit_ratio = REGISTRY.gauge(
+    "cache_hit_ratio", "Share of lookups served from cache since start, updated when metrics are collected", ["cache"]
+)
+shared_metrics = MultiprocessCollector(REGISTRY, METRICS_DIR) if METRICS_DIR else None
+
+# Serialized bodies of the public listings, invalidated by admin writes
+public_listing_cache = ResponseCache("public_listings", ttl=PUBLIC_LISTING_TTL)
+
+# Concurrent identical requests to hot public endpoints share one DB read
+public_flight = SingleFlight("public")
+
+# Concurrent requests for the same transcript share one render
+transcript_flight = SingleFlight("transcripts")
+
+invalidation_bus = InvalidationBus(db, max_staleness=CACHE_MAX_STALENESS) if CACHE_INVALIDATION_BUS else None
+if invalidation_bus is not None:
+    invalidation_bus.register(public_listing_cache)
+
 # Ensure uploads directory exists
 UPLOAD_DIR = Path(ROOT_DIR) / "uploads" / "certificates"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
@@ -47,6 +211,23 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 EULOGY_DIR = Path(ROOT_DIR) / "uploads" / "eulogies"
 EULOGY_DIR.mkdir(parents=True, exist_ok=True)
 
+# Uploaded files, stored once per SHA-256 and reference counted in db.blobs
+BLOB_DIR = Path(ROOT_DIR) / "uploads" / "blobs"
+blob_store = BlobStore(BLOB_DIR, db.blobs, compress=BLOB_COMPRESSION)
+blob_cache = BlobCache(BLOB_CACHE_MAX_BYTES, BLOB_CACHE_MAX_OBJECT_BYTES)
+
+# Worker processes for PDF rendering. Workers are spawned rather than forked
+# so they do not inherit the Mongo client's threads.
+render_pool = ProcessPoolExecutor(
+    max_workers=RENDER_WORKERS,
+    mp_context=multiprocessing.get_context("spawn"),
+    initializer=init_worker,
+    initargs=(str(CERTIFICATE_TEMPLATE),)
+)
+
+# Heavy admin operations run as jobs persisted in db.jobs
+job_runner = JobRunner(db.jobs, workers=JOB_WORKERS, stale_after=JOB_STALE_SECONDS)
+
 # =============================
 # MODELS
 # =============================
@@ -119,16 +300,25 @@ class FinanceRecord(BaseModel):
 
 class Certificate(BaseModel):
     filename: str
-    file_data: str  # base64 encoded
+    file_data: Optional[str] = None  # base64 encoded, legacy uploads only
+    sha256: Optional[str] = None  # blob store key
+    size: Optional[int] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     uploaded_by: str  # admin user id
 
+class Transcript(BaseModel):
+    sha256: str  # blob store key
+    size: int
+    rendered_for: datetime  # the student's updated_at when rendered
+
 class Eulogy(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
     description: Optional[str] = None
     filename: str
-    file_data: str  # base64 encoded
+    file_data: Optional[str] = None  # base64 encoded, legacy uploads only
+    sha256: Optional[str] = None  # blob store key
+    size: Optional[int] = None
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     expires_at: datetime = Field(default_factory=lambda: datetime.utcnow() + timedelta(days=7))
     uploaded_by: str  # admin user id
@@ -153,7 +343,9 @@ class DownloadFile(BaseModel):
     title: str
     description: Optional[str] = None
     filename: str
-    file_data: str  # base64 encoded
+    file_data: Optional[str] = None  # base64 encoded, legacy uploads only
+    sha256: Optional[str] = None  # blob store key
+    size: Optional[int] = None
     file_type: str  # "private" or "public"
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     uploaded_by: str  # admin user id
@@ -175,6 +367,76 @@ class DownloadFileResponse(BaseModel):
     download_count: int
     is_active: bool
 
+class UploadSessionCreate(BaseModel):
+    title: str
+    description: Optional[str] = None
+    file_type: str = "public"  # "private" or "public"
+    filename: str
+    size: int = Field(..., gt=0)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-f]{64}$")  # checked on complete when given
+
+class UploadSession(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    title: str
+    description: Optional[str] = None
+    file_type: str
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int] = []
+    status: str = "open"  # "open" or "completing"
+    created_by: str  # admin user id
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    filename: str
+    size: int
+    chunk_size: int
+    total_chunks: int
+    next_chunk: int
+    committed_offset: int
+    received_chunks: List[int]
+
+class SignedFileLink(BaseModel):
+    url: str
+    expires_at: datetime
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    params: dict = {}
+    status: str  # "queued", "running", "done" or "failed"
+    progress: Dict[str, int] = {}
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_by: Optional[str] = None  # admin user id
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class CertificateGenerationRequest(BaseModel):
+    regenerate: bool = False  # also replace existing certificates
+
+class BulkCertificateMatch(BaseModel):
+    filename: str
+    id_number: str
+    student_id: str
+
+class BulkCertificateFailure(BaseModel):
+    filename: str
+    error: str
+
+class BulkCertificateReport(BaseModel):
+    matched: List[BulkCertificateMatch] = []
+    unmatched: List[str] = []  # PDFs whose name is not a student's id_number
+    skipped: List[str] = []  # entries that are not PDFs
+    failed: List[BulkCertificateFailure] = []
+
 class PasswordResetRecord(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     student_username: str
@@ -203,6 +465,12 @@ class Student(BaseModel):
     academic_record: Optional[AcademicRecord] = None
     finance_record: Optional[FinanceRecord] = Field(default_factory=FinanceRecord)
     certificate: Optional[Certificate] = None
+    transcript: Optional[Transcript] = None  # last rendered transcript PDF
+    # Derived fields, recomputed by STUDENT_DERIVED_FIELDS_STAGES on every
+    # academic, finance and certificate write
+    average_score: Optional[float] = None
+    has_certificate: bool = False
+    certificate_eligible: bool = False  # passed and fees cleared
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -247,15 +515,44 @@ class StudentResponse(BaseModel):
     can_download_certificate: bool = False
     average_score: Optional[float] = None
 
+class StudentSummary(BaseModel):
+    id: str
+    username: str
+    full_name: str
+    id_number: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    average_score: Optional[float] = None
+    balance: float = 0.0
+    is_cleared: bool = False
+    has_certificate: bool = False
+    certificate_eligible: bool = False
+
+class StudentWorklistPage(BaseModel):
+    items: List[StudentSummary]
+    total: int
+    skip: int
+    limit: int
+
 # =============================
 # UTILITY FUNCTIONS
 # =============================
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    start = time.perf_counter()
+    try:
+        with span("bcrypt.hash"):
+            return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    finally:
+        bcrypt_duration.observe(time.perf_counter() - start, operation="hash")
 
 def verify_password(password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    start = time.perf_counter()
+    try:
+        with span("bcrypt.verify"):
+            return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    finally:
+        bcrypt_duration.observe(time.perf_counter() - start, operation="verify")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -267,6 +564,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def file_signature(sha256: str, filename: str, media_type: str, expires: int) -> str:
+    message = f"{sha256}\n{filename}\n{media_type}\n{expires}".encode('utf-8')
+    digest = hmac.new(SIGNED_URL_SECRET.encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode('utf-8').rstrip("=")
+
+def create_signed_file_link(stored: dict, filename: str, media_type: str) -> SignedFileLink:
+    if not stored.get("sha256"):
+        raise HTTPException(status_code=409, detail="File is not available as a direct link")
+    
+    expires_at = datetime.utcnow() + timedelta(seconds=SIGNED_URL_TTL_SECONDS)
+    expires = int((expires_at - datetime(1970, 1, 1)).total_seconds())
+    signature = file_signature(stored["sha256"], filename, media_type, expires)
+    url = (
+        f"/api/files/{stored['sha256']}/{quote(filename)}"
+        f"?type={quote(media_type, safe='')}&expires={expires}&signature={signature}"
+    )
+    return SignedFileLink(url=url, expires_at=expires_at)
+
 def generate_reset_code() -> str:
     return ''.join(random.choices(string.digits, k=6))
 
@@ -288,20 +603,189 @@ def calculate_average_score(academic_record: Optional[AcademicRecord]) -> Option
     
     return sum(valid_scores) / len(valid_scores)
 
+# Aggregation stages that recompute the derived student fields from the stored
+# academic, finance and certificate data. They are appended to every update
+# that touches those records so the derived fields change in the same atomic
+# write. $avg skips missing scores, and a null average compares lower than any
+# number, so students without scores are never eligible.
+STUDENT_DERIVED_FIELDS_STAGES = [
+    {"$set": {
+        "average_score": {"$avg": [
+            "$academic_record.ms_word",
+            "$academic_record.ms_excel",
+            "$academic_record.ms_powerpoint",
+            "$academic_record.ms_access",
+            "$academic_record.computer_intro"
+        ]},
+        "has_certificate": {"$eq": [{"$type": "$certificate"}, "object"]}
+    }},
+    {"$set": {
+        "certificate_eligible": {"$and": [
+            {"$gte": ["$average_score", CERTIFICATE_PASS_MARK]},
+            {"$eq": ["$finance_record.is_cleared", True]}
+        ]}
+    }}
+]
+
+def student_update_pipeline(fields: dict) -> list:
+    """Build an update pipeline that sets `fields` and refreshes derived fields."""
+    return [
+        {"$set": {key: {"$literal": value} for key, value in fields.items()}},
+        *STUDENT_DERIVED_FIELDS_STAGES
+    ]
+
+async def invalidate_cached(cache: ResponseCache, key: str):
+    """Invalidate a cache key in this worker and, with the bus enabled, in all workers."""
+    if invalidation_bus is not None:
+        await invalidation_bus.publish(cache, key)
+    else:
+        cache.invalidate(key)
+
+async def backfill_student_derived_fields(query: Optional[dict] = None) -> int:
+    """Recompute derived fields on every student document matching `query`."""
+    result = await db.students.update_many(query or {}, STUDENT_DERIVED_FIELDS_STAGES)
+    return result.modified_count
+
+# Admin worklists: name -> (filter, sort). Each filter is an equality/range
+# match served by one of the indexes created in ensure_indexes().
+STUDENT_WORKLISTS = {
+    "eligible-without-certificate": (
+        {"certificate_eligible": True, "has_certificate": False},
+        [("full_name", 1)]
+    ),
+    "passed-with-balance": (
+        {"finance_record.is_cleared": False, "average_score": {"$gte": CERTIFICATE_PASS_MARK}},
+        [("average_score", -1)]
+    ),
+    "certificate-not-eligible": (
+        {"certificate_eligible": False, "has_certificate": True},
+        [("full_name", 1)]
+    )
+}
+
+STUDENT_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "user_id": 1,
+    "full_name": 1,
+    "id_number": 1,
+    "email": 1,
+    "phone": 1,
+    "average_score": 1,
+    "has_certificate": 1,
+    "certificate_eligible": 1,
+    "finance_record.balance": 1,
+    "finance_record.is_cleared": 1
+}
+
+# Columns offered by /admin/export/students: column -> document path.
+# "username" is looked up from user_id once per batch.
+STUDENT_EXPORT_FIELDS = {
+    "id": "id",
+    "username": "user_id",
+    "full_name": "full_name",
+    "id_number": "id_number",
+    "email": "email",
+    "phone": "phone",
+    "ms_word": "academic_record.ms_word",
+    "ms_excel": "academic_record.ms_excel",
+    "ms_powerpoint": "academic_record.ms_powerpoint",
+    "ms_access": "academic_record.ms_access",
+    "computer_intro": "academic_record.computer_intro",
+    "average_score": "average_score",
+    "total_fees": "finance_record.total_fees",
+    "paid_amount": "finance_record.paid_amount",
+    "balance": "finance_record.balance",
+    "payment_reference": "finance_record.payment_reference",
+    "last_payment_date": "finance_record.last_payment_date",
+    "is_cleared": "finance_record.is_cleared",
+    "certificate_eligible": "certificate_eligible",
+    "has_certificate": "has_certificate",
+    "created_at": "created_at"
+}
+EXPORT_BATCH_SIZE = 1000
+
+async def migrate_legacy_files() -> int:
+    """Move base64 file_data from documents into the blob store.
+    
+    Soft-deleted downloads are never served and never release a blob, so
+    their file_data is dropped instead of being stored.
+    """
+    await db.downloads.update_many(
+        {"is_active": {"$ne": True}, "file_data": {"$type": "string"}},
+        {"$unset": {"file_data": ""}}
+    )
+    migrated = 0
+    for collection, field, query in (
+        (db.eulogies, "", {}),
+        (db.downloads, "", {"is_active": True}),
+        (db.students, "certificate.", {})
+    ):
+        cursor = collection.find(
+            {**query, f"{field}file_data": {"$type": "string"}},
+            {"_id": 1, f"{field}file_data": 1},
+            batch_size=10
+        )
+        async for document in cursor:
+            stored = document["certificate"] if field else document
+            
+            async def chunks(data=stored["file_data"]):
+                yield base64.b64decode(data)
+            
+            blob = await blob_store.write(chunks())
+            updated = await collection.update_one(
+                {**query, "_id": document["_id"]},
+                {
+                    "$set": {f"{field}sha256": blob.sha256, f"{field}size": blob.size},
+                    "$unset": {f"{field}file_data": ""}
+                }
+            )
+            if not updated.modified_count:
+                # Deleted while its file was being written
+                await blob_store.release(blob.sha256)
+                continue
+            migrated += 1
+    return migrated
+
+async def ensure_indexes():
+    await db.students.create_index(
+        [("certificate_eligible", 1), ("has_certificate", 1), ("full_name", 1)],
+        name="certificate_eligibility"
+    )
+    await db.students.create_index(
+        [("finance_record.is_cleared", 1), ("average_score", -1)],
+        name="finance_clearance"
+    )
+    await db.students.create_index("id_number", name="id_number")
+    await db.students.create_index(
+        [("has_certificate", 1), ("certificate.uploaded_at", 1)],
+        name="certificate_issued"
+    )
+    await db.upload_sessions.create_index("id", unique=True)
+    await db.upload_sessions.create_index("updated_at")
+    await db.jobs.create_index("id", unique=True)
+    await db.jobs.create_index([("status", 1), ("created_at", 1)])
+    await db.jobs.create_index([("kind", 1), ("created_at", -1)])
+    await db.jobs.create_index("created_at")
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    with span("auth"):
+        try:
+            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        except jwt.PyJWTError:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    
-    user = await db.users.find_one({"username": username})
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    
-    return User(**user)
+        
+        user = await db.users.find_one({"username": username})
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        
+        user = User(**user)
+    if user.role == "admin":
+        mark_admin()
+    return user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -315,7 +799,8 @@ async def get_admin_user(current_user: User = Depends(get_current_user)):
 @api_router.post("/auth/login", response_model=Token)
 async def login(user_credentials: UserLogin):
     user = await db.users.find_one({"username": user_credentials.username})
-    if not user or not verify_password(user_credentials.password, user["hashed_password"]):
+    # bcrypt runs in a worker thread so it does not stall the event loop
+    if not user or not await asyncio.to_thread(verify_password, user_credentials.password, user["hashed_password"]):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -358,7 +843,7 @@ async def reset_password(request: PasswordResetRequest):
         raise HTTPException(status_code=400, detail="Reset code has expired")
     
     # Update user password
-    hashed_password = hash_password(request.new_password)
+    hashed_password = await asyncio.to_thread(hash_password, request.new_password)
     await db.users.update_one(
         {"username": request.username},
         {"$set": {"hashed_password": hashed_password, "is_first_login": False}}
@@ -374,7 +859,7 @@ async def reset_password(request: PasswordResetRequest):
 
 @api_router.post("/auth/change-password")
 async def change_password(password_change: PasswordChange, current_user: User = Depends(get_current_user)):
-    hashed_password = hash_password(password_change.new_password)
+    hashed_password = await asyncio.to_thread(hash_password, password_change.new_password)
     await db.users.update_one(
         {"id": current_user.id},
         {"$set": {"hashed_password": hashed_password, "is_first_login": False}}
@@ -403,7 +888,7 @@ async def create_student(student_data: StudentCreate, admin_user: User = Depends
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Create user account
-    hashed_password = hash_password(student_data.password)
+    hashed_password = await asyncio.to_thread(hash_password, student_data.password)
     user = User(
         username=student_data.username,
         email=student_data.email,
@@ -428,7 +913,105 @@ async def create_student(student_data: StudentCreate, admin_user: User = Depends
 @api_router.get("/admin/students", response_model=List[StudentResponse])
 async def get_all_students(admin_user: User = Depends(get_admin_user)):
     students = await db.students.find().to_list(1000)
-    return [await get_student_response(Student(**student)) for student in students]
+    if FAST_SERIALIZATION:
+        usernames = await get_usernames([student["user_id"] for student in students])
+        return ORJSONResponse([
+            serialize_student(student, usernames.get(student["user_id"], "unknown"))
+            for student in students
+        ])
+    with span("pydantic"):
+        models = [Student(**student) for student in students]
+    return [await get_student_response(student) for student in models]
+
+@api_router.get("/admin/worklists/{worklist}", response_model=StudentWorklistPage)
+async def get_student_worklist(
+    worklist: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    admin_user: User = Depends(get_admin_user)
+):
+    if worklist not in STUDENT_WORKLISTS:
+        raise HTTPException(status_code=404, detail="Worklist not found")
+    
+    query, sort = STUDENT_WORKLISTS[worklist]
+    students = await db.students.find(query, STUDENT_SUMMARY_PROJECTION) \
+        .sort(sort).skip(skip).limit(limit).to_list(limit)
+    total = await db.students.count_documents(query)
+    
+    return StudentWorklistPage(
+        items=await get_student_summaries(students),
+        total=total,
+        skip=skip,
+        limit=limit
+    )
+
+@api_router.get("/admin/export/students")
+async def export_students(
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    fields: Optional[str] = None,
+    worklist: Optional[str] = None,
+    admin_user: User = Depends(get_admin_user)
+):
+    columns = fields.split(",") if fields else list(STUDENT_EXPORT_FIELDS)
+    unknown = [column for column in columns if column not in STUDENT_EXPORT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown export fields: {', '.join(unknown)}")
+    if worklist is not None and worklist not in STUDENT_WORKLISTS:
+        raise HTTPException(status_code=404, detail="Worklist not found")
+    
+    # Without a worklist, natural _id order avoids an in-memory sort
+    query, sort = STUDENT_WORKLISTS[worklist] if worklist else ({}, [("_id", 1)])
+    batches = student_export_rows(query, sort, columns)
+    filename = f"students-{worklist or 'all'}-{datetime.utcnow():%Y%m%d}.{format}"
+    if format == "xlsx":
+        return StreamingResponse(
+            xlsx_stream(columns, batches, sheet_name="Students"),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": content_disposition(filename)}
+        )
+    return StreamingResponse(
+        csv_stream(columns, batches),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
+
+@api_router.get("/admin/export/certificates")
+async def export_certificates(
+    eligible: Optional[bool] = None,
+    issued_from: Optional[datetime] = None,
+    issued_to: Optional[datetime] = None,
+    admin_user: User = Depends(get_admin_user)
+):
+    query = {"has_certificate": True, "certificate.sha256": {"$type": "string"}}
+    sort = [("_id", 1)]
+    if eligible is not None:
+        query["certificate_eligible"] = eligible
+        sort = [("full_name", 1)]
+    if issued_from or issued_to:
+        query["certificate.uploaded_at"] = {
+            **({"$gte": issued_from} if issued_from else {}),
+            **({"$lt": issued_to} if issued_to else {})
+        }
+    
+    filename = f"certificates-{datetime.utcnow():%Y%m%d}.zip"
+    return StreamingResponse(
+        zip_stream(certificate_zip_entries(query, sort)),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
+
+@api_router.get("/admin/export/transcripts")
+async def export_transcripts(worklist: Optional[str] = None, admin_user: User = Depends(get_admin_user)):
+    if worklist is not None and worklist not in STUDENT_WORKLISTS:
+        raise HTTPException(status_code=404, detail="Worklist not found")
+    
+    query, sort = STUDENT_WORKLISTS[worklist] if worklist else ({}, [("_id", 1)])
+    filename = f"transcripts-{worklist or 'all'}-{datetime.utcnow():%Y%m%d}.zip"
+    return StreamingResponse(
+        zip_stream(transcript_zip_entries(query, sort)),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(filename)}
+    )
 
 @api_router.get("/admin/students/{student_id}", response_model=StudentResponse)
 async def get_student(student_id: str, admin_user: User = Depends(get_admin_user)):
@@ -449,6 +1032,8 @@ async def delete_student(student_id: str, admin_user: User = Depends(get_admin_u
     
     # Delete the student profile
     await db.students.delete_one({"id": student_id})
+    await blob_store.release((student.get("certificate") or {}).get("sha256"))
+    await blob_store.release((student.get("transcript") or {}).get("sha256"))
     
     return {"message": "Student deleted successfully"}
 
@@ -486,7 +1071,7 @@ async def update_student_academic(
     
     await db.students.update_one(
         {"id": student_id},
-        {"$set": {"academic_record": update_data, "updated_at": datetime.utcnow()}}
+        student_update_pipeline({"academic_record": update_data, "updated_at": datetime.utcnow()})
     )
     return {"message": "Academic record updated successfully"}
 
@@ -521,7 +1106,7 @@ async def update_student_finance(
     
     await db.students.update_one(
         {"id": student_id},
-        {"$set": {"finance_record": update_dict, "updated_at": datetime.utcnow()}}
+        student_update_pipeline({"finance_record": update_dict, "updated_at": datetime.utcnow()})
     )
     return {"message": "Finance record updated successfully"}
 
@@ -535,22 +1120,155 @@ async def upload_certificate(
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Read file content and encode to base64
-    file_content = await file.read()
-    file_data = base64.b64encode(file_content).decode('utf-8')
+    blob = await store_upload(file, MAX_CERTIFICATE_UPLOAD_BYTES)
     
     certificate = Certificate(
         filename=file.filename,
-        file_data=file_data,
+        sha256=blob.sha256,
+        size=blob.size,
         uploaded_by=admin_user.id
     )
     
-    await db.students.update_one(
-        {"id": student_id},
-        {"$set": {"certificate": certificate.dict(), "updated_at": datetime.utcnow()}}
-    )
+    await attach_certificate({"id": student_id}, certificate)
     return {"message": "Certificate uploaded successfully"}
 
+@api_router.post("/admin/certificates/bulk", response_model=BulkCertificateReport)
+async def upload_certificates_bulk(file: UploadFile = File(...), admin_user: User = Depends(get_admin_user)):
+    try:
+        archive = await asyncio.to_thread(zipfile.ZipFile, file.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Upload is not a valid ZIP archive")
+    
+    report = BulkCertificateReport()
+    with archive:
+        entries: Dict[str, List[zipfile.ZipInfo]] = {}
+        for info in archive.infolist():
+            name = PurePosixPath(info.filename).name
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            if not name.lower().endswith(".pdf"):
+                report.skipped.append(info.filename)
+                continue
+            entries.setdefault(name[:-4].strip(), []).append(info)
+        
+        students = await get_students_by_id_number(list(entries))
+        slots = asyncio.Semaphore(BULK_CERTIFICATE_CONCURRENCY)
+        
+        async def attach(id_number: str, info: zipfile.ZipInfo, student_id: str):
+            async with slots:
+                try:
+                    blob = await store_zip_entry(archive, info, MAX_CERTIFICATE_UPLOAD_BYTES)
+                except (BlobTooLarge, zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError) as error:
+                    report.failed.append(BulkCertificateFailure(filename=info.filename, error=str(error)))
+                    return
+                certificate = Certificate(
+                    filename=PurePosixPath(info.filename).name,
+                    sha256=blob.sha256,
+                    size=blob.size,
+                    uploaded_by=admin_user.id
+                )
+                if await attach_certificate({"id": student_id}, certificate):
+                    report.matched.append(BulkCertificateMatch(
+                        filename=info.filename, id_number=id_number, student_id=student_id
+                    ))
+                else:
+                    report.unmatched.append(info.filename)
+        
+        tasks = []
+        for id_number, infos in entries.items():
+            matches = students.get(id_number, [])
+            if not matches:
+                report.unmatched.extend(info.filename for info in infos)
+            elif len(matches) > 1 or len(infos) > 1:
+                error = (
+                    "Several students share this ID number" if len(matches) > 1
+                    else "Several files in the archive name this ID number"
+                )
+                report.failed.extend(BulkCertificateFailure(filename=info.filename, error=error) for info in infos)
+            else:
+                tasks.append(attach(id_number, infos[0], matches[0]))
+        await asyncio.gather(*tasks)
+    
+    report.matched.sort(key=lambda match: match.filename)
+    report.unmatched.sort()
+    return report
+
+@api_router.post("/admin/certificates/generate", response_model=Job)
+async def start_certificate_generation(
+    generation: CertificateGenerationRequest,
+    admin_user: User = Depends(get_admin_user)
+):
+    if await db.jobs.find_one({"kind": "certificate_generation", "status": {"$in": ["queued", "running"]}}):
+        raise HTTPException(status_code=409, detail="Certificate generation is already running")
+    if not CERTIFICATE_TEMPLATE.is_file():
+        raise HTTPException(status_code=500, detail="Certificate template not found")
+
+    job = await job_runner.submit(
+        "certificate_generation", {"regenerate": generation.regenerate}, created_by=admin_user.id
+    )
+    return Job(**job)
+
+@api_router.get("/admin/jobs", response_model=List[Job])
+async def get_jobs(
+    kind: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin_user: User = Depends(get_admin_user)
+):
+    query = {}
+    if kind:
+        query["kind"] = kind
+    if status:
+        query["status"] = status
+    jobs = await db.jobs.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+    return [Job(**job) for job in jobs]
+
+@api_router.get("/admin/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, admin_user: User = Depends(get_admin_user)):
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(**job)
+
+@api_router.get("/admin/storage/stats")
+async def get_storage_stats(admin_user: User = Depends(get_admin_user)):
+    stats = await blob_store.stats()
+    stats["cache"] = blob_cache.stats()
+    stats["legacy_documents"] = (
+        await db.eulogies.count_documents({"file_data": {"$type": "string"}}) +
+        await db.downloads.count_documents({"file_data": {"$type": "string"}}) +
+        await db.students.count_documents({"certificate.file_data": {"$type": "string"}})
+    )
+    return stats
+
+@api_router.get("/admin/metrics")
+async def get_metrics(admin_user: User = Depends(get_admin_user)):
+    return REGISTRY.snapshot()
+
+def update_cache_hit_ratios():
+    cache_hit_ratio.set(blob_cache.stats()["hit_ratio"], cache="blobs")
+    hits = cache_requests.value(cache=public_listing_cache.name, result="hit")
+    lookups = hits + cache_requests.value(cache=public_listing_cache.name, result="miss")
+    cache_hit_ratio.set(hits / lookups if lookups else 0.0, cache=public_listing_cache.name)
+
+@api_router.get("/admin/mongo/stats")
+async def get_mongo_stats(admin_user: User = Depends(get_admin_user)):
+    return mongo_listener.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_prometheus_metrics(request: Request):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    
+    update_cache_hit_ratios()
+    if shared_metrics is not None:
+        content = await asyncio.to_thread(shared_metrics.render)
+    else:
+        content = REGISTRY.render()
+    return Response(content=content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @api_router.get("/admin/password-resets", response_model=List[PasswordResetResponse])
 async def get_password_reset_requests(admin_user: User = Depends(get_admin_user)):
     resets = await db.password_resets.find({"status": "pending"}).to_list(1000)
@@ -587,24 +1305,28 @@ async def upload_eulogy(
     file: UploadFile = File(...),
     admin_user: User = Depends(get_admin_user)
 ):
-    # Read file content and encode to base64
-    file_content = await file.read()
-    file_data = base64.b64encode(file_content).decode('utf-8')
+    blob = await store_upload(file, MAX_EULOGY_UPLOAD_BYTES)
     
     eulogy = Eulogy(
         title=title,
         description=description,
         filename=file.filename,
-        file_data=file_data,
+        sha256=blob.sha256,
+        size=blob.size,
         uploaded_by=admin_user.id
     )
     
     await db.eulogies.insert_one(eulogy.dict())
+    await invalidate_cached(public_listing_cache, "eulogies")
     return {"message": "Eulogy uploaded successfully", "id": eulogy.id}
 
 @api_router.get("/admin/eulogies", response_model=List[EulogyResponse])
 async def get_all_eulogies_admin(admin_user: User = Depends(get_admin_user)):
-    eulogies = await db.eulogies.find().to_list(1000)
+    eulogies = await db.eulogies.find({}, LISTING_PROJECTION).to_list(1000)
+    if FAST_SERIALIZATION:
+        current_time = datetime.utcnow()
+        return ORJSONResponse([serialize_eulogy(eulogy, current_time) for eulogy in eulogies])
+    
     result = []
     for eulogy in eulogies:
         days_remaining = max(0, (eulogy["expires_at"] - datetime.utcnow()).days)
@@ -616,7 +1338,10 @@ async def get_all_eulogies_admin(admin_user: User = Depends(get_admin_user)):
 
 @api_router.delete("/admin/eulogies/{eulogy_id}")
 async def delete_eulogy(eulogy_id: str, admin_user: User = Depends(get_admin_user)):
-    await db.eulogies.delete_one({"id": eulogy_id})
+    eulogy = await db.eulogies.find_one_and_delete({"id": eulogy_id}, projection={"sha256": 1})
+    if eulogy:
+        await blob_store.release(eulogy.get("sha256"))
+    await invalidate_cached(public_listing_cache, "eulogies")
     return {"message": "Eulogy deleted successfully"}
 
 # =============================
@@ -637,51 +1362,216 @@ async def upload_download_file(
     if file_type not in ["public", "private"]:
         raise HTTPException(status_code=400, detail="File type must be 'public' or 'private'")
     
-    # Read file content and encode to base64
-    file_content = await file.read()
-    file_data = base64.b64encode(file_content).decode('utf-8')
+    blob = await store_upload(file, MAX_DOWNLOAD_UPLOAD_BYTES)
     
     download_file = DownloadFile(
         title=title,
         description=description,
         filename=file.filename,
-        file_data=file_data,
+        sha256=blob.sha256,
+        size=blob.size,
         file_type=file_type,
         uploaded_by=admin_user.id
     )
     
     await db.downloads.insert_one(download_file.dict())
+    await invalidate_cached(public_listing_cache, "downloads")
     return {"message": "File uploaded successfully", "id": download_file.id}
 
 @api_router.get("/admin/downloads", response_model=List[DownloadFileResponse])
 async def get_all_downloads_admin(admin_user: User = Depends(get_admin_user)):
-    downloads = await db.downloads.find({"is_active": True}).to_list(1000)
+    downloads = await db.downloads.find({"is_active": True}, LISTING_PROJECTION).to_list(1000)
+    if FAST_SERIALIZATION:
+        return ORJSONResponse([serialize_download(download) for download in downloads])
     return [DownloadFileResponse(**download) for download in downloads]
 
 @api_router.delete("/admin/downloads/{download_id}")
 async def delete_download_file(download_id: str, admin_user: User = Depends(get_admin_user)):
-    await db.downloads.update_one(
-        {"id": download_id},
-        {"$set": {"is_active": False}}
+    download = await db.downloads.find_one_and_update(
+        {"id": download_id, "is_active": True},
+        {"$set": {"is_active": False}},
+        projection={"sha256": 1}
     )
+    if download:
+        # Inactive downloads can never be served again, so drop the blob reference
+        await blob_store.release(download.get("sha256"))
+    await invalidate_cached(public_listing_cache, "downloads")
     return {"message": "Download file deleted successfully"}
 
+# Resumable uploads: create a session, PUT numbered chunks (in any order, any
+# number of times), GET the session for the committed offset, then complete.
+# Complete checks the assembled file against the declared size and, when the
+# session was created with one, its SHA-256.
+
+UPLOAD_SESSION_DIR = Path(ROOT_DIR) / "uploads" / "sessions"
+UPLOAD_SESSION_DIR.mkdir(parents=True, exist_ok=True)
+
+@api_router.post("/admin/downloads/uploads", response_model=UploadSessionResponse)
+async def create_upload_session(
+    session_data: UploadSessionCreate,
+    admin_user: User = Depends(get_admin_user)
+):
+    if session_data.file_type not in ["public", "private"]:
+        raise HTTPException(status_code=400, detail="File type must be 'public' or 'private'")
+    if session_data.size > MAX_RESUMABLE_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the maximum size of {MAX_RESUMABLE_UPLOAD_BYTES} bytes")
+    
+    session = UploadSession(
+        **session_data.dict(),
+        chunk_size=UPLOAD_CHUNK_SIZE,
+        total_chunks=math.ceil(session_data.size / UPLOAD_CHUNK_SIZE),
+        created_by=admin_user.id
+    )
+    (UPLOAD_SESSION_DIR / session.id).mkdir(parents=True, exist_ok=True)
+    await db.upload_sessions.insert_one(session.dict())
+    return upload_session_response(session)
+
+@api_router.get("/admin/downloads/uploads/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(session_id: str, admin_user: User = Depends(get_admin_user)):
+    return upload_session_response(await get_open_upload_session(session_id))
+
+@api_router.put("/admin/downloads/uploads/{session_id}/chunks/{index}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    admin_user: User = Depends(get_admin_user)
+):
+    session = await get_open_upload_session(session_id)
+    if index < 0 or index >= session.total_chunks:
+        raise HTTPException(status_code=400, detail=f"Chunk index must be between 0 and {session.total_chunks - 1}")
+    
+    expected_size = min(session.chunk_size, session.size - index * session.chunk_size)
+    chunk_path = UPLOAD_SESSION_DIR / session.id / f"{index:06d}"
+    staging_path = chunk_path.with_name(f"{chunk_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        written = await write_file(staging_path, request.stream(), max_bytes=expected_size)
+    except BlobTooLarge:
+        raise HTTPException(status_code=413, detail=f"Chunk {index} must be {expected_size} bytes")
+    try:
+        if written != expected_size:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected_size} bytes")
+        # A received chunk is never replaced, so complete can read the chunks
+        # without racing a retried PUT; a repeat of a chunk is acknowledged as is
+        try:
+            os.link(staging_path, chunk_path)
+        except FileExistsError:
+            pass
+    finally:
+        staging_path.unlink(missing_ok=True)
+    
+    updated = await db.upload_sessions.find_one_and_update(
+        {"id": session.id, "status": "open"},
+        {"$addToSet": {"received_chunks": index}, "$set": {"updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=409, detail="Upload session is no longer accepting chunks")
+    return upload_session_response(UploadSession(**updated))
+
+@api_router.post("/admin/downloads/uploads/{session_id}/complete")
+async def complete_upload_session(session_id: str, admin_user: User = Depends(get_admin_user)):
+    session = await get_open_upload_session(session_id)
+    missing = sorted(set(range(session.total_chunks)) - set(session.received_chunks))
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Missing chunks: {missing[:20]}")
+    
+    # Claim the session so a repeated complete request cannot create a second file
+    claimed = await db.upload_sessions.find_one_and_update(
+        {"id": session.id, "status": "open"},
+        {"$set": {"status": "completing", "updated_at": datetime.utcnow()}}
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Upload session is already being completed")
+    
+    session_dir = UPLOAD_SESSION_DIR / session.id
+    
+    async def chunks():
+        for index in range(session.total_chunks):
+            async for data in iter_file(session_dir / f"{index:06d}"):
+                yield data
+    
+    blob = None
+    mismatch = None
+    try:
+        try:
+            blob = await blob_store.write(chunks(), max_bytes=session.size)
+        except BlobTooLarge:
+            mismatch = "size"
+        else:
+            if blob.size != session.size:
+                mismatch = "size"
+            elif session.sha256 is not None and blob.sha256 != session.sha256:
+                mismatch = "SHA-256"
+        
+        if mismatch is None:
+            download_file = DownloadFile(
+                title=session.title,
+                description=session.description,
+                filename=session.filename,
+                sha256=blob.sha256,
+                size=blob.size,
+                file_type=session.file_type,
+                uploaded_by=admin_user.id
+            )
+            await db.downloads.insert_one(download_file.dict())
+    except BaseException:
+        # Reopen the session so the client can retry, resume or abort it
+        if blob is not None:
+            await blob_store.release(blob.sha256)
+        await db.upload_sessions.update_one(
+            {"id": session.id, "status": "completing"},
+            {"$set": {"status": "open", "updated_at": datetime.utcnow()}}
+        )
+        raise
+    await remove_upload_session(session.id)
+    if mismatch is not None:
+        # Received chunks are never replaced, so the session cannot be repaired
+        if blob is not None:
+            await blob_store.release(blob.sha256)
+        raise HTTPException(
+            status_code=422,
+            detail=f"Uploaded file does not match the declared {mismatch}; start a new upload"
+        )
+    await invalidate_cached(public_listing_cache, "downloads")
+    return {"message": "File uploaded successfully", "id": download_file.id}
+
+@api_router.delete("/admin/downloads/uploads/{session_id}")
+async def abort_upload_session(session_id: str, admin_user: User = Depends(get_admin_user)):
+    await get_open_upload_session(session_id)
+    await remove_upload_session(session_id)
+    return {"message": "Upload session cancelled"}
+
 # =============================
 # PUBLIC DOWNLOADS ROUTES  
 # =============================
 
 @api_router.get("/downloads", response_model=List[DownloadFileResponse])
-async def get_public_downloads():
+async def get_public_downloads(request: Request):
+    cached = public_listing_cache.get("downloads")
+    if cached is None:
+        version = public_listing_cache.version("downloads")
+        cached = await public_flight.do(
+            ("downloads", version),
+            lambda: load_public_downloads(version)
+        )
+    return public_listing_response(request, cached)
+
+async def load_public_downloads(version: int) -> CachedResponse:
     # Get only active public downloads
     downloads = await db.downloads.find({
         "is_active": True,
         "file_type": "public"
-    }).to_list(1000)
+    }, LISTING_PROJECTION).to_list(1000)
     
-    return [DownloadFileResponse(**download) for download in downloads]
+    return public_listing_cache.set(
+        "downloads",
+        orjson.dumps([serialize_download(download) for download in downloads]),
+        version=version
+    )
 
 @api_router.get("/downloads/{download_id}")
-async def download_file(download_id: str):
+async def download_file(download_id: str, request: Request):
     download = await db.downloads.find_one({"id": download_id, "is_active": True})
     if not download:
         raise HTTPException(status_code=404, detail="Download not found")
@@ -696,22 +1586,16 @@ async def download_file(download_id: str):
         {"$inc": {"download_count": 1}}
     )
     
-    # Decode base64 file data
-    file_data = base64.b64decode(download["file_data"])
-    
-    # Create a temporary file
-    temp_file = DOWNLOADS_DIR / f"temp_{download_id}_{download['filename']}"
-    with open(temp_file, "wb") as f:
-        f.write(file_data)
-    
-    return FileResponse(
-        path=temp_file,
+    return await stored_file_response(
+        request,
+        download,
+        temp_file=DOWNLOADS_DIR / f"temp_{download_id}_{download['filename']}",
         filename=download["filename"],
         media_type="application/octet-stream"
     )
 
 @api_router.get("/downloads/private/{download_id}")
-async def download_private_file(download_id: str, current_user: User = Depends(get_current_user)):
+async def download_private_file(download_id: str, request: Request, current_user: User = Depends(get_current_user)):
     download = await db.downloads.find_one({"id": download_id, "is_active": True})
     if not download:
         raise HTTPException(status_code=404, detail="Download not found")
@@ -726,20 +1610,50 @@ async def download_private_file(download_id: str, current_user: User = Depends(g
         {"$inc": {"download_count": 1}}
     )
     
-    # Decode base64 file data
-    file_data = base64.b64decode(download["file_data"])
-    
-    # Create a temporary file
-    temp_file = DOWNLOADS_DIR / f"temp_{download_id}_{download['filename']}"
-    with open(temp_file, "wb") as f:
-        f.write(file_data)
-    
-    return FileResponse(
-        path=temp_file,
+    return await stored_file_response(
+        request,
+        download,
+        temp_file=DOWNLOADS_DIR / f"temp_{download_id}_{download['filename']}",
         filename=download["filename"],
         media_type="application/octet-stream"
     )
 
+@api_router.get("/downloads/private/{download_id}/link", response_model=SignedFileLink)
+async def get_private_file_link(download_id: str, current_user: User = Depends(get_current_user)):
+    download = await db.downloads.find_one({"id": download_id, "is_active": True}, LISTING_PROJECTION)
+    if not download:
+        raise HTTPException(status_code=404, detail="Download not found")
+    
+    # Check if user has access (students and admins can access private files)
+    if current_user.role not in ["admin", "student"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    link = create_signed_file_link(download, download["filename"], "application/octet-stream")
+    
+    # Increment download count
+    await db.downloads.update_one(
+        {"id": download_id},
+        {"$inc": {"download_count": 1}}
+    )
+    return link
+
+@api_router.get("/files/{sha256}/{filename:path}")
+async def get_signed_file(
+    sha256: str,
+    filename: str,
+    request: Request,
+    type: str = Query(...),
+    expires: int = Query(...),
+    signature: str = Query(...)
+):
+    expected = file_signature(sha256, filename, type, expires)
+    if not hmac.compare_digest(expected, signature):
+        raise HTTPException(status_code=403, detail="Invalid file link")
+    if datetime.utcnow() > datetime(1970, 1, 1) + timedelta(seconds=expires):
+        raise HTTPException(status_code=403, detail="File link has expired")
+    
+    return await blob_response(request, sha256, filename, type)
+
 # =============================
 # STUDENT ROUTES
 # =============================
@@ -769,8 +1683,44 @@ async def update_parent_contacts(
     )
     return {"message": "Parent contacts updated successfully"}
 
+@api_router.get("/student/transcript.pdf")
+async def download_transcript(current_user: User = Depends(get_current_user)):
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Student access required")
+    
+    student = await db.students.find_one({"user_id": current_user.id}, TRANSCRIPT_PROJECTION)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student profile not found")
+    
+    return Response(
+        content=await transcript_pdf(student),
+        media_type="application/pdf",
+        headers={"Content-Disposition": content_disposition(f"transcript_{student['id_number']}.pdf")}
+    )
+
 @api_router.get("/student/certificate")
-async def download_certificate(current_user: User = Depends(get_current_user)):
+async def download_certificate(request: Request, current_user: User = Depends(get_current_user)):
+    student_obj = await get_downloadable_certificate(current_user)
+    
+    return await stored_file_response(
+        request,
+        student_obj.certificate.dict(),
+        temp_file=UPLOAD_DIR / f"temp_{student_obj.id}_{student_obj.certificate.filename}",
+        filename=student_obj.certificate.filename,
+        media_type="application/pdf"
+    )
+
+@api_router.get("/student/certificate/link", response_model=SignedFileLink)
+async def get_certificate_link(current_user: User = Depends(get_current_user)):
+    student_obj = await get_downloadable_certificate(current_user)
+    return create_signed_file_link(
+        student_obj.certificate.dict(),
+        student_obj.certificate.filename,
+        "application/pdf"
+    )
+
+async def get_downloadable_certificate(current_user: User) -> Student:
+    """Load the current student's profile, enforcing certificate eligibility."""
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Student access required")
     
@@ -784,26 +1734,14 @@ async def download_certificate(current_user: User = Depends(get_current_user)):
     if not student_obj.certificate:
         raise HTTPException(status_code=404, detail="No certificate available")
     
-    average_score = calculate_average_score(student_obj.academic_record)
-    if not average_score or average_score < 60:
+    average_score = student_obj.average_score
+    if not average_score or average_score < CERTIFICATE_PASS_MARK:
         raise HTTPException(status_code=403, detail="Average score must be 60% or above")
     
     if not student_obj.finance_record or not student_obj.finance_record.is_cleared:
         raise HTTPException(status_code=403, detail="Fees must be cleared")
     
-    # Decode base64 file data
-    file_data = base64.b64decode(student_obj.certificate.file_data)
-    
-    # Create a temporary file
-    temp_file = UPLOAD_DIR / f"temp_{student_obj.id}_{student_obj.certificate.filename}"
-    with open(temp_file, "wb") as f:
-        f.write(file_data)
-    
-    return FileResponse(
-        path=temp_file,
-        filename=student_obj.certificate.filename,
-        media_type="application/pdf"
-    )
+    return student_obj
 
 # =============================
 # PUBLIC ROUTES
@@ -818,26 +1756,44 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
 @api_router.get("/eulogies", response_model=List[EulogyResponse])
-async def get_public_eulogies():
+async def get_public_eulogies(request: Request):
+    cached = public_listing_cache.get("eulogies")
+    if cached is None:
+        version = public_listing_cache.version("eulogies")
+        cached = await public_flight.do(
+            ("eulogies", version),
+            lambda: load_public_eulogies(version)
+        )
+    return public_listing_response(request, cached)
+
+async def load_public_eulogies(version: int) -> CachedResponse:
     # Get only active eulogies that haven't expired
     current_time = datetime.utcnow()
     eulogies = await db.eulogies.find({
         "is_active": True,
         "expires_at": {"$gt": current_time}
-    }).to_list(1000)
+    }, LISTING_PROJECTION).to_list(1000)
     
-    result = []
-    for eulogy in eulogies:
-        days_remaining = max(0, (eulogy["expires_at"] - current_time).days)
-        result.append(EulogyResponse(
-            **eulogy,
-            days_remaining=days_remaining
-        ))
-    return result
+    # Never serve a eulogy from cache past its expiry
+    ttl = min(
+        [(eulogy["expires_at"] - current_time).total_seconds() for eulogy in eulogies],
+        default=None
+    )
+    return public_listing_cache.set(
+        "eulogies",
+        orjson.dumps([serialize_eulogy(eulogy, current_time) for eulogy in eulogies]),
+        ttl=ttl,
+        version=version
+    )
 
 @api_router.get("/eulogies/{eulogy_id}/download")
-async def download_eulogy(eulogy_id: str):
-    eulogy = await db.eulogies.find_one({"id": eulogy_id})
+async def download_eulogy(eulogy_id: str, request: Request):
+    # Eulogy files never change, so the listing version only needs to change on delete
+    version = public_listing_cache.version("eulogies")
+    eulogy = await public_flight.do(
+        ("eulogy_download", eulogy_id, version),
+        lambda: load_eulogy_download(eulogy_id)
+    )
     if not eulogy:
         raise HTTPException(status_code=404, detail="Eulogy not found")
     
@@ -845,63 +1801,624 @@ async def download_eulogy(eulogy_id: str):
     if not eulogy["is_active"] or datetime.utcnow() > eulogy["expires_at"]:
         raise HTTPException(status_code=410, detail="Eulogy has expired or is no longer available")
     
-    # Decode base64 file data
-    file_data = base64.b64decode(eulogy["file_data"])
-    
-    # Create a temporary file
-    temp_file = EULOGY_DIR / f"temp_{eulogy_id}_{eulogy['filename']}"
-    with open(temp_file, "wb") as f:
-        f.write(file_data)
-    
-    return FileResponse(
-        path=temp_file,
+    return await stored_file_response(
+        request,
+        eulogy,
+        temp_file=EULOGY_DIR / f"temp_{eulogy_id}_{eulogy['filename']}",
         filename=eulogy["filename"],
         media_type="application/pdf"
     )
 
+async def load_eulogy_download(eulogy_id: str) -> Optional[dict]:
+    eulogy = await db.eulogies.find_one({"id": eulogy_id})
+    if eulogy and eulogy.get("file_data"):
+        # Decode legacy base64 data once for every request sharing this flight
+        temp_file = EULOGY_DIR / f"temp_{eulogy_id}_{eulogy['filename']}"
+        data = eulogy.pop("file_data")
+        await asyncio.to_thread(temp_file.write_bytes, base64.b64decode(data))
+    return eulogy
+
 # =============================
 # HELPER FUNCTIONS
 # =============================
 
+# List endpoints never need the stored file contents
+LISTING_PROJECTION = {"_id": 0, "file_data": 0}
+
+# Defaults for nested records whose stored form may be partial (e.g. a
+# finance update that only sets paid_amount). Fields with a default_factory
+# (such as updated_at) are filled per record, as pydantic would, rather than
+# with a value frozen at import.
+RECORD_DEFAULTS = {
+    model: {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+    for model in (ParentContact, AcademicRecord, FinanceRecord)
+}
+RECORD_FACTORIES = {
+    model: {name: field.default_factory for name, field in model.model_fields.items() if field.default_factory}
+    for model in RECORD_DEFAULTS
+}
+
+# Trusted serializers: documents written by this API already match the
+# response models, so FAST_SERIALIZATION builds plain dicts for orjson.
+
+async def get_open_upload_session(session_id: str) -> UploadSession:
+    session = await db.upload_sessions.find_one({"id": session_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail="Upload session is being completed")
+    return UploadSession(**session)
+
+def upload_session_response(session: UploadSession) -> UploadSessionResponse:
+    received = set(session.received_chunks)
+    next_chunk = 0
+    while next_chunk in received:
+        next_chunk += 1
+    return UploadSessionResponse(
+        id=session.id,
+        filename=session.filename,
+        size=session.size,
+        chunk_size=session.chunk_size,
+        total_chunks=session.total_chunks,
+        next_chunk=next_chunk,
+        committed_offset=min(next_chunk * session.chunk_size, session.size),
+        received_chunks=sorted(received)
+    )
+
+async def remove_upload_session(session_id: str):
+    await db.upload_sessions.delete_one({"id": session_id})
+    await asyncio.to_thread(shutil.rmtree, UPLOAD_SESSION_DIR / session_id, True)
+
+async def purge_abandoned_upload_sessions() -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    sessions = await db.upload_sessions.find({"updated_at": {"$lt": cutoff}}, {"_id": 0, "id": 1}).to_list(None)
+    for session in sessions:
+        await remove_upload_session(session["id"])
+    return len(sessions)
+
+async def store_upload(file: UploadFile, max_bytes: int) -> StoredBlob:
+    """Stream an upload into the blob store in chunks, enforcing max_bytes."""
+    try:
+        return await blob_store.write_upload(file, max_bytes=max_bytes)
+    except BlobTooLarge as error:
+        raise HTTPException(status_code=413, detail=str(error))
+
+CERTIFICATE_FIELDS_PROJECTION = {
+    "_id": 0, "id": 1, "full_name": 1, "id_number": 1, "academic_record": 1, "average_score": 1
+}
+
+async def store_generated_certificate(student: dict, pdf: bytes, admin_id: str, regenerate: bool) -> bool:
+    """Attach a rendered certificate unless the student changed in the meantime."""
+    async def chunks():
+        yield pdf
+
+    blob = await blob_store.write(chunks())
+    certificate = Certificate(
+        filename=f"certificate_{student['id_number']}.pdf",
+        sha256=blob.sha256,
+        size=blob.size,
+        uploaded_by=admin_id
+    )
+    query = {"id": student["id"], "certificate_eligible": True}
+    if not regenerate:
+        query["has_certificate"] = False
+    return await attach_certificate(query, certificate)
+
+async def get_students_by_id_number(id_numbers: List[str]) -> Dict[str, List[str]]:
+    """Map each ID number to the ids of the students holding it."""
+    students: Dict[str, List[str]] = {}
+    for start in range(0, len(id_numbers), 1000):
+        cursor = db.students.find(
+            {"id_number": {"$in": id_numbers[start:start + 1000]}},
+            {"_id": 0, "id": 1, "id_number": 1}
+        )
+        async for student in cursor:
+            students.setdefault(student["id_number"], []).append(student["id"])
+    return students
+
+async def store_zip_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int) -> StoredBlob:
+    """Decompress one archive entry into the blob store in chunks, enforcing max_bytes."""
+    if info.file_size > max_bytes:
+        raise BlobTooLarge(max_bytes)
+    handle = await asyncio.to_thread(archive.open, info)
+    
+    async def chunks():
+        while True:
+            chunk = await asyncio.to_thread(handle.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    try:
+        return await blob_store.write(chunks(), max_bytes=max_bytes)
+    finally:
+        handle.close()
+
+async def attach_certificate(query: dict, certificate: Certificate) -> bool:
+    """Set the certificate of the student matching `query`, releasing the blob it replaces.
+    
+    The new blob's reference is released instead when no student matches.
+    """
+    previous = await db.students.find_one_and_update(
+        query,
+        student_update_pipeline({"certificate": certificate.dict(), "updated_at": datetime.utcnow()}),
+        projection={"certificate.sha256": 1}
+    )
+    if previous:
+        await blob_store.release((previous.get("certificate") or {}).get("sha256"))
+    else:
+        await blob_store.release(certificate.sha256)
+    return previous is not None
+
+async def generate_certificates(job: JobContext) -> dict:
+    """Job handler: render and attach certificates for every eligible student.
+
+    Up to 2 * RENDER_WORKERS certificates are in flight, so the student cursor
+    is consumed no faster than the pool renders. Re-running after an
+    interruption only picks up students still without a certificate, unless
+    the job regenerates all of them.
+    """
+    regenerate = job.params.get("regenerate", False)
+    query = {"certificate_eligible": True}
+    if not regenerate:
+        query["has_certificate"] = False
+    await job.report(force=True, total=await db.students.count_documents(query), done=0, skipped=0, failed=0)
+
+    loop = asyncio.get_running_loop()
+    issued_on = datetime.utcnow()
+    slots = asyncio.Semaphore(2 * RENDER_WORKERS)
+
+    async def generate(student: dict):
+        try:
+            pdf = await loop.run_in_executor(render_pool, render_certificate, certificate_fields(student, issued_on))
+            attached = await store_generated_certificate(student, pdf, job.created_by, regenerate)
+            counter = "done" if attached else "skipped"
+        except Exception:
+            logger.exception("Certificate generation failed for student %s", student["id"])
+            counter = "failed"
+        finally:
+            slots.release()
+        await job.report(**{counter: job.progress[counter] + 1})
+
+    tasks = []
+    try:
+        async for student in db.students.find(query, CERTIFICATE_FIELDS_PROJECTION, batch_size=100):
+            await slots.acquire()
+            tasks.append(asyncio.create_task(generate(student)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return {key: job.progress[key] for key in ("done", "skipped", "failed")}
+
+job_runner.register("certificate_generation", generate_certificates)
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+async def cached_blob_bytes(sha256: str, location: BlobLocation, encoded: bool) -> Optional[bytes]:
+    """Blob bytes (as stored, or decoded) from blob_cache, loading them on a miss.
+    
+    Returns None for blobs over the per-object cap, which are streamed instead.
+    Those are checked before the cache, so they do not count as misses.
+    """
+    key = (sha256, location.encoding if encoded else None)
+    if blob_cache.is_oversize(key) or (encoded and location.stored_size > blob_cache.max_object_bytes):
+        return None
+    data = blob_cache.get(key)
+    if data is not None:
+        return data
+    if encoded:
+        data = await asyncio.to_thread(location.path.read_bytes)
+    else:
+        chunks = []
+        size = 0
+        reader = blob_store.read(sha256)
+        try:
+            async for chunk in reader:
+                size += len(chunk)
+                if size > blob_cache.max_object_bytes:
+                    blob_cache.mark_oversize(key)
+                    return None
+                chunks.append(chunk)
+        finally:
+            # Close the file and decompressor now rather than when the generator is collected
+            await reader.aclose()
+        data = b"".join(chunks)
+    blob_cache.put(key, data)
+    return data
+
+def blob_file_response(
+    location: BlobLocation,
+    filename: str,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Hand a stored file to the server or fronting proxy without copying it in Python."""
+    headers = dict(headers or {})
+    if FILE_SERVING_MODE == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = f"{X_ACCEL_REDIRECT_PREFIX}/{location.path.relative_to(BLOB_DIR).as_posix()}"
+    elif FILE_SERVING_MODE == "x-sendfile":
+        headers["X-Sendfile"] = str(location.path)
+    else:
+        return FileResponse(path=location.path, filename=filename, media_type=media_type, headers=headers)
+    
+    headers["Content-Disposition"] = content_disposition(filename)
+    return Response(media_type=media_type, headers=headers)
+
+async def stored_file_response(
+    request: Request,
+    stored: dict,
+    temp_file: Path,
+    filename: str,
+    media_type: str
+) -> Response:
+    """Serve an upload from the blob store, decoding legacy base64 data to temp_file.
+    
+    Legacy documents whose file_data was already written to temp_file (and
+    removed) are served from it directly.
+    """
+    if not stored.get("sha256"):
+        if stored.get("file_data"):
+            with open(temp_file, "wb") as f:
+                f.write(base64.b64decode(stored["file_data"]))
+        return FileResponse(path=temp_file, filename=filename, media_type=media_type)
+    
+    return await blob_response(request, stored["sha256"], filename, media_type)
+
+async def blob_response(request: Request, sha256: str, filename: str, media_type: str) -> Response:
+    """Serve a blob. Compressed blobs go out as stored with Content-Encoding
+    when the client accepts that coding, and are decompressed otherwise.
+    Small blobs are served from blob_cache in "stream" mode.
+    
+    The offload modes only hand over uncompressed blobs: nginx and
+    X-Sendfile servers replace the headers along with the body, so
+    Content-Encoding would not reach the client.
+    """
+    location = blob_store.locate(sha256)
+    if location is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    headers = {}
+    send_encoded = location.encoding is None
+    if location.encoding is not None and FILE_SERVING_MODE == "stream":
+        headers["Vary"] = "Accept-Encoding"
+        if location.encoding in accepted_encodings(request.headers.get("accept-encoding", "")):
+            headers["Content-Encoding"] = location.encoding
+            send_encoded = True
+    
+    if FILE_SERVING_MODE == "stream":
+        data = await cached_blob_bytes(sha256, location, encoded=send_encoded)
+        if data is not None:
+            blob_bytes_served.inc(len(data), source="cache")
+            headers["Content-Disposition"] = content_disposition(filename)
+            return Response(content=data, media_type=media_type, headers=headers)
+    
+    if send_encoded:
+        blob_bytes_served.inc(location.stored_size, source="file" if FILE_SERVING_MODE == "stream" else "offload")
+        return blob_file_response(location, filename, media_type, headers=headers)
+    
+    async def decompressed():
+        async for chunk in blob_store.read(sha256):
+            blob_bytes_served.inc(len(chunk), source="decompressed")
+            yield chunk
+    
+    return StreamingResponse(
+        decompressed(),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(filename), "Vary": "Accept-Encoding"}
+    )
+
+def public_listing_response(request: Request, cached: CachedResponse) -> Response:
+    """Serve a cached listing body, or 304 when the client already has it.
+    
+    CompressionMiddleware may send the body as gzip, br or identity, so the
+    ETag is weak: it names the listing, not the bytes on the wire.
+    """
+    headers = {
+        "Cache-Control": (
+            f"public, max-age={cached.ttl_remaining}, "
+            f"stale-while-revalidate={PUBLIC_LISTING_STALE_WHILE_REVALIDATE}"
+        ),
+        "ETag": f"W/{cached.etag}",
+        "Vary": "Accept-Encoding"
+    }
+    # If-None-Match uses weak comparison, so W/"x" and "x" both match
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if "*" in if_none_match or cached.etag in (tag[2:] if tag.startswith("W/") else tag for tag in if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def serialize_record(model, record: Optional[dict]) -> Optional[dict]:
+    if record is None:
+        return None
+    values = {**RECORD_DEFAULTS[model], **record}
+    for name, factory in RECORD_FACTORIES[model].items():
+        if name not in values:
+            values[name] = factory()
+    return values
+
+def serialize_eulogy(eulogy: dict, current_time: datetime) -> dict:
+    return {
+        "id": eulogy["id"],
+        "title": eulogy["title"],
+        "description": eulogy.get("description"),
+        "filename": eulogy["filename"],
+        "uploaded_at": eulogy["uploaded_at"],
+        "expires_at": eulogy["expires_at"],
+        "is_active": eulogy["is_active"],
+        "days_remaining": max(0, (eulogy["expires_at"] - current_time).days)
+    }
+
+def serialize_download(download: dict) -> dict:
+    return {
+        "id": download["id"],
+        "title": download["title"],
+        "description": download.get("description"),
+        "filename": download["filename"],
+        "file_type": download["file_type"],
+        "uploaded_at": download["uploaded_at"],
+        "download_count": download.get("download_count", 0),
+        "is_active": download.get("is_active", True)
+    }
+
+def serialize_student(student: dict, username: str) -> dict:
+    has_certificate = student.get("has_certificate", False)
+    return {
+        "id": student["id"],
+        "username": username,
+        "full_name": student["full_name"],
+        "id_number": student["id_number"],
+        "email": student.get("email"),
+        "phone": student.get("phone"),
+        "parent_contacts": serialize_record(ParentContact, student.get("parent_contacts")),
+        "academic_record": serialize_record(AcademicRecord, student.get("academic_record")),
+        "finance_record": serialize_record(FinanceRecord, student.get("finance_record")),
+        "certificate": student.get("certificate"),
+        "has_certificate": has_certificate,
+        "can_download_certificate": has_certificate and student.get("certificate_eligible", False),
+        "average_score": student.get("average_score")
+    }
+
 async def get_student_response(student: Student) -> StudentResponse:
     user = await db.users.find_one({"id": student.user_id})
     username = user["username"] if user else "unknown"
     
-    average_score = calculate_average_score(student.academic_record)
-    has_certificate = student.certificate is not None
-    can_download = (
-        has_certificate and
-        average_score is not None and
-        average_score >= 60 and
-        student.finance_record is not None and
-        student.finance_record.is_cleared
-    )
-    
-    return StudentResponse(
-        id=student.id,
-        username=username,
-        full_name=student.full_name,
-        id_number=student.id_number,
-        email=student.email,
-        phone=student.phone,
-        parent_contacts=student.parent_contacts,
-        academic_record=student.academic_record,
-        finance_record=student.finance_record,
-        certificate=student.certificate,
-        has_certificate=has_certificate,
-        can_download_certificate=can_download,
-        average_score=average_score
+    can_download = student.has_certificate and student.certificate_eligible
+    
+    with span("pydantic"):
+        return StudentResponse(
+            id=student.id,
+            username=username,
+            full_name=student.full_name,
+            id_number=student.id_number,
+            email=student.email,
+            phone=student.phone,
+            parent_contacts=student.parent_contacts,
+            academic_record=student.academic_record,
+            finance_record=student.finance_record,
+            certificate=student.certificate,
+            has_certificate=student.has_certificate,
+            can_download_certificate=can_download,
+            average_score=student.average_score
+        )
+
+async def get_usernames(user_ids: List[str]) -> Dict[str, str]:
+    users = await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "username": 1}).to_list(len(user_ids))
+    return {user["id"]: user["username"] for user in users}
+
+def document_value(document: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+async def student_export_rows(query: dict, sort: list, columns: List[str]):
+    """Yield export rows in batches of EXPORT_BATCH_SIZE, projecting only the requested columns."""
+    projection = {"_id": 0, **{STUDENT_EXPORT_FIELDS[column]: 1 for column in columns}}
+    cursor = db.students.find(query, projection, batch_size=EXPORT_BATCH_SIZE).sort(sort)
+    
+    async def rows(students: List[dict]) -> List[list]:
+        usernames = await get_usernames([student["user_id"] for student in students]) if "username" in columns else {}
+        return [
+            [
+                usernames.get(student.get("user_id"), "unknown") if column == "username"
+                else document_value(student, STUDENT_EXPORT_FIELDS[column])
+                for column in columns
+            ]
+            for student in students
+        ]
+    
+    batch = []
+    async for student in cursor:
+        batch.append(student)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield await rows(batch)
+            batch = []
+    if batch:
+        yield await rows(batch)
+
+# Path separators, parent references and control characters in an id_number
+# would let an archive entry escape the folder it is extracted into
+UNSAFE_ENTRY_NAME = re.compile(r"[/\\\x00-\x1f]|\.\.")
+
+def unique_entry_name(names: set, id_number: str) -> str:
+    """<id_number>.pdf, suffixed with -2, -3... when the name was already used in the archive.
+    
+    Characters that are unsafe in an entry name are replaced with "_".
+    """
+    id_number = UNSAFE_ENTRY_NAME.sub("_", id_number)
+    name = f"{id_number}.pdf"
+    suffix = 1
+    while name in names:
+        suffix += 1
+        name = f"{id_number}-{suffix}.pdf"
+    names.add(name)
+    return name
+
+async def certificate_zip_entries(query: dict, sort: list):
+    """One archive entry per stored certificate, named <id_number>.pdf and read from the blob store.
+    
+    PDFs barely compress, so entries are stored rather than deflated.
+    Certificates still held as legacy base64 are not included; run
+    `manage.py migrate-files` first.
+    """
+    projection = {"_id": 0, "id_number": 1, "certificate.sha256": 1, "certificate.size": 1, "certificate.uploaded_at": 1}
+    names = set()
+    async for student in db.students.find(query, projection, batch_size=100).sort(sort):
+        certificate = student["certificate"]
+        if not blob_store.exists(certificate["sha256"]):
+            logger.warning("Certificate blob %s for %s is missing", certificate["sha256"], student["id_number"])
+            continue
+        yield ZipEntry(
+            name=unique_entry_name(names, student["id_number"]),
+            chunks=blob_store.read(certificate["sha256"]),
+            size=certificate.get("size"),
+            modified=certificate.get("uploaded_at")
+        )
+
+TRANSCRIPT_PROJECTION = {
+    "_id": 0, "id": 1, "full_name": 1, "id_number": 1, "academic_record": 1, "finance_record": 1,
+    "average_score": 1, "transcript": 1, "updated_at": 1
+}
+
+async def transcript_pdf(student: dict) -> bytes:
+    """A student's transcript, rendered again only when updated_at has changed.
+    
+    Renders are stored in the blob store with a pointer on the student, so
+    they are shared by every worker and survive restarts.
+    """
+    transcript = student.get("transcript")
+    if transcript and transcript["rendered_for"] == student["updated_at"]:
+        location = blob_store.locate(transcript["sha256"])
+        if location is not None:
+            data = await cached_blob_bytes(transcript["sha256"], location, encoded=False)
+            if data is None:
+                data = b"".join([chunk async for chunk in blob_store.read(transcript["sha256"])])
+            return data
+    return await transcript_flight.do((student["id"], student["updated_at"]), lambda: render_transcript_blob(student))
+
+async def render_transcript_blob(student: dict) -> bytes:
+    loop = asyncio.get_running_loop()
+    pdf = await loop.run_in_executor(render_pool, render_transcript, transcript_fields(student, CERTIFICATE_PASS_MARK))
+    
+    async def chunks():
+        yield pdf
+    
+    blob = await blob_store.write(chunks())
+    transcript = Transcript(sha256=blob.sha256, size=blob.size, rendered_for=student["updated_at"])
+    # Only record the render if the student has not changed since it was read
+    previous = await db.students.find_one_and_update(
+        {"id": student["id"], "updated_at": student["updated_at"]},
+        {"$set": {"transcript": transcript.dict()}},
+        projection={"transcript.sha256": 1}
     )
+    if previous:
+        await blob_store.release((previous.get("transcript") or {}).get("sha256"))
+    else:
+        await blob_store.release(blob.sha256)
+    return pdf
+
+async def transcript_zip_entries(query: dict, sort: list) -> AsyncIterator[ZipEntry]:
+    """One <id_number>.pdf entry per student, in cursor order.
+    
+    Up to 2 * RENDER_WORKERS transcripts are fetched or rendered ahead of the
+    entry being written, so the process pool stays busy.
+    """
+    names = set()
+    
+    async def entry(student: dict, name: str) -> ZipEntry:
+        pdf = await transcript_pdf(student)
+        
+        async def chunks():
+            yield pdf
+        
+        return ZipEntry(name=name, chunks=chunks(), size=len(pdf))
+    
+    pending = []
+    try:
+        async for student in db.students.find(query, TRANSCRIPT_PROJECTION, batch_size=100).sort(sort):
+            pending.append(asyncio.ensure_future(entry(student, unique_entry_name(names, student["id_number"]))))
+            if len(pending) >= 2 * RENDER_WORKERS:
+                yield await pending.pop(0)
+        while pending:
+            yield await pending.pop(0)
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def get_student_summaries(students: List[dict]) -> List[StudentSummary]:
+    usernames = await get_usernames([student["user_id"] for student in students])
+    
+    summaries = []
+    for student in students:
+        finance = student.get("finance_record") or {}
+        summaries.append(StudentSummary(
+            id=student["id"],
+            username=usernames.get(student["user_id"], "unknown"),
+            full_name=student["full_name"],
+            id_number=student["id_number"],
+            email=student.get("email"),
+            phone=student.get("phone"),
+            average_score=student.get("average_score"),
+            balance=finance.get("balance", 0.0),
+            is_cleared=finance.get("is_cleared", False),
+            has_certificate=student.get("has_certificate", False),
+            certificate_eligible=student.get("certificate_eligible", False)
+        ))
+    return summaries
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+
+# Route classes for ConcurrencyLimitMiddleware; routes not listed are unlimited
+CONCURRENCY_ROUTE_CLASSES = [
+    ("auth", {"POST"}, r"^/api/(auth/(login|reset-password|change-password)|admin/students)$"),
+    ("file_upload", {"POST", "PUT"},
+     r"^/api/admin/(students/[^/]+/certificate|certificates/bulk|eulogies|downloads|downloads/uploads/[^/]+/(chunks/\d+|complete))$"),
+    ("file_download", {"GET"},
+     r"^/api/(downloads/[^/]+|downloads/private/[^/]+|student/(certificate|transcript\.pdf)|eulogies/[^/]+/download|files/.+)$"),
+    ("admin_listing", {"GET"}, r"^/api/admin/(students|eulogies|downloads|worklists/[^/]+)$"),
+    ("public_listing", {"GET"}, r"^/api/(downloads|eulogies)$"),
+    ("export", {"GET"}, r"^/api/admin/export/.+$")
+]
+
+app.add_middleware(ConcurrencyLimitMiddleware, route_classes=[
+    (name, methods, pattern, *CONCURRENCY_LIMITS[name])
+    for name, methods, pattern in CONCURRENCY_ROUTE_CLASSES
+])
+
+app.add_middleware(RequestSizeLimitMiddleware, limits=[
+    ("POST", r"^/api/admin/students/[^/]+/certificate$", MAX_CERTIFICATE_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+    ("POST", r"^/api/admin/certificates/bulk$", MAX_BULK_CERTIFICATE_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+    ("POST", r"^/api/admin/eulogies$", MAX_EULOGY_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+    ("POST", r"^/api/admin/downloads$", MAX_DOWNLOAD_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES),
+    ("PUT", r"^/api/admin/downloads/uploads/[^/]+/chunks/\d+$", UPLOAD_CHUNK_SIZE)
+])
+
+app.add_middleware(TracingMiddleware, tracer=tracer)
+# Outside the limiters, so it also counts requests they reject
+app.add_middleware(MetricsMiddleware)
+
+# Outermost, so 413 and 503 responses from the limiters carry CORS headers
+# and the cross-origin frontend can read Retry-After
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # Configure logging
@@ -911,6 +2428,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def attach_mongo_listener():
+    mongo_listener.attach(client, asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def backfill_missing_student_fields():
+    # Students saved before the derived fields existed would otherwise be
+    # refused certificates and missing from worklists. Idempotent, so every
+    # worker may run it.
+    modified = await backfill_student_derived_fields({"certificate_eligible": {"$exists": False}})
+    if modified:
+        logger.info("Filled derived fields on %d student(s)", modified)
+
+@app.on_event("startup")
+async def start_invalidation_bus():
+    if invalidation_bus is not None:
+        await invalidation_bus.start()
+
 # Create default admin user on startup
 @app.on_event("startup")
 async def create_default_admin():
@@ -926,6 +2465,48 @@ async def create_default_admin():
         await db.users.insert_one(admin_user.dict())
         logger.info("Default admin user created: username=admin, password=Twoemweb@2020")
 
+async def collect_upload_sessions():
+    while True:
+        try:
+            purged = await purge_abandoned_upload_sessions()
+            if purged:
+                logger.info("Removed %d abandoned upload session(s)", purged)
+        except Exception:
+            logger.exception("Upload session cleanup failed")
+        await asyncio.sleep(3600)
+
+@app.on_event("startup")
+async def start_job_runner():
+    await job_runner.start()
+
+@app.on_event("startup")
+async def start_upload_session_cleanup():
+    app.state.upload_session_cleanup = asyncio.create_task(collect_upload_sessions())
+
+async def write_shared_metrics():
+    while True:
+        try:
+            update_cache_hit_ratios()
+            await asyncio.to_thread(shared_metrics.write)
+        except Exception:
+            logger.exception("Could not write metrics to %s", METRICS_DIR)
+        await asyncio.sleep(METRICS_WRITE_INTERVAL)
+
+@app.on_event("startup")
+async def start_shared_metrics_writer():
+    if shared_metrics is not None:
+        app.state.shared_metrics_writer = asyncio.create_task(write_shared_metrics())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.upload_session_cleanup.cancel()
+    await job_runner.stop()
+    render_pool.shutdown(wait=False, cancel_futures=True)
+    if invalidation_bus is not None:
+        await invalidation_bus.stop()
+    if shared_metrics is not None:
+        app.state.shared_metrics_writer.cancel()
+        # Keep this worker's final counts in the totals after it exits
+        update_cache_hit_ratios()
+        shared_metrics.write()
     client.close()
@@ -0,0 +1,221 @@
+"""Lightweight request tracing.
+
+A Trace is attached to the request's context by TracingMiddleware and
+collects spans from `span()` blocks, from MongoDB commands (recorded by the
+command listener) and from work in threads started with asyncio.to_thread,
+which copies the context. With no active trace, `span()` does nothing.
+
+A finished trace can be summarised as a Server-Timing header, with spans
+of the same name merged, and written as one OTLP/JSON line to a file that
+an OpenTelemetry collector's file receiver (or jq) can read.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+current_span_id: ContextVar[Optional[str]] = ContextVar("current_span_id", default=None)
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "kind", "attributes")
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], start_ns: int, kind: int, attributes: dict):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        self.kind = kind
+        self.attributes = attributes
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1_000_000
+
+
+class Trace:
+    def __init__(self, name: str, sampled: bool = False, admin_timing: bool = False):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.admin_timing = admin_timing
+        self.admin = False  # set once the request authenticates as an admin
+        self.spans: List[Span] = []
+        # Wall-clock anchor plus a monotonic clock for durations
+        self._wall_ns = time.time_ns()
+        self._perf_ns = time.perf_counter_ns()
+        self.root = self.start_span(name, parent_id=None, kind=KIND_SERVER)
+
+    def now_ns(self) -> int:
+        return self._wall_ns + time.perf_counter_ns() - self._perf_ns
+
+    def start_span(self, name: str, parent_id: Optional[str], kind: int = KIND_INTERNAL, **attributes) -> Span:
+        # Ids only need to be unique, not unpredictable, so no syscall per span
+        span = Span(name, f"{random.getrandbits(64):016x}", parent_id, self.now_ns(), kind, attributes)
+        # list.append is atomic, so threads may record spans too
+        self.spans.append(span)
+        return span
+
+    def record(
+        self,
+        name: str,
+        duration_ns: int,
+        parent_id: Optional[str] = None,
+        kind: int = KIND_INTERNAL,
+        **attributes
+    ) -> Span:
+        """Add a span that has just finished after `duration_ns`."""
+        span = self.start_span(name, parent_id or self.root.span_id, kind, **attributes)
+        span.end_ns = span.start_ns
+        span.start_ns -= duration_ns
+        return span
+
+    def finish(self):
+        self.root.end_ns = self.now_ns()
+
+    @property
+    def exposed(self) -> bool:
+        return self.sampled or (self.admin and self.admin_timing)
+
+    def server_timing(self) -> str:
+        """Spans merged by name as a Server-Timing header value, plus the total so far."""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans[1:]:
+            entry = totals.setdefault(span.name, [0.0, 0])
+            entry[0] += span.duration_ms
+            entry[1] += 1
+        metrics = [
+            f'{name};dur={duration:.1f};desc="{count}x"' if count > 1 else f"{name};dur={duration:.1f}"
+            for name, (duration, count) in totals.items()
+        ]
+        metrics.append(f"total;dur={(self.now_ns() - self.root.start_ns) / 1_000_000:.1f}")
+        return ", ".join(metrics)
+
+    def to_otlp(self, service_name: str) -> dict:
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "twoem.tracing"},
+                "spans": [
+                    {
+                        "traceId": self.trace_id,
+                        "spanId": span.span_id,
+                        **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                        "name": span.name,
+                        "kind": span.kind,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [attribute(key, value) for key, value in span.attributes.items()]
+                    }
+                    for span in list(self.spans)
+                ]
+            }]
+        }]}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span, if a trace is active."""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    child = trace.start_span(name, current_span_id.get() or trace.root.span_id, **attributes)
+    token = current_span_id.set(child.span_id)
+    try:
+        yield child
+    finally:
+        current_span_id.reset(token)
+        child.end_ns = trace.now_ns()
+
+
+class TracedRoute(APIRoute):
+    """APIRoute whose endpoint body is timed as a "handler" span.
+
+    Time outside it (dependencies, response_model validation) is the
+    difference between the total and the spans reported.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            async def traced(*args, **kwargs):
+                with span("handler"):
+                    return await call(*args, **kwargs)
+
+            self.dependant.call = traced
+
+
+class TracedJSONResponse(JSONResponse):
+    """JSONResponse whose encoding is timed as an "encode" span."""
+
+    def render(self, content) -> bytes:
+        with span("encode"):
+            return super().render(content)
+
+
+def mark_admin():
+    """Expose the current trace to the caller, who has authenticated as an admin."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.admin = True
+
+
+class Tracer:
+    """Decides which requests are traced and writes finished traces to `export_path`."""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        admin_timing: bool = False,
+        export_path: Optional[str] = None,
+        service_name: str = "twoem-api"
+    ):
+        self.sample_rate = sample_rate
+        self.admin_timing = admin_timing
+        self.export_path = export_path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether requests are traced at all; when not, tracing costs nothing per request."""
+        return self.sample_rate > 0 or self.admin_timing
+
+    def start(self, name: str) -> Optional[Trace]:
+        if not self.enabled:
+            return None
+        return Trace(
+            name,
+            sampled=self.sample_rate > 0 and random.random() < self.sample_rate,
+            admin_timing=self.admin_timing
+        )
+
+    def export(self, trace: Trace):
+        """Append the trace as one OTLP/JSON line. Blocking; call from a thread."""
+        line = json.dumps(trace.to_otlp(self.service_name), separators=(",", ":"))
+        with self._lock, open(self.export_path, "a", encoding="utf-8") as handle:
+            handle.write(line + "\n")
@@ -0,0 +1,87 @@
+"""Storage and CPU cost of at-rest blob compression.
+
+For each sample file, reports whether the blob store would compress it,
+the stored size, and the CPU time spent compressing on upload and
+decompressing on a download to a client that does not accept the stored
+encoding. Pass extra file paths to include your own documents.
+
+    python benchmarks/blob_compression.py [FILE ...]
+"""
+import base64
+import csv
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from blobstore import CHUNK_SIZE, SAMPLE_SIZE, choose_encoding, compressor, decompressor  # noqa: E402
+
+
+def sample_files():
+    yield "template.pdf", (ROOT / "images" / "template.pdf").read_bytes()
+    yield "gallery1.jpg", (ROOT / "images" / "gallery1.jpg").read_bytes()
+
+    rows = io.StringIO()
+    writer = csv.writer(rows)
+    writer.writerow(["id_number", "full_name", "ms_word", "ms_excel", "total_fees", "paid_amount"])
+    for i in range(100_000):
+        writer.writerow([30000000 + i, f"Student {i}", 40 + i % 60, 35 + i % 65, 10000, i % 10001])
+    yield "students.csv", rows.getvalue().encode()
+
+    yield "random.bin", os.urandom(8 * 1024 * 1024)
+
+    for path in sys.argv[1:]:
+        yield Path(path).name, Path(path).read_bytes()
+
+
+def chunked(data: bytes):
+    for offset in range(0, len(data), CHUNK_SIZE):
+        yield data[offset:offset + CHUNK_SIZE]
+
+
+def main():
+    print(
+        f"{'file':<16} {'original':>11} {'base64':>11} {'stored':>11} {'ratio':>6} "
+        f"{'encoding':>8} {'cpu in ms/MB':>13} {'cpu out ms/MB':>14}"
+    )
+    for name, data in sample_files():
+        megabytes = max(len(data) / (1024 * 1024), 1e-9)
+
+        start = time.process_time()
+        encoding = choose_encoding(data[:SAMPLE_SIZE])
+        stored = 0
+        pieces = []
+        if encoding:
+            engine = compressor(encoding)
+            for chunk in chunked(data):
+                piece = engine.compress(chunk)
+                stored += len(piece)
+                pieces.append(piece)
+            tail = engine.flush()
+            stored += len(tail)
+            pieces.append(tail)
+        else:
+            stored = len(data)
+        compress_cpu = time.process_time() - start
+
+        decompress_cpu = 0.0
+        if encoding:
+            start = time.process_time()
+            engine = decompressor(encoding)
+            restored = b"".join(engine.decompress(piece) for piece in pieces)
+            decompress_cpu = time.process_time() - start
+            assert restored == data
+
+        print(
+            f"{name:<16} {len(data):>11} {len(base64.b64encode(data)):>11} {stored:>11} "
+            f"{stored / len(data):>6.2f} {encoding or '-':>8} "
+            f"{compress_cpu * 1000 / megabytes:>13.1f} {decompress_cpu * 1000 / megabytes:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Measure certificate rendering throughput with the process pool.
+
+Renders COUNT certificates from images/template.pdf with the same worker
+setup the generation job uses, without touching MongoDB or the blob store.
+
+    python benchmarks/certificate_generation.py [COUNT] [WORKERS]
+"""
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from certificates import certificate_fields, init_worker, render_certificate  # noqa: E402
+
+TEMPLATE = ROOT / "images" / "template.pdf"
+
+
+def make_student(i: int) -> dict:
+    return {
+        "full_name": f"Student Number {i}",
+        "id_number": f"{30000000 + i}",
+        "academic_record": {
+            "ms_word": 70, "ms_excel": 65, "ms_powerpoint": 80,
+            "ms_access": 55, "computer_intro": 90,
+        },
+        "average_score": 72.0,
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    issued_on = datetime.utcnow()
+    fields = [certificate_fields(make_student(i), issued_on) for i in range(count)]
+
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(str(TEMPLATE),)
+    )
+    with pool:
+        # Start the workers before timing
+        list(pool.map(render_certificate, fields[:workers]))
+        start = time.perf_counter()
+        total_bytes = sum(len(pdf) for pdf in pool.map(render_certificate, fields, chunksize=8))
+        elapsed = time.perf_counter() - start
+
+    print(f"{count} certificates with {workers} worker(s) in {elapsed:.2f}s "
+          f"({count / elapsed:.0f}/s, {total_bytes / count / 1024:.0f} KiB each)")
+
+
+if __name__ == "__main__":
+    main()
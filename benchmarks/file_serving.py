@@ -0,0 +1,67 @@
+"""Throughput and server CPU per GB for public file downloads.
+
+Start the API (and nginx, for offload mode) with the FILE_SERVING_MODE you
+want to measure, upload a large public file, then run:
+
+    python benchmarks/file_serving.py --url http://localhost:8001 \\
+        --download-id <id> --pid <uvicorn pid> [--pid <nginx worker pid> ...]
+
+Run it once per mode and compare. CPU time is read from /proc, so the
+server processes must be on the same Linux host.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        # utime and stime are fields 14 and 15; the command name may contain spaces
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def fetch(session: requests.Session, url: str) -> int:
+    received = 0
+    with session.get(url, stream=True, headers={"Accept-Encoding": "identity"}) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            received += len(chunk)
+    return received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--download-id", required=True)
+    parser.add_argument("--pid", type=int, action="append", default=[], help="server process to measure")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    url = f"{args.url}/api/downloads/{args.download_id}"
+    sessions = [requests.Session() for _ in range(args.concurrency)]
+
+    cpu_before = sum(cpu_seconds(pid) for pid in args.pid)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        sizes = list(pool.map(lambda i: fetch(sessions[i % args.concurrency], url), range(args.requests)))
+    elapsed = time.perf_counter() - start
+    cpu_used = sum(cpu_seconds(pid) for pid in args.pid) - cpu_before
+
+    gigabytes = sum(sizes) / 1024 ** 3
+    print(f"requests:        {args.requests} at concurrency {args.concurrency}")
+    print(f"bytes served:    {sum(sizes)}")
+    print(f"elapsed:         {elapsed:.2f} s")
+    print(f"throughput:      {gigabytes / elapsed:.3f} GB/s, {args.requests / elapsed:.1f} req/s")
+    if args.pid:
+        print(f"server cpu:      {cpu_used:.2f} s ({cpu_used / gigabytes:.2f} s per GB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,557 @@
+"""Load test the API with traffic modelled on real usage.
+
+Start mongod and the API on this host, create the load-test accounts once,
+then run a scenario at a fixed arrival rate or flat out at a fixed
+concurrency:
+
+    python benchmarks/load_test.py seed --students 200
+    python benchmarks/load_test.py run login_storm --rps 40 --duration 60 \\
+        --pid <uvicorn pid> --pid <mongod pid> --output results/login-before.json
+    python benchmarks/load_test.py compare results/login-before.json results/login-after.json
+
+Scenarios:
+
+    login_storm           students logging in at the start of a class (bcrypt bound)
+    admin_tabs            an admin switching between the student list and other tabs
+    eulogy_spike          the public eulogy listing and file, as when a link is shared
+    certificate_download  students downloading their certificates
+    bulk_upload           an admin uploading a ZIP of certificates named by ID number
+    mixed                 all of the above, weighted by how often they happen
+
+With --rps, scenario iterations start on a fixed schedule however slowly
+the server answers, and the first request of each is timed from when it
+was due. Time spent queued in the client therefore counts against the
+server rather than being hidden (no coordinated omission); keep
+--concurrency high enough that it is never the limit. Without --rps,
+--concurrency users run iterations back to back.
+
+Server CPU and resident memory are sampled from /proc for each --pid, so the
+processes must run on this host. The first --warmup seconds are not
+measured. --seed fixes which accounts are used, so runs with the same
+arguments send the same requests and their JSON results can be compared.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Seeded accounts are named PREFIX00000, PREFIX00001, ... and share a password
+PREFIX = "loadtest"
+PASSWORD = "LoadTest@2024"
+# A minimal one-page PDF used for certificates and eulogies
+PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+ADMIN_TABS = [
+    ("GET /admin/worklists/{worklist}", "/api/admin/worklists/eligible-without-certificate"),
+    ("GET /admin/worklists/{worklist}", "/api/admin/worklists/passed-with-balance"),
+    ("GET /admin/eulogies", "/api/admin/eulogies"),
+    ("GET /admin/downloads", "/api/admin/downloads"),
+    ("GET /admin/password-resets", "/api/admin/password-resets"),
+]
+
+# Share of iterations per scenario in the mixed workload
+MIX = {
+    "eulogy_spike": 0.5,
+    "login_storm": 0.2,
+    "certificate_download": 0.18,
+    "admin_tabs": 0.1,
+    "bulk_upload": 0.02,
+}
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/api/auth/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+# =============================
+# MEASUREMENT
+# =============================
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+        self.bytes_received = 0
+
+    def add(self, name: str, seconds: float, error: Optional[str] = None, size: int = 0):
+        self.latencies.setdefault(name, []).append(seconds)
+        if error is not None:
+            counts = self.errors.setdefault(name, {})
+            counts[error] = counts.get(error, 0) + 1
+        self.bytes_received += size
+
+    def summary(self, elapsed: float) -> Dict[str, dict]:
+        results = {}
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            errors = self.errors.get(name, {})
+            results[name] = {
+                "count": len(latencies),
+                "errors": errors,
+                "error_rate": sum(errors.values()) / len(latencies),
+                "throughput": len(latencies) / elapsed,
+                "mean_ms": sum(latencies) / len(latencies) * 1000,
+                **{f"p{p}_ms": percentile(latencies, p) * 1000 for p in (50, 95, 99)},
+                "max_ms": latencies[-1] * 1000,
+            }
+        return results
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of a sorted list."""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Session:
+    """One scenario iteration. Its first request is timed from when the iteration was due.
+
+    Each iteration has its own random generator derived from the seed and
+    its number, so its choices do not depend on how iterations interleave.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        recorder: Optional[Recorder],
+        due: Optional[float],
+        rng: random.Random
+    ):
+        self.client = client
+        self.recorder = recorder
+        self.due = due
+        self.rng = rng
+
+    async def request(self, name: str, method: str, path: str, token: Optional[str] = None, **kwargs):
+        start = self.due if self.due is not None else time.perf_counter()
+        self.due = None
+        try:
+            response = await self.client.request(method, path, headers=auth(token) if token else None, **kwargs)
+        except httpx.HTTPError as error:
+            self.record(name, start, type(error).__name__)
+            return None
+        self.record(name, start, str(response.status_code) if response.is_error else None, len(response.content))
+        return response
+
+    def record(self, name: str, start: float, error: Optional[str], size: int = 0):
+        if self.recorder is not None:
+            self.recorder.add(name, time.perf_counter() - start, error, size)
+
+
+def process_usage(pid: int):
+    """(command name, CPU seconds, resident bytes) for a process."""
+    with open(f"/proc/{pid}/stat") as f:
+        stat = f.read()
+    # utime and stime are fields 14 and 15, rss is field 24; the name may contain spaces
+    name = stat[stat.index("(") + 1:stat.rindex(")")]
+    fields = stat.rsplit(")", 1)[1].split()
+    return name, (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE
+
+
+async def sample_processes(pids: List[int], stop: asyncio.Event, interval: float = 1.0) -> List[dict]:
+    start = time.perf_counter()
+    baseline = {pid: process_usage(pid) for pid in pids}
+    peak = {pid: usage[2] for pid, usage in baseline.items()}
+    rss_total = dict(peak)
+    samples = 1
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        for pid in pids:
+            rss = process_usage(pid)[2]
+            peak[pid] = max(peak[pid], rss)
+            rss_total[pid] += rss
+        samples += 1
+    elapsed = time.perf_counter() - start
+    results = []
+    for pid in pids:
+        name, cpu_before, _ = baseline[pid]
+        cpu_used = process_usage(pid)[1] - cpu_before
+        results.append({
+            "pid": pid,
+            "name": name,
+            "cpu_seconds": cpu_used,
+            "cpu_percent": cpu_used / elapsed * 100,
+            "mean_rss_mb": rss_total[pid] / samples / 1024 ** 2,
+            "peak_rss_mb": peak[pid] / 1024 ** 2,
+        })
+    return results
+
+
+# =============================
+# SCENARIOS
+# =============================
+
+class State:
+    """Accounts and payloads prepared before the run starts."""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.admin_token = ""
+        self.students: List[dict] = []
+        self.student_tokens: List[str] = []
+        self.bulk_zip = b""
+
+
+async def login_storm(session: Session, state: State):
+    student = session.rng.choice(state.students)
+    await session.request(
+        "POST /auth/login", "POST", "/api/auth/login",
+        json={"username": student["username"], "password": PASSWORD}
+    )
+
+
+async def admin_tabs(session: Session, state: State):
+    # Admins keep returning to the student list between other tabs
+    name, path = session.rng.choice(ADMIN_TABS)
+    await session.request("GET /admin/students", "GET", "/api/admin/students", token=state.admin_token)
+    await session.request(name, "GET", path, token=state.admin_token)
+    await session.request("GET /admin/students", "GET", "/api/admin/students", token=state.admin_token)
+
+
+async def eulogy_spike(session: Session, state: State):
+    response = await session.request("GET /eulogies", "GET", "/api/eulogies")
+    eulogies = response.json() if response is not None and not response.is_error else []
+    if eulogies:
+        eulogy = session.rng.choice(eulogies)
+        await session.request("GET /eulogies/{id}/download", "GET", f"/api/eulogies/{eulogy['id']}/download")
+
+
+async def certificate_download(session: Session, state: State):
+    token = session.rng.choice(state.student_tokens)
+    await session.request("GET /student/certificate", "GET", "/api/student/certificate", token=token)
+
+
+async def bulk_upload(session: Session, state: State):
+    await session.request(
+        "POST /admin/certificates/bulk", "POST", "/api/admin/certificates/bulk", token=state.admin_token,
+        files={"file": ("certificates.zip", state.bulk_zip, "application/zip")}
+    )
+
+
+async def mixed(session: Session, state: State):
+    scenario = session.rng.choices(list(MIX), weights=list(MIX.values()))[0]
+    await SCENARIOS[scenario](session, state)
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "admin_tabs": admin_tabs,
+    "eulogy_spike": eulogy_spike,
+    "certificate_download": certificate_download,
+    "bulk_upload": bulk_upload,
+    "mixed": mixed,
+}
+
+
+def certificates_zip(id_numbers: List[str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for id_number in id_numbers:
+            archive.writestr(f"{id_number}.pdf", PDF)
+    return buffer.getvalue()
+
+
+async def prepare(client: httpx.AsyncClient, args) -> State:
+    state = State(random.Random(args.seed))
+    state.admin_token = await login(client, args.admin_username, args.admin_password)
+    response = await client.get("/api/admin/students", headers=auth(state.admin_token))
+    response.raise_for_status()
+    state.students = sorted(
+        (student for student in response.json() if student["username"].startswith(PREFIX)),
+        key=lambda student: student["username"]
+    )
+    if not state.students:
+        sys.exit("No load-test students found; run the seed command first")
+
+    if args.scenario in ("certificate_download", "mixed"):
+        eligible = [student for student in state.students if student["can_download_certificate"]]
+        if not eligible:
+            sys.exit("No seeded student can download a certificate; run the seed command again")
+        accounts = state.rng.sample(eligible, min(args.accounts, len(eligible)))
+        slots = asyncio.Semaphore(8)
+
+        async def student_login(student: dict) -> str:
+            async with slots:
+                return await login(client, student["username"], PASSWORD)
+
+        state.student_tokens = await asyncio.gather(*(student_login(student) for student in accounts))
+
+    if args.scenario in ("bulk_upload", "mixed"):
+        sample = state.rng.sample(state.students, min(args.bulk_size, len(state.students)))
+        state.bulk_zip = certificates_zip([student["id_number"] for student in sample])
+    return state
+
+
+# =============================
+# COMMANDS
+# =============================
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        state = await prepare(client, args)
+        scenario = SCENARIOS[args.scenario]
+        recorder = Recorder()
+        slots = asyncio.Semaphore(args.concurrency)
+        start = time.perf_counter()
+        measure_from = start + args.warmup
+        end = measure_from + args.duration
+
+        numbers = itertools.count()
+
+        async def iteration(due: Optional[float], measured: bool):
+            rng = random.Random(f"{args.seed}:{next(numbers)}")
+            async with slots:
+                session = Session(client, recorder if measured else None, due, rng)
+                try:
+                    await scenario(session, state)
+                except Exception as error:
+                    if measured:
+                        recorder.add("scenario", 0.0, type(error).__name__)
+
+        async def open_loop():
+            tasks = set()
+            for number in range(int((end - start) * args.rps)):
+                due = start + number / args.rps
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(iteration(due, due >= measure_from))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+
+        async def closed_loop():
+            async def user():
+                while (now := time.perf_counter()) < end:
+                    await iteration(None, now >= measure_from)
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+
+        async def sample():
+            await asyncio.sleep(args.warmup)
+            return await sample_processes(args.pid, stopped)
+
+        stopped = asyncio.Event()
+        sampler = asyncio.create_task(sample())
+        await (open_loop() if args.rps else closed_loop())
+        # Iterations due just before the end finish afterwards; throughput covers them too
+        elapsed = max(time.perf_counter(), end) - measure_from
+        stopped.set()
+        processes = await sampler
+
+    report = {
+        "meta": {
+            "scenario": args.scenario,
+            "rps": args.rps,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "accounts": len(state.student_tokens),
+            "students": len(state.students),
+            "url": args.url,
+            "started_at": datetime.utcnow().isoformat(),
+            "commit": git_commit(),
+            "cpus": os.cpu_count(),
+        },
+        "elapsed": elapsed,
+        "bytes_received": recorder.bytes_received,
+        "requests": recorder.summary(elapsed),
+        "processes": processes,
+    }
+    print_report(report)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+async def seed(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        token = await login(client, args.admin_username, args.admin_password)
+        slots = asyncio.Semaphore(8)
+
+        async def create(number: int):
+            async with slots:
+                response = await client.post("/api/admin/students", headers=auth(token), json={
+                    "username": f"{PREFIX}{number:05d}",
+                    "password": PASSWORD,
+                    "full_name": f"Load Test {number}",
+                    "id_number": f"LT{number:06d}",
+                })
+                # 400 means the account exists from an earlier seed
+                if response.status_code == 400:
+                    return None
+                response.raise_for_status()
+                student_id = response.json()["id"]
+                # Seeded per student, as the creates run concurrently
+                rng = random.Random(f"{args.seed}:{number}")
+                scores = {
+                    subject: rng.randint(55, 95)
+                    for subject in ("ms_word", "ms_excel", "ms_powerpoint", "ms_access", "computer_intro")
+                }
+                await client.put(f"/api/admin/students/{student_id}/academic", headers=auth(token), json=scores)
+                # Every tenth student has a balance, so the worklists are not empty
+                paid = 20000.0 if number % 10 else 15000.0
+                await client.put(
+                    f"/api/admin/students/{student_id}/finance", headers=auth(token),
+                    json={"total_fees": 20000.0, "paid_amount": paid}
+                )
+                return student_id
+
+        created = [
+            student_id for student_id in await asyncio.gather(*(create(n) for n in range(args.students)))
+            if student_id is not None
+        ]
+
+        response = await client.post(
+            "/api/admin/certificates/bulk", headers=auth(token),
+            files={"file": ("certificates.zip", certificates_zip([f"LT{n:06d}" for n in range(args.students)]))}
+        )
+        response.raise_for_status()
+        certificates = len(response.json()["matched"])
+
+        response = await client.get("/api/eulogies")
+        response.raise_for_status()
+        if not response.json():
+            response = await client.post(
+                "/api/admin/eulogies", headers=auth(token),
+                data={"title": "Load test eulogy"}, files={"file": ("eulogy.pdf", PDF, "application/pdf")}
+            )
+            response.raise_for_status()
+    print(f"created {len(created)} students, attached {certificates} certificates")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    meta = report["meta"]
+    load = f"{meta['rps']} iterations/s" if meta["rps"] else f"{meta['concurrency']} users"
+    print(f"scenario:        {meta['scenario']} at {load}, {meta['duration']} s after {meta['warmup']} s warmup")
+    print(f"{'request':<36}{'count':>8}{'err %':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'req/s':>8}")
+    for name, stats in report["requests"].items():
+        print(
+            f"{name:<36}{stats['count']:>8}{stats['error_rate'] * 100:>8.2f}{stats['p50_ms']:>9.1f}"
+            f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}{stats['throughput']:>8.1f}"
+        )
+    for name, stats in report["requests"].items():
+        for error, count in sorted(stats["errors"].items()):
+            print(f"error:           {name} {error} x{count}")
+    for process in report["processes"]:
+        print(
+            f"server:          {process['name']} ({process['pid']}) cpu {process['cpu_percent']:.0f}%, "
+            f"rss mean {process['mean_rss_mb']:.1f} MB, peak {process['peak_rss_mb']:.1f} MB"
+        )
+
+
+def compare(args):
+    before, after = (json.loads(Path(path).read_text()) for path in (args.before, args.after))
+    for key in ("scenario", "rps", "concurrency", "duration", "seed"):
+        if before["meta"][key] != after["meta"][key]:
+            print(f"warning:         {key} differs ({before['meta'][key]} vs {after['meta'][key]})")
+    print(f"commits:         {before['meta']['commit']} -> {after['meta']['commit']}")
+
+    def change(old: float, new: float) -> str:
+        return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+
+    columns = ("p50_ms", "p95_ms", "p99_ms", "throughput")
+    print(f"{'request':<36}" + "".join(f"{column:>22}" for column in columns) + f"{'err %':>16}")
+    for name in sorted(set(before["requests"]) | set(after["requests"])):
+        old, new = before["requests"].get(name), after["requests"].get(name)
+        if old is None or new is None:
+            print(f"{name:<36}only in {'after' if old is None else 'before'}")
+            continue
+        cells = "".join(
+            f"{f'{old[column]:.1f} -> {new[column]:.1f} {change(old[column], new[column])}':>22}"
+            for column in columns
+        )
+        errors = f"{old['error_rate'] * 100:.2f} -> {new['error_rate'] * 100:.2f}"
+        print(f"{name:<36}{cells}{errors:>16}")
+    old_processes = {process["name"]: process for process in before["processes"]}
+    for process in after["processes"]:
+        old = old_processes.get(process["name"])
+        if old is not None:
+            print(
+                f"server:          {process['name']} cpu {old['cpu_percent']:.0f}% -> {process['cpu_percent']:.0f}%, "
+                f"peak rss {old['peak_rss_mb']:.1f} -> {process['peak_rss_mb']:.1f} MB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def server_options(command):
+        command.add_argument("--url", default="http://localhost:8001")
+        command.add_argument("--admin-username", default="admin")
+        command.add_argument("--admin-password", default="Twoemweb@2020")
+        command.add_argument("--seed", type=int, default=1)
+        command.add_argument("--timeout", type=float, default=30.0)
+
+    seed_command = commands.add_parser("seed", help="create load-test students, certificates and a eulogy")
+    server_options(seed_command)
+    seed_command.add_argument("--students", type=int, default=200, help="at most 1000, the admin list limit")
+
+    run_command = commands.add_parser("run", help="run a scenario")
+    server_options(run_command)
+    run_command.add_argument("scenario", choices=list(SCENARIOS))
+    run_command.add_argument("--rps", type=float, default=0.0, help="iterations started per second; 0 runs closed loop")
+    run_command.add_argument("--concurrency", type=int, default=64, help="iterations in flight at most")
+    run_command.add_argument("--duration", type=float, default=60.0, help="measured seconds")
+    run_command.add_argument("--warmup", type=float, default=10.0, help="unmeasured seconds first")
+    run_command.add_argument("--accounts", type=int, default=50, help="students logged in for downloads")
+    run_command.add_argument("--bulk-size", type=int, default=50, help="certificates per bulk upload")
+    run_command.add_argument("--pid", type=int, action="append", default=[], help="server process to measure")
+    run_command.add_argument("--output", help="write results as JSON for compare")
+
+    compare_command = commands.add_parser("compare", help="compare two JSON results")
+    compare_command.add_argument("before")
+    compare_command.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        asyncio.run(seed(args))
+    elif args.command == "run":
+        asyncio.run(run(args))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Compare the standard and FAST_SERIALIZATION paths for list endpoints.
+
+Standard path: build a response model per document, validate the list
+against response_model again and encode with the stdlib json encoder, as
+FastAPI does. Fast path: trusted serializers plus orjson.
+
+    python benchmarks/serialization.py
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "twoem_benchmark")
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from server import (  # noqa: E402
+    DownloadFileResponse,
+    EulogyResponse,
+    Student,
+    StudentResponse,
+    serialize_download,
+    serialize_eulogy,
+    serialize_student,
+)
+
+SIZES = (1_000, 10_000)
+ROUNDS = 5
+
+
+def make_download(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"Handout {i}",
+        "description": "Course material for the computer packages class",
+        "filename": f"handout_{i}.pdf",
+        "file_type": "public",
+        "uploaded_at": datetime.utcnow(),
+        "uploaded_by": str(uuid.uuid4()),
+        "download_count": i,
+        "is_active": True,
+    }
+
+
+def make_eulogy(i: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "title": f"Celebrating the life of {i}",
+        "description": "Order of service",
+        "filename": f"eulogy_{i}.pdf",
+        "uploaded_at": now,
+        "expires_at": now + timedelta(days=7),
+        "uploaded_by": str(uuid.uuid4()),
+        "is_active": True,
+    }
+
+
+def make_student(i: int) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "full_name": f"Student {i}",
+        "id_number": f"{30000000 + i}",
+        "email": f"student{i}@example.com",
+        "phone": "0712345678",
+        "parent_contacts": {"father_name": "Parent", "father_phone": "0700000000"},
+        "academic_record": {
+            "ms_word": 70, "ms_excel": 65, "ms_powerpoint": 80,
+            "ms_access": 55, "computer_intro": 90, "updated_at": now,
+        },
+        "finance_record": {
+            "total_fees": 10000.0, "paid_amount": 10000.0, "balance": 0.0,
+            "payment_reference": "MPESA123", "last_payment_date": now,
+            "is_cleared": True, "updated_at": now,
+        },
+        "certificate": None,
+        "average_score": 72.0,
+        "has_certificate": False,
+        "certificate_eligible": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def standard_student(document: dict) -> StudentResponse:
+    # get_student_response without the user lookup
+    student = Student(**document)
+    return StudentResponse(
+        id=student.id,
+        username="student",
+        full_name=student.full_name,
+        id_number=student.id_number,
+        email=student.email,
+        phone=student.phone,
+        parent_contacts=student.parent_contacts,
+        academic_record=student.academic_record,
+        finance_record=student.finance_record,
+        certificate=student.certificate,
+        has_certificate=student.has_certificate,
+        can_download_certificate=student.has_certificate and student.certificate_eligible,
+        average_score=student.average_score,
+    )
+
+
+def standard_path(documents, build, model) -> bytes:
+    items = [build(document) for document in documents]
+    validated = TypeAdapter(List[model]).validate_python(items)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(documents, serialize) -> bytes:
+    return orjson.dumps([serialize(document) for document in documents])
+
+
+def best_of(function) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    now = datetime.utcnow()
+    cases = [
+        ("downloads", make_download,
+         lambda d: DownloadFileResponse(**d), DownloadFileResponse, serialize_download),
+        ("eulogies", make_eulogy,
+         lambda d: EulogyResponse(**d, days_remaining=max(0, (d["expires_at"] - now).days)),
+         EulogyResponse, lambda d: serialize_eulogy(d, now)),
+        ("students", make_student,
+         standard_student, StudentResponse, lambda d: serialize_student(d, "student")),
+    ]
+
+    print(f"{'endpoint':<10} {'items':>6} {'standard ms':>12} {'fast ms':>9} {'speedup':>8} {'bytes':>10}")
+    for name, make, build, model, serialize in cases:
+        for size in SIZES:
+            documents = [make(i) for i in range(size)]
+            standard = best_of(lambda: standard_path(documents, build, model))
+            fast = best_of(lambda: fast_path(documents, serialize))
+            body = fast_path(documents, serialize)
+            print(
+                f"{name:<10} {size:>6} {standard * 1000:>12.1f} {fast * 1000:>9.1f} "
+                f"{standard / fast:>7.1f}x {len(body):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
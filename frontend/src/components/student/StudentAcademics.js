@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
-import { AcademicCapIcon, TrophyIcon } from '@heroicons/react/24/outline';
+import { AcademicCapIcon, CloudArrowDownIcon, TrophyIcon } from '@heroicons/react/24/outline';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API_BASE = `${BACKEND_URL}/api`;
@@ -8,6 +8,7 @@ const API_BASE = `${BACKEND_URL}/api`;
 const StudentAcademics = () => {
   const [student, setStudent] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [downloading, setDownloading] = useState(false);
 
   useEffect(() => {
     fetchStudentProfile();
@@ -24,6 +25,39 @@ const StudentAcademics = () => {
     }
   };
 
+  const handleDownloadTranscript = async () => {
+    setDownloading(true);
+    try {
+      const response = await axios.get(`${API_BASE}/student/transcript.pdf`, {
+        responseType: 'blob',
+      });
+
+      const url = window.URL.createObjectURL(new Blob([response.data], { type: 'application/pdf' }));
+      const link = document.createElement('a');
+      link.href = url;
+
+      const contentDisposition = response.headers['content-disposition'];
+      let filename = 'transcript.pdf';
+      if (contentDisposition) {
+        const filenameMatch = contentDisposition.match(/filename="(.+)"/);
+        if (filenameMatch) {
+          filename = filenameMatch[1];
+        }
+      }
+
+      link.setAttribute('download', filename);
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Error downloading transcript:', error);
+      alert(error.response?.data?.detail || 'Error downloading transcript');
+    } finally {
+      setDownloading(false);
+    }
+  };
+
   const getScoreColor = (score) => {
     if (score === null || score === undefined) return 'bg-gray-200 text-gray-700';
     if (score >= 80) return 'bg-green-100 text-green-800 border-green-200';
@@ -78,9 +112,19 @@ const StudentAcademics = () => {
   return (
     <div className="p-8">
       <div className="max-w-6xl mx-auto">
-        <div className="mb-8">
-          <h2 className="text-2xl font-bold text-gray-900">Academic Performance</h2>
-          <p className="text-gray-600 mt-2">Track your progress in Microsoft Office applications and computer fundamentals</p>
+        <div className="mb-8 flex items-start justify-between">
+          <div>
+            <h2 className="text-2xl font-bold text-gray-900">Academic Performance</h2>
+            <p className="text-gray-600 mt-2">Track your progress in Microsoft Office applications and computer fundamentals</p>
+          </div>
+          <button
+            onClick={handleDownloadTranscript}
+            disabled={downloading}
+            className="inline-flex items-center px-4 py-2 border border-transparent text-sm font-medium rounded-md text-white bg-blue-600 hover:bg-blue-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-blue-500 disabled:opacity-50 disabled:cursor-not-allowed"
+          >
+            <CloudArrowDownIcon className="h-5 w-5 mr-2" />
+            {downloading ? 'Downloading...' : 'Download Transcript'}
+          </button>
         </div>
 
         {/* Overall Performance Card */}
@@ -39,6 +39,28 @@ const StudentCertificate = () => {
     }
 
     setDownloading(true);
+    try {
+      // Prefer a short-lived signed link the browser can download directly
+      const linkResponse = await axios.get(`${API_BASE}/student/certificate/link`);
+      const link = document.createElement('a');
+      link.href = `${BACKEND_URL}${linkResponse.data.url}`;
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+    } catch (error) {
+      if (error.response?.status === 409) {
+        // Certificates stored before the blob store can only be fetched directly
+        await downloadCertificateBlob();
+      } else {
+        console.error('Error downloading certificate:', error);
+        alert(error.response?.data?.detail || 'Error downloading certificate');
+      }
+    } finally {
+      setDownloading(false);
+    }
+  };
+
+  const downloadCertificateBlob = async () => {
     try {
       const response = await axios.get(`${API_BASE}/student/certificate`, {
         responseType: 'blob',
@@ -70,8 +92,6 @@ const StudentCertificate = () => {
     } catch (error) {
       console.error('Error downloading certificate:', error);
       alert(error.response?.data?.detail || 'Error downloading certificate');
-    } finally {
-      setDownloading(false);
     }
   };
 
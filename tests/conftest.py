@@ -0,0 +1,42 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by name, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# server reads its database settings at import; it connects lazily
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "twoem_test")
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_url():
+    """URL of a local mongod; tests that need one are skipped without it."""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(TEST_MONGO_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"no mongod at {TEST_MONGO_URL}")
+    finally:
+        client.close()
+    return TEST_MONGO_URL
+
+
+@pytest.fixture
+def mongo_db_name(mongo_url):
+    """A throwaway database name, dropped after the test."""
+    from pymongo import MongoClient
+
+    name = f"twoem_test_{uuid.uuid4().hex[:8]}"
+    yield name
+    client = MongoClient(mongo_url)
+    client.drop_database(name)
+    client.close()
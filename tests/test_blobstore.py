@@ -0,0 +1,176 @@
+import asyncio
+import base64
+import hashlib
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from blobstore import DELETE_TIMEOUT, BlobStore
+
+DATA = b"certificate " * 1000
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+async def chunks_of(data: bytes, size: int = 4096):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def run_with_store(mongo_url, mongo_db_name, root, scenario, compress=False):
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        try:
+            return await scenario(BlobStore(root, client[mongo_db_name].blobs, compress=compress))
+        finally:
+            client.close()
+
+    return asyncio.run(main())
+
+
+class GatedRefs:
+    """Wraps a refs collection so a release pauses once it has claimed a deletion, until `gate` is set."""
+
+    def __init__(self, refs):
+        self.refs = refs
+        self.claimed = asyncio.Event()
+        self.gate = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.refs, name)
+
+    async def update_one(self, query, update, *args, **kwargs):
+        result = await self.refs.update_one(query, update, *args, **kwargs)
+        if "deleting" in update.get("$set", {}):
+            self.claimed.set()
+            await self.gate.wait()
+        return result
+
+
+def test_identical_uploads_share_one_file_and_count_references(mongo_url, mongo_db_name, tmp_path):
+    async def scenario(store):
+        first = await store.write(chunks_of(DATA))
+        second = await store.write(chunks_of(DATA, size=1000))
+        return first, second, await store.refs.find_one({"_id": SHA256})
+
+    first, second, ref = run_with_store(mongo_url, mongo_db_name, tmp_path, scenario)
+    assert first.sha256 == second.sha256 == SHA256
+    assert ref["refcount"] == 2
+    assert ref["size"] == len(DATA)
+    assert [path.name for path in tmp_path.glob("*/*") if path.parent.name != "tmp"] == [SHA256]
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_releasing_the_last_reference_deletes_the_file(mongo_url, mongo_db_name, tmp_path):
+    async def scenario(store):
+        await store.write(chunks_of(DATA))
+        await store.write(chunks_of(DATA))
+        await store.release(SHA256)
+        kept = store.exists(SHA256), await store.refs.find_one({"_id": SHA256})
+        await store.release(SHA256)
+        return kept, store.exists(SHA256), await store.refs.find_one({"_id": SHA256})
+
+    (kept_file, kept_ref), exists, ref = run_with_store(mongo_url, mongo_db_name, tmp_path, scenario)
+    assert kept_file and kept_ref["refcount"] == 1
+    assert not exists
+    assert ref is None
+
+
+def test_compressed_blob_is_deleted_with_its_suffix(mongo_url, mongo_db_name, tmp_path):
+    async def scenario(store):
+        blob = await store.write(chunks_of(DATA))
+        path = store.locate(SHA256).path
+        await store.release(SHA256)
+        return blob, path
+
+    blob, path = run_with_store(mongo_url, mongo_db_name, tmp_path, scenario, compress=True)
+    assert blob.encoding is not None and path.suffix in (".gz", ".zst")
+    assert not path.exists()
+
+
+def test_write_racing_a_release_keeps_the_file(mongo_url, mongo_db_name, tmp_path):
+    async def scenario(store):
+        await store.write(chunks_of(DATA))
+        refs = store.refs = GatedRefs(store.refs)
+        # The release drops the last reference and claims the deletion, but has not unlinked the file yet
+        release = asyncio.create_task(store.release(SHA256))
+        await refs.claimed.wait()
+        assert store.exists(SHA256)
+
+        write = asyncio.create_task(store.write(chunks_of(DATA)))
+        while (await refs.find_one({"_id": SHA256}))["refcount"] < 1:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        # The writer holds its reference but must not rely on the file the release is about to unlink
+        assert not write.done()
+
+        refs.gate.set()
+        await release
+        blob = await write
+        data = b"".join([chunk async for chunk in store.read(SHA256)])
+        return blob, data, await refs.find_one({"_id": SHA256})
+
+    blob, data, ref = run_with_store(mongo_url, mongo_db_name, tmp_path, scenario)
+    assert blob.sha256 == SHA256
+    assert data == DATA
+    assert ref["refcount"] == 1
+    assert "deleting" not in ref
+
+
+def test_write_takes_over_an_abandoned_deletion(mongo_url, mongo_db_name, tmp_path):
+    async def scenario(store):
+        # A process died between claiming the deletion and finishing it
+        await store.refs.insert_one({
+            "_id": SHA256,
+            "refcount": 0,
+            "size": len(DATA),
+            "encoding": "gzip",
+            "stored_size": 1,
+            "deleting": True,
+            "deleting_at": datetime.utcnow() - DELETE_TIMEOUT * 2
+        })
+        blob = await asyncio.wait_for(store.write(chunks_of(DATA)), timeout=5)
+        return blob, store.locate(SHA256), await store.refs.find_one({"_id": SHA256})
+
+    blob, location, ref = run_with_store(mongo_url, mongo_db_name, tmp_path, scenario)
+    assert location is not None and location.encoding is None
+    assert ref["refcount"] == 1
+    assert "deleting" not in ref
+    # The document describes the file now on disk, not the one that was deleted
+    assert (ref["encoding"], ref["stored_size"]) == (None, len(DATA)) == (blob.encoding, blob.stored_size)
+
+
+def test_release_without_a_reference_is_a_no_op(mongo_url, mongo_db_name, tmp_path):
+    async def scenario(store):
+        await store.release(None)
+        await store.release(hashlib.sha256(b"never stored").hexdigest())
+        return await store.refs.count_documents({})
+
+    assert run_with_store(mongo_url, mongo_db_name, tmp_path, scenario) == 0
+
+
+def test_migration_stores_active_downloads_and_drops_deleted_ones(mongo_url, mongo_db_name, tmp_path, monkeypatch):
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[mongo_db_name]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "blob_store", BlobStore(tmp_path, db.blobs, compress=False))
+        try:
+            file_data = base64.b64encode(DATA).decode()
+            await db.downloads.insert_one({"id": "active", "is_active": True, "file_data": file_data})
+            await db.downloads.insert_one({"id": "deleted", "is_active": False, "file_data": file_data})
+            migrated = await server.migrate_legacy_files()
+            return (
+                migrated,
+                await db.downloads.find_one({"id": "active"}),
+                await db.downloads.find_one({"id": "deleted"}),
+                await db.blobs.find_one({"_id": SHA256})
+            )
+        finally:
+            client.close()
+
+    migrated, active, deleted, ref = asyncio.run(main())
+    assert migrated == 1
+    assert active["sha256"] == SHA256 and "file_data" not in active
+    assert "sha256" not in deleted and "file_data" not in deleted
+    assert ref["refcount"] == 1
@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import pytest
+
+from caching import BlobCache, ResponseCache, SingleFlight
+
+
+def test_response_cache_hits_until_invalidated():
+    cache = ResponseCache("test", ttl=60)
+    assert cache.get("listing") is None
+    entry = cache.set("listing", b"[1]")
+    assert cache.get("listing") is entry
+
+    cache.invalidate("listing")
+    assert cache.get("listing") is None
+    assert cache.version("listing") == 1
+
+
+def test_response_cache_entries_expire(monkeypatch):
+    cache = ResponseCache("test", ttl=60)
+    cache.set("listing", b"[1]", ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert cache.get("listing") is None
+
+
+def test_response_cache_ttl_is_capped_by_cache_ttl():
+    cache = ResponseCache("test", ttl=10)
+    entry = cache.set("listing", b"[]", ttl=3600)
+    assert entry.ttl_remaining <= 10
+
+
+def test_response_cache_does_not_store_fill_started_before_invalidation():
+    cache = ResponseCache("test", ttl=60)
+    version = cache.version("listing")
+    cache.invalidate("listing")
+    # A fill that read the database before the invalidation is returned but not kept
+    entry = cache.set("listing", b"stale", version=version)
+    assert entry.body == b"stale"
+    assert cache.get("listing") is None
+
+
+def test_response_cache_ignores_old_or_duplicate_versions():
+    cache = ResponseCache("test", ttl=60)
+    assert cache.invalidate("listing", version=3)
+    cache.set("listing", b"fresh")
+    assert not cache.invalidate("listing", version=3)
+    assert not cache.invalidate("listing", version=2)
+    assert cache.get("listing") is not None
+    assert cache.invalidate("listing", version=4)
+    assert cache.get("listing") is None
+
+
+def test_response_cache_guard_bypasses_entries():
+    cache = ResponseCache("test", ttl=60)
+    cache.set("listing", b"[]")
+    current = True
+    cache.guard = lambda: current
+    assert cache.get("listing") is not None
+    current = False
+    assert cache.get("listing") is None
+
+
+def test_cached_response_etag_follows_body():
+    cache = ResponseCache("test", ttl=60)
+    first = cache.set("a", b"[1]")
+    same = cache.set("b", b"[1]")
+    other = cache.set("c", b"[2]")
+    assert first.etag == same.etag != other.etag
+    assert first.etag.startswith('"') and first.etag.endswith('"')
+
+
+def test_singleflight_runs_work_once_for_concurrent_callers():
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("key", load) for _ in range(5)))
+        again = await flight.do("key", load)
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results == [1] * 5
+    # The key is released once the call finishes
+    assert again == 2
+
+
+def test_singleflight_keeps_keys_separate():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def value(v):
+            await asyncio.sleep(0)
+            return v
+
+        return await asyncio.gather(flight.do("a", lambda: value("a")), flight.do("b", lambda: value("b")))
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+def test_singleflight_shares_errors_with_followers():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flight = SingleFlight("test")
+        return await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_singleflight_leader_cancellation_does_not_cancel_followers():
+    async def main():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("key", load))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        release.set()
+        return await follower, leader
+
+    result, leader = asyncio.run(main())
+    assert result == "done"
+    assert leader.cancelled()
+
+
+def test_blob_cache_evicts_least_recently_used_within_budget():
+    cache = BlobCache(max_bytes=10, max_object_bytes=10)
+    assert cache.put("a", b"aaaa")
+    assert cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # "b" is now least recently used
+    assert cache.put("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.resident_bytes == 8
+
+
+def test_blob_cache_replacing_a_key_updates_resident_bytes():
+    cache = BlobCache(max_bytes=10, max_object_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("a", b"aa")
+    assert cache.resident_bytes == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_blob_cache_refuses_and_remembers_oversize_objects():
+    cache = BlobCache(max_bytes=100, max_object_bytes=4, max_oversize_keys=2)
+    assert not cache.put("big", b"12345")
+    assert cache.is_oversize("big")
+    assert cache.get("big") is None
+    assert cache.resident_bytes == 0
+
+    cache.mark_oversize("other")
+    cache.mark_oversize("third")
+    # Only the most recent keys are remembered
+    assert not cache.is_oversize("big")
+    assert cache.is_oversize("third")
+
+
+def test_blob_cache_stats_report_hit_ratio():
+    cache = BlobCache(max_bytes=10, max_object_bytes=10)
+    cache.put("a", b"a")
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_ratio"] == pytest.approx(0.5)
@@ -0,0 +1,139 @@
+import asyncio
+import csv
+import io
+import zipfile
+from datetime import datetime
+from xml.etree import ElementTree
+
+import pytest
+
+from exports import ZipEntry, column_letter, csv_stream, xlsx_stream, zip_stream
+from server import unique_entry_name
+
+SHEET_NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+async def batches_of(rows, size=2):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+async def chunks_of(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def collect(stream) -> bytes:
+    async def main():
+        return b"".join([chunk async for chunk in stream])
+    return asyncio.run(main())
+
+
+def test_csv_stream_writes_bom_header_and_formatted_rows():
+    rows = [
+        ["Ann", 71.5, datetime(2024, 5, 1, 9, 30)],
+        ["Bob, Jr.", None, None],
+        ["Zoë", 60, None],
+    ]
+    data = collect(csv_stream(["name", "average", "updated"], batches_of(rows)))
+
+    assert data.startswith(b"\xef\xbb\xbf")
+    parsed = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+    assert parsed == [
+        ["name", "average", "updated"],
+        ["Ann", "71.5", "2024-05-01T09:30:00"],
+        ["Bob, Jr.", "", ""],
+        ["Zoë", "60", ""],
+    ]
+
+
+def test_csv_stream_yields_one_chunk_per_batch():
+    async def main():
+        return [chunk async for chunk in csv_stream(["n"], batches_of([[i] for i in range(6)], size=2))]
+    assert len(asyncio.run(main())) == 4  # header + 3 batches
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_zip_stream_is_readable_without_sizes_up_front(compression):
+    async def entries():
+        yield ZipEntry("a.txt", chunks_of(b"hello ", b"world"))
+        yield ZipEntry("dir/b.bin", chunks_of(b"\x00" * 100_000), size=100_000, modified=datetime(2024, 1, 2, 3, 4, 6))
+        yield ZipEntry("empty.txt", chunks_of())
+
+    data = collect(zip_stream(entries(), compression=compression))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.txt", "dir/b.bin", "empty.txt"]
+        assert archive.read("a.txt") == b"hello world"
+        assert archive.read("dir/b.bin") == b"\x00" * 100_000
+        assert archive.read("empty.txt") == b""
+        assert archive.getinfo("dir/b.bin").date_time == (2024, 1, 2, 3, 4, 6)
+
+
+@pytest.mark.parametrize("index, letters", [
+    (0, "A"), (25, "Z"), (26, "AA"), (51, "AZ"), (52, "BA"), (701, "ZZ"), (702, "AAA")
+])
+def test_column_letter(index, letters):
+    assert column_letter(index) == letters
+
+
+def test_xlsx_stream_writes_typed_cells():
+    rows = [
+        ["Ann <&>", 71.5, True, datetime(2024, 5, 1)],
+        ["Bad\x01char", 3, None, None],
+    ]
+    data = collect(xlsx_stream(["name", "average", "cleared", "updated"], batches_of(rows), sheet_name='Students "A"'))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert {"[Content_Types].xml", "_rels/.rels", "xl/workbook.xml", "xl/worksheets/sheet1.xml"} <= set(
+            archive.namelist()
+        )
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+
+    assert workbook.find("s:sheets/s:sheet", SHEET_NS).get("name") == 'Students "A"'
+    cells = {
+        cell.get("r"): (
+            cell.get("t"),
+            cell.findtext("s:v", namespaces=SHEET_NS) or cell.findtext("s:is/s:t", namespaces=SHEET_NS)
+        )
+        for cell in sheet.iter(f"{{{SHEET_NS['s']}}}c")
+    }
+    assert cells["A1"] == ("inlineStr", "name")
+    assert cells["A2"] == ("inlineStr", "Ann <&>")
+    assert cells["B2"] == (None, "71.5")
+    assert cells["C2"] == ("b", "1")
+    assert cells["D2"] == ("inlineStr", "2024-05-01T00:00:00")
+    assert cells["A3"] == ("inlineStr", "Badchar")
+    assert cells["B3"] == (None, "3")
+    assert "C3" not in cells and "D3" not in cells
+
+
+def test_xlsx_stream_opens_in_openpyxl():
+    openpyxl = pytest.importorskip("openpyxl")
+    rows = [[f"Student {i}", i] for i in range(50)]
+    data = collect(xlsx_stream(["name", "score"], batches_of(rows, size=7)))
+
+    sheet = openpyxl.load_workbook(io.BytesIO(data)).active
+    values = list(sheet.iter_rows(values_only=True))
+    assert values[0] == ("name", "score")
+    assert values[1:] == [tuple(row) for row in rows]
+
+
+@pytest.mark.parametrize("id_number, name", [
+    ("12345678", "12345678.pdf"),
+    ("../../etc/passwd", "____etc_passwd.pdf"),
+    ("..\\..\\boot.ini", "____boot.ini.pdf"),
+    ("/absolute", "_absolute.pdf"),
+    ("a..b", "a_b.pdf"),
+    ("tab\there", "tab_here.pdf"),
+])
+def test_unique_entry_name_cannot_escape_the_archive(id_number, name):
+    assert unique_entry_name(set(), id_number) == name
+
+
+def test_unique_entry_name_suffixes_names_that_collide_after_cleaning():
+    names = set()
+    assert [unique_entry_name(names, id_number) for id_number in ("a/b", "a\\b", "a_b")] == [
+        "a_b.pdf", "a_b-2.pdf", "a_b-3.pdf"
+    ]
@@ -0,0 +1,196 @@
+import asyncio
+import gzip
+import hashlib
+
+import pytest
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import server
+from blobstore import BlobStore
+from caching import BlobCache
+
+DATA = b"%PDF-1.4 " + b"certificate " * 1000
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path, refs=None)
+    monkeypatch.setattr(server, "blob_store", store)
+    monkeypatch.setattr(server, "BLOB_DIR", tmp_path)
+    monkeypatch.setattr(server, "blob_cache", BlobCache(1024 * 1024, 1024 * 1024))
+    return store
+
+
+def put(store: BlobStore, encoding=None):
+    path = store.path(SHA256, encoding)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(gzip.compress(DATA) if encoding == "gzip" else DATA)
+    return path
+
+
+def serve(accept_encoding: str = "gzip"):
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [
+        (b"accept-encoding", accept_encoding.encode())
+    ]})
+
+    async def main():
+        response = await server.blob_response(request, SHA256, "certificate.pdf", "application/pdf")
+        if isinstance(response, FileResponse):
+            return response, response.path.read_bytes()
+        if isinstance(response, StreamingResponse):
+            return response, b"".join([chunk async for chunk in response.body_iterator])
+        return response, response.body
+
+    return asyncio.run(main())
+
+
+def test_stream_mode_sends_compressed_blob_as_stored_when_accepted(store, monkeypatch):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "stream")
+    put(store, "gzip")
+    response, body = serve("gzip, br")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == DATA
+
+
+def test_stream_mode_decompresses_for_clients_without_the_coding(store, monkeypatch):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "stream")
+    put(store, "gzip")
+    response, body = serve("identity")
+    assert "content-encoding" not in response.headers
+    assert body == DATA
+
+
+def test_x_accel_redirect_mode_hands_uncompressed_blob_to_nginx(store, monkeypatch):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "x-accel-redirect")
+    put(store)
+    response, body = serve()
+    assert response.headers["x-accel-redirect"] == f"{server.X_ACCEL_REDIRECT_PREFIX}/{SHA256[:2]}/{SHA256}"
+    assert response.headers["content-type"] == "application/pdf"
+    assert "content-encoding" not in response.headers
+    assert body == b""
+
+
+def test_x_sendfile_mode_hands_uncompressed_blob_to_server(store, monkeypatch):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "x-sendfile")
+    path = put(store)
+    response, body = serve()
+    assert response.headers["x-sendfile"] == str(path)
+    assert "content-encoding" not in response.headers
+    assert body == b""
+
+
+@pytest.mark.parametrize("mode", ["x-accel-redirect", "x-sendfile"])
+def test_offload_modes_decompress_compressed_blobs_in_the_app(store, monkeypatch, mode):
+    # The proxy would replace Content-Encoding with the internal location's headers
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", mode)
+    put(store, "gzip")
+    response, body = serve("gzip")
+    assert "x-accel-redirect" not in response.headers
+    assert "x-sendfile" not in response.headers
+    assert "content-encoding" not in response.headers
+    assert body == DATA
+
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "identity"])
+def test_blobs_over_the_cache_object_cap_are_streamed_and_not_counted(store, monkeypatch, accept_encoding):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "stream")
+    monkeypatch.setattr(server, "blob_cache", BlobCache(1024 * 1024, 16))
+    put(store, "gzip")
+    for _ in range(3):
+        response, body = serve(accept_encoding)
+        assert body == (gzip.compress(DATA) if accept_encoding == "gzip" else DATA)
+    stats = server.blob_cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (0, 0, 0 if accept_encoding == "gzip" else 1)
+
+
+def test_small_blobs_are_served_from_the_cache(store, monkeypatch):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "stream")
+    put(store)
+    for _ in range(3):
+        response, body = serve()
+        assert body == DATA
+    stats = server.blob_cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 2, 1)
+
+
+def test_oversize_blob_reader_is_closed_when_caching_gives_up(store, monkeypatch):
+    monkeypatch.setattr(server, "blob_cache", BlobCache(1024 * 1024, 16))
+    put(store, "gzip")
+    closed = []
+    read = store.read
+
+    async def tracked_read(sha256):
+        try:
+            async for chunk in read(sha256, chunk_size=64):
+                yield chunk
+        finally:
+            closed.append(sha256)
+
+    monkeypatch.setattr(store, "read", tracked_read)
+
+    async def main():
+        data = await server.cached_blob_bytes(SHA256, store.locate(SHA256), encoded=False)
+        # Checked before yielding to the loop, which would otherwise close the generator later
+        return data, list(closed)
+
+    assert asyncio.run(main()) == (None, [SHA256])
+
+
+@pytest.fixture
+def signed_link(store, monkeypatch):
+    monkeypatch.setattr(server, "FILE_SERVING_MODE", "stream")
+    put(store)
+
+    def link(filename="Certificate 2024 é.pdf", media_type="application/pdf"):
+        return server.create_signed_file_link({"sha256": SHA256}, filename, media_type).url
+
+    return link
+
+
+def test_signed_link_serves_the_file(signed_link):
+    response = TestClient(server.app).get(signed_link())
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["content-type"] == "application/pdf"
+    assert "Certificate%202024%20%C3%A9.pdf" in response.headers["content-disposition"]
+
+
+def test_signed_link_with_a_bad_signature_is_refused(signed_link):
+    url = signed_link()
+    signature = url.rsplit("signature=", 1)[1]
+    forged = url.replace(signature, ("A" if signature[0] != "A" else "B") + signature[1:])
+    response = TestClient(server.app).get(forged)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Invalid file link"
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda url: url.replace("Certificate%202024", "Other%202024"),
+    lambda url: url.replace("type=application%2Fpdf", "type=text%2Fhtml"),
+    lambda url: url.replace(f"/files/{SHA256}/", f"/files/{'0' * 64}/"),
+])
+def test_signed_link_is_bound_to_its_file_name_and_type(signed_link, tamper):
+    url = signed_link()
+    assert tamper(url) != url
+    response = TestClient(server.app).get(tamper(url))
+    assert response.status_code == 403
+
+
+def test_signed_link_cannot_be_extended(signed_link):
+    url = signed_link()
+    expires = int(url.split("expires=", 1)[1].split("&", 1)[0])
+    response = TestClient(server.app).get(url.replace(f"expires={expires}", f"expires={expires + 3600}"))
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Invalid file link"
+
+
+def test_expired_signed_link_is_refused(signed_link, monkeypatch):
+    monkeypatch.setattr(server, "SIGNED_URL_TTL_SECONDS", -1)
+    response = TestClient(server.app).get(signed_link())
+    assert response.status_code == 403
+    assert response.json()["detail"] == "File link has expired"
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from caching import ResponseCache
+from invalidation import InvalidationBus
+
+
+def make_bus(db, name="listings"):
+    bus = InvalidationBus(db, max_staleness=5.0, await_time_ms=100)
+    cache = ResponseCache(name, ttl=60)
+    bus.register(cache)
+    return bus, cache
+
+
+def event(bus, key="eulogies", version=1, origin="other-worker", cache="listings"):
+    return {
+        "type": "invalidate",
+        "cache": cache,
+        "key": key,
+        "version": version,
+        "origin": origin,
+        "published_at": time.time()
+    }
+
+
+def unconnected_db():
+    # Motor connects lazily, so apply() and the guard can be tested without a server
+    return AsyncIOMotorClient("mongodb://localhost:1", serverSelectionTimeoutMS=100)["unused"]
+
+
+def test_apply_invalidates_registered_cache():
+    bus, cache = make_bus(unconnected_db())
+    cache.set("eulogies", b"[]")
+    bus.apply(event(bus, version=1))
+    assert cache.version("eulogies") == 1
+    assert cache._entries == {}
+
+
+def test_apply_ignores_replayed_and_unknown_events():
+    bus, cache = make_bus(unconnected_db())
+    bus.apply(event(bus, version=2))
+    cache.set("eulogies", b"[]")
+    # A replay after losing the cursor, and events for caches this worker lacks
+    bus.apply(event(bus, version=2))
+    bus.apply(event(bus, version=1))
+    bus.apply(event(bus, version=9, cache="other"))
+    bus.apply({"type": "init", "origin": "x", "published_at": time.time()})
+    assert "eulogies" in cache._entries
+
+
+def test_registered_cache_is_bypassed_when_bus_is_not_heard():
+    bus, cache = make_bus(unconnected_db())
+    cache.set("eulogies", b"[]")
+    assert cache.get("eulogies") is None  # never heard
+
+    bus.last_heard = time.monotonic()
+    assert cache.get("eulogies") is not None
+
+    bus.last_heard = time.monotonic() - bus.max_staleness - 1
+    assert cache.get("eulogies") is None
+
+
+def test_invalidation_reaches_other_workers(mongo_url, mongo_db_name):
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        db = client[mongo_db_name]
+        # Two buses on one database stand in for two uvicorn workers
+        first, first_cache = make_bus(db)
+        second, second_cache = make_bus(db)
+        await first.start()
+        await second.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not (first.is_current() and second.is_current()) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+
+            second_cache.set("eulogies", b"[]")
+            assert second_cache.get("eulogies") is not None
+
+            version = await first.publish(first_cache, "eulogies")
+            assert first_cache.version("eulogies") == version
+
+            while second_cache.version("eulogies") < version and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            assert second_cache.version("eulogies") == version
+            assert second_cache.get("eulogies") is None
+
+            # Versions come from a shared counter, so they keep increasing across workers
+            assert await second.publish(second_cache, "eulogies") == version + 1
+        finally:
+            await first.stop()
+            await second.stop()
+            client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from jobs import JobRunner
+
+
+def run_with_jobs(mongo_url, mongo_db_name, scenario):
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        try:
+            return await scenario(client[mongo_db_name].jobs)
+        finally:
+            client.close()
+
+    return asyncio.run(main())
+
+
+async def wait_for_count(jobs, query: dict, count: int, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while await jobs.count_documents(query) < count:
+        assert time.monotonic() < deadline, f"timed out waiting for {count} job(s) matching {query}"
+        await asyncio.sleep(0.02)
+
+
+def running_job(worker: str, heartbeat_at: datetime, attempts: int = 1) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": "test",
+        "params": {},
+        "status": "running",
+        "progress": {},
+        "result": None,
+        "error": None,
+        "attempts": attempts,
+        "worker": worker,
+        "created_by": None,
+        "created_at": datetime.utcnow(),
+        "started_at": heartbeat_at,
+        "finished_at": None,
+        "heartbeat_at": heartbeat_at
+    }
+
+
+def test_recover_requeues_stale_jobs_and_fails_exhausted_ones(mongo_url, mongo_db_name):
+    async def scenario(jobs):
+        runner = JobRunner(jobs, stale_after=60, max_attempts=3)
+        stale = datetime.utcnow() - timedelta(minutes=5)
+        interrupted = running_job("dead-worker", stale, attempts=1)
+        exhausted = running_job("dead-worker", stale, attempts=3)
+        alive = running_job("live-worker", datetime.utcnow(), attempts=1)
+        for job in (interrupted, exhausted, alive):
+            await jobs.insert_one(dict(job))
+
+        recovered = await runner.recover()
+        return recovered, [await jobs.find_one({"id": job["id"]}) for job in (interrupted, exhausted, alive)]
+
+    recovered, (interrupted, exhausted, alive) = run_with_jobs(mongo_url, mongo_db_name, scenario)
+    assert recovered == 2
+    assert (interrupted["status"], interrupted["worker"]) == ("queued", None)
+    assert exhausted["status"] == "failed"
+    assert exhausted["error"] == "Interrupted too many times"
+    assert exhausted["finished_at"] is not None
+    assert (alive["status"], alive["worker"]) == ("running", "live-worker")
+
+
+def test_start_reruns_a_job_interrupted_in_another_process(mongo_url, mongo_db_name):
+    async def scenario(jobs):
+        runner = JobRunner(jobs, poll_interval=0.05, stale_after=60)
+
+        async def handler(job):
+            return {"params": job.params}
+
+        runner.register("test", handler)
+        job = running_job("dead-worker", datetime.utcnow() - timedelta(minutes=5))
+        job["params"] = {"cohort": 7}
+        await jobs.insert_one(dict(job))
+
+        await runner.start()
+        try:
+            await wait_for_count(jobs, {"id": job["id"], "status": "done"}, 1)
+        finally:
+            await runner.stop()
+        return await jobs.find_one({"id": job["id"]}), runner.worker_id
+
+    job, worker_id = run_with_jobs(mongo_url, mongo_db_name, scenario)
+    assert job["result"] == {"params": {"cohort": 7}}
+    assert job["attempts"] == 2
+    assert job["worker"] == worker_id
+
+
+def test_worker_pool_bounds_concurrent_jobs(mongo_url, mongo_db_name):
+    async def scenario(jobs):
+        runner = JobRunner(jobs, workers=2, poll_interval=0.05)
+        running = 0
+        peak = 0
+
+        async def handler(job):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.1)
+            running -= 1
+
+        runner.register("test", handler)
+        await runner.start()
+        try:
+            for _ in range(6):
+                await runner.submit("test")
+            await wait_for_count(jobs, {"status": "done"}, 6)
+        finally:
+            await runner.stop()
+        return peak
+
+    assert run_with_jobs(mongo_url, mongo_db_name, scenario) == 2
+
+
+def test_heartbeat_keeps_running_jobs_and_lets_orphaned_ones_go_stale(mongo_url, mongo_db_name):
+    async def scenario(jobs):
+        runner = JobRunner(jobs, workers=1, poll_interval=0.05, stale_after=0.4)
+        release = asyncio.Event()
+
+        async def handler(job):
+            await release.wait()
+
+        runner.register("test", handler)
+        # A job this process claimed but whose outcome it could not record
+        orphan = running_job(runner.worker_id, datetime.utcnow())
+        await jobs.insert_one(dict(orphan))
+        await runner.start()
+        try:
+            long_running = await runner.submit("test")
+            await wait_for_count(jobs, {"id": long_running["id"], "status": "running"}, 1)
+            # Longer than stale_after: only the job whose handler is running is heartbeated
+            await asyncio.sleep(1)
+            during = await jobs.find_one({"id": long_running["id"]})
+            orphaned = await jobs.find_one({"id": orphan["id"]})
+            release.set()
+            await wait_for_count(jobs, {"status": "done"}, 2)
+        finally:
+            await runner.stop()
+        return during, orphaned, await jobs.find_one({"id": orphan["id"]})
+
+    during, orphaned, rerun = run_with_jobs(mongo_url, mongo_db_name, scenario)
+    assert (during["status"], during["attempts"]) == ("running", 1)
+    assert during["heartbeat_at"] > during["started_at"]
+    # Requeued while the only worker is busy, then run again once it is free
+    assert (orphaned["status"], orphaned["worker"]) == ("queued", None)
+    assert (rerun["status"], rerun["attempts"]) == ("done", 2)
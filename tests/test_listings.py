@@ -0,0 +1,60 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import server
+from caching import ResponseCache
+from middleware import CompressionMiddleware
+
+BODY = b"[" + b",".join(b'{"id": %d, "title": "Download %d"}' % (index, index) for index in range(100)) + b"]"
+
+
+@pytest.fixture
+def client():
+    cache = ResponseCache("test", ttl=60)
+    app = FastAPI()
+
+    @app.get("/listing")
+    async def listing(request: Request):
+        return server.public_listing_response(request, cache.get("listing") or cache.set("listing", BODY))
+
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+    return TestClient(app)
+
+
+def test_listing_etag_is_weak_and_shared_across_encodings(client):
+    compressed = client.get("/listing", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/listing", headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in identity.headers
+    assert compressed.content == identity.content == BODY
+    assert compressed.headers["etag"] == identity.headers["etag"]
+    assert compressed.headers["etag"].startswith('W/"')
+    for response in (compressed, identity):
+        assert response.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("accept_encoding", ["gzip", "identity"])
+def test_listing_revalidates_whichever_encoding_the_tag_came_with(client, accept_encoding):
+    etag = client.get("/listing", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    response = client.get("/listing", headers={"Accept-Encoding": accept_encoding, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("if_none_match", [
+    lambda etag: etag[2:],  # the strong form, as some proxies send it
+    lambda etag: f'"other", {etag}',
+    lambda etag: "*",
+])
+def test_listing_if_none_match_uses_weak_comparison(client, if_none_match):
+    etag = client.get("/listing").headers["etag"]
+    assert client.get("/listing", headers={"If-None-Match": if_none_match(etag)}).status_code == 304
+
+
+def test_listing_with_a_stale_tag_is_sent_in_full(client):
+    response = client.get("/listing", headers={"If-None-Match": 'W/"stale"'})
+    assert response.status_code == 200
+    assert response.content == BODY
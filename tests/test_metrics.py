@@ -0,0 +1,115 @@
+import metrics
+from metrics import MetricsRegistry, MultiprocessCollector
+
+
+def test_render_counter_and_gauge():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests served", ["method"])
+    requests.inc(method="GET")
+    requests.inc(2, method="POST")
+    in_flight = registry.gauge("in_flight", "Requests in flight")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render() == (
+        "# HELP requests_total Requests served\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{method="GET"} 1\n'
+        'requests_total{method="POST"} 2\n'
+        "# HELP in_flight Requests in flight\n"
+        "# TYPE in_flight gauge\n"
+        "in_flight 1\n"
+    )
+
+
+def test_render_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, route="/a")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+    assert lines[2:] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 3.65',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_render_escapes_label_values_and_help():
+    registry = MetricsRegistry()
+    errors = registry.counter("errors_total", 'Errors by "path"\nsecond line', ["path"])
+    errors.inc(path='C:\\tmp\n"x"')
+
+    lines = registry.render().splitlines()
+    assert lines[0] == '# HELP errors_total Errors by "path"\\nsecond line'
+    assert lines[2] == 'errors_total{path="C:\\\\tmp\\n\\"x\\""} 1'
+
+
+def test_gauge_set_and_float_values():
+    registry = MetricsRegistry()
+    ratio = registry.gauge("hit_ratio", "Hit ratio")
+    ratio.set(0.25)
+    assert registry.render().splitlines()[-1] == "hit_ratio 0.25"
+    assert ratio.value() == 0.25
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("jobs_total", "Jobs")
+    assert registry.counter("jobs_total", "Jobs") is first
+    first.inc()
+    assert registry.snapshot() == {"jobs_total": [{"name": "jobs_total", "labels": {}, "value": 1}]}
+
+
+def worker_registry(requests: int, in_flight: int, latencies=()):
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests served", ["method"]).inc(requests, method="GET")
+    registry.gauge("in_flight", "Requests in flight").set(in_flight)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in latencies:
+        latency.observe(value)
+    return registry
+
+
+def test_multiprocess_collector_sums_counters_and_labels_gauges_by_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_process_alive", lambda pid: True)
+    MultiprocessCollector(worker_registry(3, 2, [0.05, 2.0]), tmp_path, pid=101).write()
+    collector = MultiprocessCollector(worker_registry(4, 5, [0.5]), tmp_path, pid=102)
+
+    assert collector.render().splitlines() == [
+        "# HELP requests_total Requests served",
+        "# TYPE requests_total counter",
+        'requests_total{method="GET"} 7',
+        "# HELP in_flight Requests in flight",
+        "# TYPE in_flight gauge",
+        'in_flight{worker="101"} 2',
+        'in_flight{worker="102"} 5',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 2.55",
+        "latency_seconds_count 3",
+    ]
+
+
+def test_multiprocess_collector_keeps_counts_of_exited_workers_but_not_their_gauges(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_process_alive", lambda pid: pid != 101)
+    MultiprocessCollector(worker_registry(3, 2), tmp_path, pid=101).write()
+    registry = worker_registry(4, 5)
+    collector = MultiprocessCollector(registry, tmp_path, pid=102)
+
+    merged = collector.merge()
+    assert merged.counter("requests_total", "").value(method="GET") == 7
+    assert merged.gauge("in_flight", "").samples() == [("in_flight", {"worker": "102"}, 5)]
+
+    # Scraping writes this process's latest values first
+    registry.counter("requests_total", "").inc(method="GET")
+    assert collector.merge().counter("requests_total", "").value(method="GET") == 8
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["101.json", "102.json"]
@@ -0,0 +1,168 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.testclient import TestClient
+
+from middleware import (
+    CompressionMiddleware,
+    ConcurrencyLimitMiddleware,
+    MetricsMiddleware,
+    RequestSizeLimitMiddleware,
+    accepted_encodings,
+    http_requests
+)
+
+LIMIT = 1000
+BOUNDARY = "limit-test"
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @app.post("/raw")
+    async def raw(request: Request):
+        return {"size": len(await request.body())}
+
+    app.add_middleware(RequestSizeLimitMiddleware, limits=[
+        ("POST", r"^/upload$", LIMIT),
+        ("POST", r"^/raw$", LIMIT),
+    ])
+    return app
+
+
+def multipart(size: int) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + b"x" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def chunked(body: bytes, chunk_size: int = 256):
+    # A generator makes the client send Transfer-Encoding: chunked with no Content-Length
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+def test_small_multipart_upload_passes():
+    client = TestClient(make_app())
+    response = client.post(
+        "/upload",
+        content=chunked(multipart(100)),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_oversized_content_length_is_rejected_up_front():
+    client = TestClient(make_app())
+    response = client.post("/raw", content=b"x" * (LIMIT + 1))
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_multipart_upload_is_rejected_with_413():
+    client = TestClient(make_app())
+    response = client.post(
+        "/upload",
+        content=chunked(multipart(LIMIT * 4)),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    )
+    assert response.status_code == 413
+    assert "maximum size" in response.json()["detail"]
+
+
+def test_oversized_chunked_body_is_rejected_with_413():
+    client = TestClient(make_app())
+    response = client.post("/raw", content=chunked(b"x" * (LIMIT * 4)))
+    assert response.status_code == 413
+
+
+def test_accepted_encodings_parses_q_values():
+    assert accepted_encodings("gzip, br") == {"gzip", "br"}
+    assert accepted_encodings("GZIP;q=0.5, br;q=1.0") == {"gzip", "br"}
+    assert accepted_encodings("") == set()
+
+
+def test_accepted_encodings_drops_q_zero_in_any_spelling():
+    for header in ("gzip;q=0", "gzip;q=0.0", "gzip; q=0", "gzip;q=0.000", "gzip ; Q = 0"):
+        assert accepted_encodings(f"br, {header}") == {"br"}, header
+
+
+def test_accepted_encodings_drops_unparsable_q():
+    assert accepted_encodings("gzip;q=high, br") == {"br"}
+
+
+def make_compressed_app():
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items(count: int):
+        return [{"id": index, "name": f"item {index}"} for index in range(count)]
+
+    app.add_middleware(CompressionMiddleware, minimum_size=LIMIT)
+    return app
+
+
+def test_small_response_is_sent_uncompressed():
+    response = TestClient(make_compressed_app()).get("/items?count=1", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.json() == [{"id": 0, "name": "item 0"}]
+
+
+def test_large_response_is_compressed():
+    response = TestClient(make_compressed_app()).get("/items?count=100", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 100
+
+
+def run_saturated(max_queue: int, max_wait: float):
+    """Hold the only slot of a route class with one request and send another."""
+    async def main():
+        app = FastAPI()
+        entered = asyncio.Event()
+        release = asyncio.Event()
+
+        @app.get("/slow")
+        async def slow():
+            entered.set()
+            await release.wait()
+            return {}
+
+        app.add_middleware(ConcurrencyLimitMiddleware, route_classes=[
+            ("slow", {"GET"}, r"^/slow$", 1, max_queue, max_wait)
+        ])
+        app.add_middleware(MetricsMiddleware)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            holder = asyncio.create_task(client.get("/slow"))
+            await entered.wait()
+            rejected = await client.get("/slow")
+            release.set()
+            return rejected, await holder
+
+    return asyncio.run(main())
+
+
+def test_saturated_route_class_rejects_with_503_and_retry_after():
+    before = http_requests.value(method="GET", route="rejected:slow", status="503")
+    rejected, held = run_saturated(max_queue=0, max_wait=2.5)
+    assert held.status_code == 200
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "3"
+    # Rejections are counted under their route class rather than as unmatched
+    assert http_requests.value(method="GET", route="rejected:slow", status="503") == before + 1
+
+
+def test_queued_request_is_rejected_after_max_wait():
+    rejected, held = run_saturated(max_queue=1, max_wait=0.1)
+    assert held.status_code == 200
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
@@ -0,0 +1,71 @@
+from monitoring import command_collection, plan_summary, query_shape
+
+
+def test_command_collection():
+    assert command_collection("find", {"find": "students", "filter": {}}) == "students"
+    assert command_collection("getMore", {"getMore": 123, "collection": "students"}) == "students"
+    assert command_collection("ping", {"ping": 1}) == ""
+
+
+def test_query_shape_keeps_field_names_not_values():
+    find = {"find": "students", "filter": {"id_number": "123", "certificate_eligible": True}, "sort": {"full_name": 1}}
+    other = {
+        "find": "students",
+        "filter": {"certificate_eligible": False, "id_number": "456"},
+        "sort": {"full_name": -1}
+    }
+    assert query_shape("find", find) == "filter=certificate_eligible,id_number sort=full_name"
+    assert query_shape("find", find) == query_shape("find", other)
+
+
+def test_query_shape_for_counts_updates_and_pipelines():
+    assert query_shape("count", {"count": "jobs", "query": {"status": "queued"}}) == "filter=status sort="
+    assert query_shape("update", {"update": "jobs", "updates": [{"q": {"id": "x"}, "u": {}}]}) == "filter=id"
+    assert query_shape("delete", {"delete": "jobs", "deletes": [{"q": {"kind": "x"}, "limit": 0}]}) == "filter=kind"
+    aggregate = {
+        "aggregate": "blobs",
+        "pipeline": [{"$match": {"refcount": {"$gt": 0}}}, {"$group": {"_id": None}}]
+    }
+    assert query_shape("aggregate", aggregate) == "pipeline=$match|$group match=refcount"
+
+
+def test_plan_summary_lists_stages_outermost_first():
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "id_number_1"}
+    }}}
+    assert plan_summary(explain) == ("FETCH <- IXSCAN id_number_1", False)
+
+
+def test_plan_summary_flags_collection_scans():
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "SORT",
+        "inputStage": {"stage": "COLLSCAN"}
+    }}}
+    assert plan_summary(explain) == ("SORT <- COLLSCAN", True)
+
+
+def test_plan_summary_follows_or_branches():
+    explain = {"queryPlanner": {"winningPlan": {
+        "stage": "SUBPLAN",
+        "inputStage": {"stage": "OR", "inputStages": [
+            {"stage": "IXSCAN", "indexName": "a_1"},
+            {"stage": "COLLSCAN"}
+        ]}
+    }}}
+    assert plan_summary(explain) == ("SUBPLAN <- OR <- IXSCAN a_1 <- COLLSCAN", True)
+
+
+def test_plan_summary_reads_aggregate_and_slot_based_plans():
+    aggregate = {"stages": [
+        {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "IXSCAN", "indexName": "status_1"}}}},
+        {"$group": {}}
+    ]}
+    assert plan_summary(aggregate) == ("IXSCAN status_1", False)
+
+    slot_based = {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "COLLSCAN"}, "slotBasedPlan": {}}}}
+    assert plan_summary(slot_based) == ("COLLSCAN", True)
+
+
+def test_plan_summary_of_unrecognised_explain():
+    assert plan_summary({}) == ("unknown", False)
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from server import (
+    CERTIFICATE_PASS_MARK,
+    STUDENT_DERIVED_FIELDS_STAGES,
+    AcademicRecord,
+    calculate_average_score,
+    student_update_pipeline,
+)
+
+
+def test_update_pipeline_sets_fields_literally_then_derives():
+    pipeline = student_update_pipeline({"full_name": "$notAFieldPath", "academic_record": {"ms_word": 80}})
+
+    # Values are wrapped in $literal, so strings starting with "$" are not read as field paths
+    assert pipeline[0] == {"$set": {
+        "full_name": {"$literal": "$notAFieldPath"},
+        "academic_record": {"$literal": {"ms_word": 80}}
+    }}
+    assert pipeline[1:] == STUDENT_DERIVED_FIELDS_STAGES
+
+
+def test_update_pipeline_does_not_share_stage_list():
+    pipeline = student_update_pipeline({"phone": "0700"})
+    pipeline.append({"$unset": "phone"})
+    assert len(student_update_pipeline({"phone": "0700"})) == 1 + len(STUDENT_DERIVED_FIELDS_STAGES)
+
+
+def test_eligibility_uses_pass_mark_and_clearance():
+    eligibility = STUDENT_DERIVED_FIELDS_STAGES[-1]["$set"]["certificate_eligible"]["$and"]
+    assert {"$gte": ["$average_score", CERTIFICATE_PASS_MARK]} in eligibility
+    assert {"$eq": ["$finance_record.is_cleared", True]} in eligibility
+
+
+SCENARIOS = [
+    # academic_record, finance_record, certificate, expected average, expected eligible
+    ({"ms_word": 70, "ms_excel": 50, "ms_powerpoint": 60, "ms_access": 80, "computer_intro": 90},
+     {"is_cleared": True}, None, 70.0, True),
+    ({"ms_word": 70, "ms_excel": None}, {"is_cleared": True}, {"filename": "c.pdf"}, 70.0, True),
+    ({"ms_word": 50, "ms_excel": 55}, {"is_cleared": True}, None, 52.5, False),
+    ({"ms_word": 90}, {"is_cleared": False}, None, 90.0, False),
+    (None, {"is_cleared": True}, None, None, False),
+    ({}, None, None, None, False),
+]
+
+
+@pytest.mark.parametrize("academic, average", [(scenario[0], scenario[3]) for scenario in SCENARIOS])
+def test_python_average_agrees_with_pipeline_expectations(academic, average):
+    record = AcademicRecord(**academic) if academic is not None else None
+    assert calculate_average_score(record) == (pytest.approx(average) if average is not None else None)
+
+
+def test_update_pipeline_derives_fields_in_mongod(mongo_url, mongo_db_name):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(mongo_url)
+        students = client[mongo_db_name].students
+        try:
+            results = []
+            for index, (academic, finance, certificate, _, _) in enumerate(SCENARIOS):
+                await students.insert_one({"id": str(index)})
+                await students.update_one({"id": str(index)}, student_update_pipeline({
+                    "academic_record": academic,
+                    "finance_record": finance,
+                    "certificate": certificate
+                }))
+                results.append(await students.find_one({"id": str(index)}))
+            return results
+        finally:
+            client.close()
+
+    for document, (_, _, certificate, average, eligible) in zip(asyncio.run(main()), SCENARIOS):
+        assert document["average_score"] == (pytest.approx(average) if average is not None else None)
+        assert document["certificate_eligible"] is eligible
+        assert document["has_certificate"] is (certificate is not None)
@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from blobstore import BlobStore
+
+DATA = b"0123456789"
+CHUNKS = [b"0123", b"4567", b"89"]
+UPLOADS = "/api/admin/downloads/uploads"
+
+
+@pytest.fixture
+def api(mongo_url, mongo_db_name, tmp_path, monkeypatch):
+    """Run a scenario against the app with a test database, chunks of 4 bytes and an admin logged in."""
+    monkeypatch.setattr(server, "UPLOAD_SESSION_DIR", tmp_path / "sessions")
+    monkeypatch.setattr(server, "UPLOAD_CHUNK_SIZE", len(CHUNKS[0]))
+    admin = server.User(username="admin", role="admin", hashed_password="")
+    monkeypatch.setitem(server.app.dependency_overrides, server.get_admin_user, lambda: admin)
+
+    def run(scenario):
+        async def main():
+            mongo = AsyncIOMotorClient(mongo_url)
+            db = mongo[mongo_db_name]
+            monkeypatch.setattr(server, "db", db)
+            monkeypatch.setattr(server, "blob_store", BlobStore(tmp_path / "blobs", db.blobs, compress=False))
+            transport = httpx.ASGITransport(app=server.app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    return await scenario(client, db)
+            finally:
+                mongo.close()
+
+        return asyncio.run(main())
+
+    return run
+
+
+async def create_session(client, **fields) -> dict:
+    response = await client.post(
+        UPLOADS, json={"title": "Installer", "filename": "setup.exe", "size": len(DATA), **fields}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def put_chunk(client, session_id: str, index: int, data: bytes) -> httpx.Response:
+    return await client.put(f"{UPLOADS}/{session_id}/chunks/{index}", content=data)
+
+
+def test_chunks_arrive_out_of_order_and_repeats_are_acknowledged(api, tmp_path):
+    async def scenario(client, db):
+        session = await create_session(client, sha256=hashlib.sha256(DATA).hexdigest())
+        progress = []
+        for index, data in ((2, CHUNKS[2]), (0, CHUNKS[0]), (0, b"XXXX"), (1, CHUNKS[1])):
+            response = await put_chunk(client, session["id"], index, data)
+            assert response.status_code == 200
+            body = response.json()
+            progress.append((body["received_chunks"], body["next_chunk"], body["committed_offset"]))
+        resumed = (await client.get(f"{UPLOADS}/{session['id']}")).json()
+
+        completed = await client.post(f"{UPLOADS}/{session['id']}/complete")
+        assert completed.status_code == 200
+        download = await db.downloads.find_one({"id": completed.json()["id"]})
+        stored = b"".join([chunk async for chunk in server.blob_store.read(download["sha256"])])
+        return session, progress, resumed, download, stored, await db.upload_sessions.find_one({"id": session["id"]})
+
+    session, progress, resumed, download, stored, leftover = api(scenario)
+    assert (session["total_chunks"], session["next_chunk"], session["committed_offset"]) == (3, 0, 0)
+    assert progress == [
+        ([2], 0, 0),
+        ([0, 2], 1, 4),
+        ([0, 2], 1, 4),  # the repeated chunk is acknowledged but does not replace the first copy
+        ([0, 1, 2], 3, 10),
+    ]
+    assert (resumed["next_chunk"], resumed["committed_offset"]) == (3, 10)
+    assert (download["filename"], download["size"], download["sha256"]) == (
+        "setup.exe", len(DATA), hashlib.sha256(DATA).hexdigest()
+    )
+    assert stored == DATA
+    assert leftover is None
+    assert not (tmp_path / "sessions" / session["id"]).exists()
+
+
+def test_chunks_of_the_wrong_size_or_index_are_refused(api):
+    async def scenario(client, db):
+        session = await create_session(client)
+        return session, [
+            (await put_chunk(client, session["id"], index, data)).status_code
+            for index, data in ((0, b"012"), (0, b"01234"), (2, b"8"), (3, b"x"), (-1, b"0123"))
+        ], (await client.get(f"{UPLOADS}/{session['id']}")).json()
+
+    session, statuses, after = api(scenario)
+    assert statuses == [400, 413, 400, 400, 400]
+    assert after["received_chunks"] == []
+
+
+def test_complete_with_missing_chunks_is_refused(api):
+    async def scenario(client, db):
+        session = await create_session(client)
+        await put_chunk(client, session["id"], 0, CHUNKS[0])
+        await put_chunk(client, session["id"], 2, CHUNKS[2])
+        response = await client.post(f"{UPLOADS}/{session['id']}/complete")
+        return response, await db.upload_sessions.find_one({"id": session["id"]})
+
+    response, session = api(scenario)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Missing chunks: [1]"
+    assert session["status"] == "open"
+
+
+def test_complete_refuses_a_file_that_does_not_match_its_sha256(api):
+    async def scenario(client, db):
+        session = await create_session(client, sha256=hashlib.sha256(b"something else").hexdigest())
+        for index, data in enumerate(CHUNKS):
+            await put_chunk(client, session["id"], index, data)
+        response = await client.post(f"{UPLOADS}/{session['id']}/complete")
+        return (
+            response,
+            (await client.get(f"{UPLOADS}/{session['id']}")).status_code,
+            await db.downloads.count_documents({}),
+            await db.blobs.count_documents({})
+        )
+
+    response, session_status, downloads, blobs = api(scenario)
+    assert response.status_code == 422
+    assert "SHA-256" in response.json()["detail"]
+    # The session is discarded and the assembled blob released
+    assert session_status == 404
+    assert (downloads, blobs) == (0, 0)
+
+
+def test_complete_refuses_chunks_that_no_longer_add_up_to_the_size(api, tmp_path):
+    async def scenario(client, db):
+        session = await create_session(client)
+        for index, data in enumerate(CHUNKS):
+            await put_chunk(client, session["id"], index, data)
+        # A chunk file truncated on disk after it was accepted
+        (tmp_path / "sessions" / session["id"] / "000001").write_bytes(b"45")
+        response = await client.post(f"{UPLOADS}/{session['id']}/complete")
+        return response, await db.downloads.count_documents({}), await db.blobs.count_documents({})
+
+    response, downloads, blobs = api(scenario)
+    assert response.status_code == 422
+    assert "size" in response.json()["detail"]
+    assert (downloads, blobs) == (0, 0)
+
+
+def test_invalid_declared_sha256_is_rejected(api):
+    async def scenario(client, db):
+        return await client.post(UPLOADS, json={"title": "t", "filename": "f", "size": 1, "sha256": "not-a-digest"})
+
+    assert api(scenario).status_code == 422
+
+
+def test_abandoned_sessions_are_purged(api, tmp_path):
+    async def scenario(client, db):
+        abandoned = await create_session(client)
+        active = await create_session(client)
+        await put_chunk(client, abandoned["id"], 0, CHUNKS[0])
+        await db.upload_sessions.update_one(
+            {"id": abandoned["id"]},
+            {"$set": {"updated_at": datetime.utcnow() - timedelta(hours=server.UPLOAD_SESSION_TTL_HOURS + 1)}}
+        )
+        purged = await server.purge_abandoned_upload_sessions()
+        return abandoned, active, purged, [
+            (await client.get(f"{UPLOADS}/{session['id']}")).status_code for session in (abandoned, active)
+        ]
+
+    abandoned, active, purged, statuses = api(scenario)
+    assert purged == 1
+    assert statuses == [404, 200]
+    assert not (tmp_path / "sessions" / abandoned["id"]).exists()
+    assert (tmp_path / "sessions" / active["id"]).is_dir()